@@ -0,0 +1,181 @@
+import os
+import re
+import logging
+import time
+import hashlib
+import tempfile
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import pandas as pd
+import numpy as np
+
+from boulangerie_donnees import JOURS_SEMAINE, METEOS, fichier_historique, sauvegarder_historique
+from boulangerie_ia import COEF_JOUR, COEF_METEO
+from boulangerie_etat import definir_backend_etat, sauvegarder_document, creer_session, definir_pointeur_historique
+
+# Test de charge d'un worker : N sessions authentifiées (rôles et plans variés) parcourent les menus
+# dans des threads, comme les sessions d'un même processus Streamlit. Les utilisateurs d'une même
+# boulangerie partagent son historique (pointeur d'historique), généré sur `jours` jours.
+SCRIPT_APPLICATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boulangerie_predict.py")
+MENUS_CHARGE = ["📊 Dashboard", "📥 Nouvelle prédiction", "📈 Statistiques", "📄 Rapports"]
+ROLES_CHARGE = ["Admin", "Manager", "Employe"]
+PLANS_CHARGE = ["Gratuit", "Starter", "Pro", "Enterprise"]
+PRODUITS_CHARGE = ["Baguette", "Croissant", "Pain au chocolat", "Pain complet", "Brioche",
+                   "Éclair", "Tarte aux pommes", "Macaron", "Pain de campagne", "Pain classique"]
+MOT_DE_PASSE_CHARGE = "charge-test"
+
+# AppTest installe un Runtime global le temps de chaque exécution : les reruns des sessions passent
+# un par un, comme les reruns CPU d'un worker sous le GIL. La latence mesurée = attente + exécution.
+_verrou_execution = threading.Lock()
+
+def historique_boulangerie(jours=365, produits=8, graine=0):
+    rng = np.random.default_rng(graine)
+    dates = pd.date_range(date.today() - timedelta(days=jours), periods=jours, freq="D")
+    noms = PRODUITS_CHARGE[:produits]
+    base = rng.integers(40, 200, len(noms))
+
+    df = pd.DataFrame({
+        "date": np.repeat(dates, len(noms)),
+        "produit": np.tile(noms, len(dates)),
+        "meteo": np.repeat(rng.choice(METEOS, len(dates), p=[0.35, 0.35, 0.25, 0.05]), len(noms))
+    })
+    df["jour"] = np.array(JOURS_SEMAINE)[df["date"].dt.dayofweek]
+    attendu = np.tile(base, len(dates)) * df["jour"].map(COEF_JOUR) * df["meteo"].map(COEF_METEO)
+    df["ventes_moyennes"] = rng.poisson(attendu)
+    df["production_habituelle"] = (np.tile(base, len(dates)) * 1.15).astype(int)
+    df["production_conseillee"] = attendu.round().astype(int)
+    df["gaspillage_evite"] = (df["production_habituelle"] - df["production_conseillee"]).clip(lower=0)
+    df["cout_gaspillage"] = df["gaspillage_evite"] * 0.4
+    return df
+
+def preparer_charge(utilisateurs=10, boulangeries=None, jours=365, produits=8, graine=0):
+    # Comptes, abonnements, historiques et sessions dans le dossier courant (backend fichiers)
+    boulangeries = boulangeries or max(1, utilisateurs // 5)
+    users, abonnements, comptes = {}, {}, []
+
+    for b in range(boulangeries):
+        sauvegarder_historique(historique_boulangerie(jours, produits, graine + b),
+                               fichier_historique(f"boulangerie{b}@charge.test"))
+
+    for u in range(utilisateurs):
+        email = f"utilisateur{u}@charge.test"
+        role, plan = ROLES_CHARGE[u % len(ROLES_CHARGE)], PLANS_CHARGE[u % len(PLANS_CHARGE)]
+        users[email] = {
+            "password": hashlib.sha256(MOT_DE_PASSE_CHARGE.encode()).hexdigest(),
+            "date_inscription": str(date.today()), "entreprise": f"Boulangerie {u % boulangeries}",
+            "role": role, "2fa_enabled": False
+        }
+        abonnements[email] = {"plan": plan, "date_debut": str(date.today()),
+                              "date_fin_essai": str(date.today() + timedelta(days=7)), "actif": True}
+        definir_pointeur_historique(email, fichier_historique(f"boulangerie{u % boulangeries}@charge.test"))
+        comptes.append({"email": email, "role": role, "plan": plan, "jeton": creer_session(email, role)})
+
+    sauvegarder_document("users.json", users)
+    sauvegarder_document("abonnements.json", abonnements)
+    return comptes
+
+def _parcours(compte, iterations, ecritures, timeout, pause, graine):
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(graine)
+    mesures = []
+
+    def mesurer(menu, action):
+        # Temps de réflexion (exponentiel) avant chaque clic
+        time.sleep(rng.exponential(pause) if pause else 0)
+        demande = time.perf_counter()
+        with _verrou_execution:
+            debut = time.perf_counter()
+            try:
+                at = action()
+                erreur = str(at.exception[0].message) if at.exception else None
+            except Exception as e:
+                erreur = f"{type(e).__name__}: {e}"
+            fin = time.perf_counter()
+        mesures.append({"email": compte["email"], "role": compte["role"], "plan": compte["plan"], "menu": menu,
+                        "secondes": fin - demande, "attente": debut - demande, "erreur": erreur})
+
+    at = AppTest.from_file(SCRIPT_APPLICATION, default_timeout=timeout)
+    # Le jeton arrive d'ordinaire par cookie, qu'AppTest ne transmet pas : même chemin de restauration
+    at.session_state["jeton_session"] = compte["jeton"]
+    mesurer("connexion", at.run)
+    if at.exception or not at.sidebar.radio:
+        return mesures
+
+    menus = [m for m in MENUS_CHARGE if m in at.sidebar.radio[0].options]
+    for _ in range(iterations):
+        for menu in menus:
+            mesurer(menu, lambda: at.sidebar.radio[0].set_value(menu).run())
+            if menu == "📥 Nouvelle prédiction" and ecritures and not at.exception:
+                ventes = [n for n in at.number_input if n.label.startswith("Ventes")]
+                if ventes:
+                    mesurer("saisie", ventes[0].set_value(80).run)
+                boutons = [b for b in at.button if "Enregistrer cette prédiction" in b.label]
+                if boutons:
+                    mesurer("enregistrement", boutons[0].click().run)
+    return mesures
+
+def _memoire_residente():
+    with open("/proc/self/status") as f:
+        return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1)) / 1024
+
+def test_charge(utilisateurs=10, iterations=3, boulangeries=None, jours=365, produits=8,
+                ecritures=True, pause=1.0, dossier=None, timeout=120, graine=0):
+    dossier = dossier or tempfile.mkdtemp(prefix="boulangerie_charge_")
+    repertoire = os.getcwd()
+    os.chdir(dossier)
+    definir_backend_etat("fichiers")
+    # Avertissements de dépréciation répétés à chaque rerun de chaque session
+    logging.getLogger("streamlit.deprecation_util").addFilter(lambda enregistrement: False)
+    try:
+        comptes = preparer_charge(utilisateurs, boulangeries, jours, produits, graine)
+
+        memoire_depart = _memoire_residente()
+        pic = {"mo": memoire_depart}
+        fin = threading.Event()
+
+        def echantillonner():
+            while not fin.wait(0.05):
+                pic["mo"] = max(pic["mo"], _memoire_residente())
+
+        echantillonneur = threading.Thread(target=echantillonner, daemon=True)
+        echantillonneur.start()
+        cpu_debut, debut = resource.getrusage(resource.RUSAGE_SELF), time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=utilisateurs) as executeur:
+            parcours = list(executeur.map(
+                lambda i: _parcours(comptes[i], iterations, ecritures, timeout, pause, graine + i), range(len(comptes))
+            ))
+
+        duree = time.perf_counter() - debut
+        cpu_fin = resource.getrusage(resource.RUSAGE_SELF)
+        fin.set()
+        echantillonneur.join()
+    finally:
+        os.chdir(repertoire)
+
+    mesures = pd.DataFrame([m for p in parcours for m in p])
+    resume = mesures.groupby("menu", sort=False).agg(
+        reruns=("secondes", "size"),
+        erreurs=("erreur", lambda e: int(e.notna().sum())),
+        p50_ms=("secondes", lambda s: 1000 * s.quantile(0.5)),
+        p90_ms=("secondes", lambda s: 1000 * s.quantile(0.9)),
+        p99_ms=("secondes", lambda s: 1000 * s.quantile(0.99)),
+        max_ms=("secondes", lambda s: 1000 * s.max()),
+        attente_moy_ms=("attente", lambda s: 1000 * s.mean())
+    ).reset_index()
+
+    cpu = (cpu_fin.ru_utime - cpu_debut.ru_utime) + (cpu_fin.ru_stime - cpu_debut.ru_stime)
+    systeme = {
+        "utilisateurs": utilisateurs,
+        "duree_s": round(duree, 2),
+        "reruns_par_s": round(len(mesures) / duree, 2),
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / duree, 1),
+        "memoire_depart_mo": round(memoire_depart, 1),
+        "memoire_pic_mo": round(max(pic["mo"], cpu_fin.ru_maxrss / 1024), 1),
+        "dossier": dossier
+    }
+    return resume, systeme, mesures
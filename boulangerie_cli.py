@@ -0,0 +1,519 @@
+import argparse
+import json
+import os
+import sys
+
+import boulangerie_donnees
+import boulangerie_ia
+import boulangerie_meteo
+import boulangerie_features
+import boulangerie_etat
+import boulangerie_taches
+import boulangerie_index
+import boulangerie_export
+
+
+def cmd_modeles_lister(args):
+    entrees = boulangerie_ia.lister_modeles(args.tenant)
+    if not entrees:
+        print("Aucun modèle enregistré.")
+        return 0
+
+    for entree in entrees:
+        print(f"{entree['tenant']}\t{entree['produit']}\t{entree['type']}\t{entree['version']}\t"
+              f"{entree['taille'] / 1024:.0f} Ko\t{entree['modifie']}")
+    return 0
+
+
+def cmd_modeles_purger(args):
+    supprimes = boulangerie_ia.purger_modeles(garder=args.garder, cle=args.tenant)
+    for entree in supprimes:
+        print(f"Supprimé : {entree['tenant']}\t{entree['produit']}\t{entree['type']}\t{entree['version']}")
+    print(f"{len(supprimes)} version(s) supprimée(s).")
+    return 0
+
+
+def cmd_benchmark_prevision(args):
+    df = boulangerie_donnees.charger_historique(args.historique)
+    resultats = boulangerie_ia.comparer_moteurs_prevision(df, jours=args.jours)
+    print(resultats.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    return 0
+
+
+def cmd_backtest(args):
+    df = boulangerie_donnees.charger_historique(args.historique)
+    resume, _ = boulangerie_ia.backtester(df, cle=args.tenant or args.historique, plis=args.plis,
+                                          horizon=args.horizon, processus=args.processus)
+    if resume.empty:
+        print("Historique trop court pour un backtest.")
+        return 1
+    print(resume.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    return 0
+
+
+def cmd_memoire_historique(args):
+    mesure = boulangerie_donnees.mesurer_memoire_historique(n=args.lignes, fichier=args.historique)
+    print(f"Lignes mesurées : {mesure['lignes']}")
+    print(f"read_csv par défaut : {mesure['avant_mo_par_million']:.1f} Mo / million de lignes")
+    print(f"Schéma typé         : {mesure['apres_mo_par_million']:.1f} Mo / million de lignes")
+    return 0
+
+
+def cmd_importer(args):
+    fichier_histo = args.historique or boulangerie_etat.pointeur_historique(args.tenant)
+    colonnes = dict(c.split("=", 1) for c in args.colonne)
+
+    try:
+        importer = boulangerie_donnees.importer_ventes_horaires if args.horaire else boulangerie_donnees.importer_ventes
+        rapport = importer(
+            args.export, fichier_histo, colonnes=colonnes, taille_lot=args.taille_lot,
+            progression=lambda lignes: print(f"\r{lignes} lignes lues", end="", flush=True)
+        )
+    except ValueError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+
+    print()
+    print(f"Historique        : {fichier_histo}")
+    print(f"Lignes lues       : {rapport['lignes_lues']}")
+    print(f"Lignes rejetées   : {rapport['lignes_rejetees']}")
+    if args.horaire:
+        print(f"Profils horaires  : {rapport['profils_horaires']}")
+        print(f"Jours mis à jour  : {rapport['jours_mis_a_jour']}")
+    else:
+        print(f"Doublons ignorés  : {rapport['doublons_ignores']}")
+    print(f"Lignes ajoutées   : {rapport['lignes_ajoutees']}")
+    print(f"Débit             : {rapport['lignes_par_s']:.0f} lignes/s ({rapport['duree_s']:.1f} s)")
+    return 0
+
+
+def cmd_fournees(args):
+    fichier_histo = args.historique or boulangerie_etat.pointeur_historique(args.tenant)
+    horaires = boulangerie_donnees.charger_ventes_horaires(fichier_histo)
+    prevision = boulangerie_ia.prevision_horaire(horaires, args.date)
+    if prevision.empty:
+        print("Aucune vente horaire récente pour ce jour de la semaine.")
+        return 1
+    fournees = boulangerie_ia.recommander_fournees(prevision, args.heures)
+    print(fournees.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    return 0
+
+
+def cmd_hierarchie(args):
+    fichiers = boulangerie_donnees.lister_historiques() if args.tous else args.historique
+    magasins = {t: boulangerie_etat.pointeur_historique(t) for t in args.tenant}
+    magasins.update({os.path.splitext(os.path.basename(f))[0]: f for f in fichiers})
+    if not magasins:
+        print("Erreur : --tenant, --historique ou --tous", file=sys.stderr)
+        return 1
+    historiques = {m: boulangerie_donnees.charger_historique(f) for m, f in magasins.items()}
+
+    previsions = boulangerie_ia.previsions_hierarchiques(historiques, jours=args.jours, methode=args.methode,
+                                                         moteur=args.moteur, cles={t: t for t in args.tenant})
+    if previsions.empty:
+        print("Historique trop court pour prévoir (10 jours par produit).")
+        return 1
+
+    # Incohérence des prévisions de base : somme des produits contre prévision du total
+    produits = previsions[previsions["niveau"] == "produit"].groupby("ds")["base"].sum()
+    total = previsions[previsions["niveau"] == "organisation"].set_index("ds")["base"]
+    print(f"Écart des prévisions de base (somme des produits - total) : {(produits - total).abs().sum():.0f} unités")
+    print()
+
+    previsions = previsions[previsions["niveau"].isin(args.niveau or boulangerie_ia.NIVEAUX_HIERARCHIE)]
+    tableau = previsions.fillna({"magasin": "", "famille": "", "produit": ""}).pivot_table(
+        index=["niveau", "magasin", "famille", "produit"], columns="ds", values="prevision", sort=False
+    )
+    tableau.columns = [f"{d:%a %d/%m}" for d in tableau.columns]
+    print(tableau.round(0).to_string())
+    return 0
+
+
+def cmd_dedoublonner(args):
+    if args.tous:
+        fichiers = boulangerie_donnees.lister_historiques()
+    else:
+        fichiers = [args.historique or boulangerie_etat.pointeur_historique(args.tenant)]
+
+    for fichier in fichiers:
+        supprimes = boulangerie_donnees.dedoublonner_historique(fichier)
+        print(f"{fichier}\t{supprimes} doublon(s) supprimé(s)")
+    return 0
+
+
+def cmd_compacter(args):
+    if args.tous:
+        fichiers = boulangerie_donnees.lister_historiques()
+    else:
+        fichiers = [args.historique or boulangerie_etat.pointeur_historique(args.tenant)]
+
+    for fichier in fichiers:
+        rapport = boulangerie_donnees.compacter_historique(fichier, retention_jours=args.retention)
+        print(f"{fichier}\tavant {rapport['limite']}\t{rapport['lignes_archivees']} ligne(s) archivée(s)\t"
+              f"{rapport['lignes_detail']} en détail\t{rapport['semaines_archive']} semaine(s)-produit archivée(s)\t"
+              f"base {rapport['base_ko_avant']} → {rapport['base_ko_apres']} Ko\tarchive {rapport['archive_ko']} Ko")
+    return 0
+
+
+def cmd_periode(args):
+    fichier_histo = args.historique or boulangerie_etat.pointeur_historique(args.tenant)
+    index = boulangerie_index.index_historique(fichier_histo)
+    actuel, precedent, avant = boulangerie_index.comparer_periodes(index, args.du, args.au, args.produit or None,
+                                                                   args.comparer)
+    print(f"{'':22}{args.du} → {args.au:<14}{avant[0]:%Y-%m-%d} → {avant[1]:%Y-%m-%d}")
+    for cle in boulangerie_index.SERIES_INDEX + ["moyenne_gaspillage", "max_gaspillage"]:
+        print(f"{cle:22}{actuel[cle]:>24.2f}{precedent[cle]:>24.2f}")
+    return 0
+
+
+def cmd_export(args):
+    # --etat : versions déjà exportées par historique et par jeu, relues puis mises à jour (synchronisation nocturne)
+    versions = {}
+    if args.etat and os.path.exists(args.etat):
+        with open(args.etat, "r", encoding="utf-8") as f:
+            versions = json.load(f)
+
+    if args.tous:
+        fichiers = boulangerie_donnees.lister_historiques()
+    else:
+        fichiers = [args.historique or boulangerie_etat.pointeur_historique(args.tenant)]
+    if len(fichiers) > 1 and not os.path.isdir(args.sortie):
+        print("Erreur : --tous écrit un fichier par historique, --sortie doit être un dossier", file=sys.stderr)
+        return 1
+
+    extension = boulangerie_export.FORMATS_EXPORT[args.format][1]
+    for fichier in fichiers:
+        cle_etat = f"{fichier}:{args.jeu}"
+        depuis_version = args.depuis_version if args.depuis_version is not None else versions.get(cle_etat)
+        if args.sortie == "-":
+            sortie = sys.stdout.buffer
+        elif os.path.isdir(args.sortie):
+            nom = os.path.splitext(os.path.basename(fichier))[0]
+            sortie = os.path.join(args.sortie, f"{nom}.{args.jeu}.{depuis_version or 0}.{extension}")
+        else:
+            sortie = args.sortie
+        infos = boulangerie_export.exporter(fichier, args.jeu, args.format, sortie, depuis_version=depuis_version,
+                                            depuis_date=args.depuis_date, cle=args.tenant)
+        if infos["version"].isdigit():
+            versions[cle_etat] = int(infos["version"])
+        print(f"{fichier}\t{infos['jeu']}\t{infos['lignes']} ligne(s)\tversion {infos['version']}\t"
+              f"{'complet' if infos['complet'] else f'depuis la version {depuis_version}'}", file=sys.stderr)
+
+    if args.etat:
+        with open(args.etat, "w", encoding="utf-8") as f:
+            json.dump(versions, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+def cmd_cle_api(args):
+    # Nouvelle clé (la précédente est révoquée) : affichée une seule fois, seule son empreinte est gardée
+    print(boulangerie_etat.generer_cle_api(args.tenant))
+    return 0
+
+
+def cmd_export_serveur(args):
+    serveur = boulangerie_export.serveur_export(args.hote, args.port)
+    print(f"Export BI : http://{args.hote}:{args.port}/export (clé API du compte en Bearer)", file=sys.stderr)
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+    return 0
+
+
+def cmd_anomalies(args):
+    fichier_histo = args.historique or boulangerie_etat.pointeur_historique(args.tenant)
+    if args.reconstruire:
+        print(f"{boulangerie_donnees.reconstruire_anomalies(fichier_histo)} anomalie(s) après relecture de l'historique.")
+
+    anomalies = boulangerie_donnees.lister_anomalies(fichier_histo, non_vues=args.non_vues)
+    if anomalies.empty:
+        print("Aucune anomalie.")
+        return 0
+    print(anomalies.drop(columns="detectee_le").to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    return 0
+
+
+def cmd_features(args):
+    fichier_histo = args.historique or boulangerie_etat.pointeur_historique(args.tenant)
+    recalculees = boulangerie_features.mettre_a_jour_features(fichier_histo, ville=args.ville,
+                                                              reconstruire=args.reconstruire)
+    features = boulangerie_features.features_historique(fichier_histo)
+    print(f"{recalculees} ligne(s) recalculée(s), {len(features)} ligne(s) dans le magasin de features.")
+    if not features.empty:
+        print(features.tail(args.lignes).to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    return 0
+
+
+def cmd_test_charge(args):
+    import boulangerie_charge
+
+    resume, systeme, mesures = boulangerie_charge.test_charge(
+        utilisateurs=args.utilisateurs, iterations=args.iterations, boulangeries=args.boulangeries,
+        jours=args.jours, produits=args.produits, ecritures=not args.sans_ecritures, pause=args.pause
+    )
+    print(resume.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    print()
+    for cle, valeur in systeme.items():
+        print(f"{cle}\t{valeur}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"menus": resume.to_dict(orient="records"), "systeme": systeme}, f, indent=2, ensure_ascii=False)
+    return 1 if resume["erreurs"].sum() else 0
+
+
+def cmd_etat_migrer(args):
+    source = boulangerie_etat.BACKENDS_ETAT[args.depuis]()
+    destination = boulangerie_etat.BACKENDS_ETAT[args.vers]()
+    copies = boulangerie_etat.migrer_etat(source, destination)
+    for nom, entrees in copies.items():
+        print(f"{nom}\t{entrees} entrée(s)")
+    if not copies:
+        print("Aucun document à copier.")
+    return 0
+
+
+def cmd_etat_pointeur(args):
+    if args.historique:
+        boulangerie_etat.definir_pointeur_historique(args.tenant, args.historique)
+    print(f"{args.tenant}\t{boulangerie_etat.pointeur_historique(args.tenant)}")
+    return 0
+
+
+def cmd_taches_lister(args):
+    taches = boulangerie_taches.lister_taches(args.tenant)
+    if taches.empty:
+        print("Aucune tâche.")
+        return 0
+    print(taches.drop(columns=["id"]).to_string(index=False))
+    return 0
+
+
+def cmd_taches_purger(args):
+    supprimees = boulangerie_taches.purger_taches(jours=args.jours)
+    print(f"{supprimees} tâche(s) supprimée(s).")
+    return 0
+
+
+def cmd_meteo_rafraichir(args):
+    rapport = boulangerie_meteo.rafraichir_meteo(args.users, fournisseur=args.fournisseur)
+    for ville, resultat in rapport.items():
+        print(f"{ville}\t{resultat}")
+    return 1 if any(isinstance(r, str) for r in rapport.values()) else 0
+
+
+def cmd_meteo_afficher(args):
+    meteo = boulangerie_meteo.meteo_locale(args.ville)
+    if meteo.empty:
+        print("Aucune donnée météo locale pour cette ville.")
+        return 0
+    print(meteo.tail(args.jours).to_string(index=False))
+    return 0
+
+
+def construire_parser():
+    parser = argparse.ArgumentParser(prog="boulangerie_cli", description="Outils de maintenance Boulangerie Pro")
+    sous_parsers = parser.add_subparsers(dest="commande", required=True)
+
+    modeles = sous_parsers.add_parser("modeles", help="Registre des modèles entraînés")
+    modeles_cmd = modeles.add_subparsers(dest="action", required=True)
+
+    lister = modeles_cmd.add_parser("lister", help="Lister les modèles enregistrés")
+    lister.add_argument("--tenant", help="Email du compte")
+    lister.set_defaults(func=cmd_modeles_lister)
+
+    purger = modeles_cmd.add_parser("purger", help="Supprimer les anciennes versions")
+    purger.add_argument("--tenant", help="Email du compte")
+    purger.add_argument("--garder", type=int, default=boulangerie_ia.VERSIONS_CONSERVEES,
+                        help="Nombre de versions conservées par produit et type de modèle")
+    purger.set_defaults(func=cmd_modeles_purger)
+
+    benchmark = sous_parsers.add_parser("benchmark-prevision",
+                                        help="Comparer latence et précision des moteurs de prévision")
+    benchmark.add_argument("historique", help="Fichier historique (.db ou .csv)")
+    benchmark.add_argument("--jours", type=int, default=7, help="Horizon de validation (jours)")
+    benchmark.set_defaults(func=cmd_benchmark_prevision)
+
+    backtest = sous_parsers.add_parser("backtest", help="Backtest à origine glissante des méthodes de prédiction")
+    backtest.add_argument("historique", help="Fichier historique (.db ou .csv)")
+    backtest.add_argument("--tenant", help="Email du compte (clé du cache des plis)")
+    backtest.add_argument("--plis", type=int, default=8, help="Nombre de plis")
+    backtest.add_argument("--horizon", type=int, default=7, help="Jours testés par pli")
+    backtest.add_argument("--processus", type=int, default=None, help="Nombre de processus (1 = séquentiel)")
+    backtest.set_defaults(func=cmd_backtest)
+
+    memoire = sous_parsers.add_parser("memoire-historique",
+                                      help="Mesurer la mémoire de l'historique avant/après le schéma typé")
+    memoire.add_argument("historique", nargs="?", help="Fichier historique CSV (sinon données synthétiques)")
+    memoire.add_argument("--lignes", type=int, default=1_000_000, help="Lignes synthétiques générées")
+    memoire.set_defaults(func=cmd_memoire_historique)
+
+    importer = sous_parsers.add_parser("importer", help="Importer un export de caisse (CSV/Excel) dans l'historique")
+    importer.add_argument("export", help="Fichier CSV ou XLSX exporté de la caisse")
+    cible = importer.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique cible (.db ou .csv)")
+    importer.add_argument("--colonne", action="append", default=[], metavar="SOURCE=CIBLE",
+                          help="Correspondance explicite, ex. \"Date ticket=date\"")
+    importer.add_argument("--horaire", action="store_true",
+                          help="Tickets horodatés : garder les ventes par heure (fournées)")
+    importer.add_argument("--taille-lot", type=int, default=boulangerie_donnees.TAILLE_LOT_IMPORT,
+                          help="Lignes lues par lot")
+    importer.set_defaults(func=cmd_importer)
+
+    fournees = sous_parsers.add_parser("fournees", help="Quantités à cuire par fournée (ventes horaires)")
+    cible = fournees.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique .db")
+    fournees.add_argument("--date", required=True, help="Jour de production (AAAA-MM-JJ)")
+    fournees.add_argument("--heures", type=int, nargs="+", default=boulangerie_ia.FOURNEES_DEFAUT,
+                          help="Heures des fournées")
+    fournees.set_defaults(func=cmd_fournees)
+
+    hierarchie = sous_parsers.add_parser("hierarchie",
+                                         help="Prévisions cohérentes produit / famille / magasin / organisation")
+    hierarchie.add_argument("--tenant", action="append", default=[], help="Email d'un compte (répétable : magasins)")
+    hierarchie.add_argument("--historique", action="append", default=[], help="Fichier historique (répétable)")
+    hierarchie.add_argument("--tous", action="store_true", help="Tous les historiques du dossier courant")
+    hierarchie.add_argument("--jours", type=int, default=7)
+    hierarchie.add_argument("--methode", choices=boulangerie_ia.METHODES_RECONCILIATION, default="mint")
+    hierarchie.add_argument("--moteur", choices=["numpy", "prophet", "random_forest"], default="numpy",
+                            help="Prévisions de base des produits (les agrégats sont prévus par lissage)")
+    hierarchie.add_argument("--niveau", action="append", choices=boulangerie_ia.NIVEAUX_HIERARCHIE,
+                            help="Niveaux affichés (répétable, défaut : tous)")
+    hierarchie.set_defaults(func=cmd_hierarchie)
+
+    dedoublonner = sous_parsers.add_parser("dedoublonner",
+                                           help="Ne garder que la dernière ligne par (date, produit)")
+    cible = dedoublonner.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique (.db ou .csv)")
+    cible.add_argument("--tous", action="store_true", help="Tous les historiques du dossier courant")
+    dedoublonner.set_defaults(func=cmd_dedoublonner)
+
+    compacter = sous_parsers.add_parser("compacter",
+                                        help="Archiver les semaines anciennes en agrégats hebdomadaires compressés")
+    cible = compacter.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique .db")
+    cible.add_argument("--tous", action="store_true", help="Tous les historiques du dossier courant")
+    compacter.add_argument("--retention", type=int, default=boulangerie_donnees.RETENTION_DETAIL_JOURS,
+                           help="Jours gardés au détail")
+    compacter.set_defaults(func=cmd_compacter)
+
+    periode = sous_parsers.add_parser("periode",
+                                      help="Totaux d'une plage de dates comparés à une autre (index cumulé)")
+    cible = periode.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique .db")
+    periode.add_argument("--du", required=True, help="Premier jour (AAAA-MM-JJ)")
+    periode.add_argument("--au", required=True, help="Dernier jour inclus (AAAA-MM-JJ)")
+    periode.add_argument("--produit", action="append", default=[], help="Produit (répétable, défaut : tous)")
+    periode.add_argument("--comparer", choices=list(boulangerie_index.DECALAGES_COMPARAISON),
+                         default="Période précédente")
+    periode.set_defaults(func=cmd_periode)
+
+    export = sous_parsers.add_parser("export", help="Export en masse (Parquet, Arrow, CSV) pour les outils BI")
+    cible = export.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique (.db ou .csv)")
+    cible.add_argument("--tous", action="store_true", help="Tous les historiques du dossier courant")
+    export.add_argument("--jeu", choices=boulangerie_export.JEUX_EXPORT, default="historique")
+    export.add_argument("--format", choices=list(boulangerie_export.FORMATS_EXPORT), default="parquet")
+    export.add_argument("--depuis-version", type=int, help="Seulement ce qui a changé depuis cette version")
+    export.add_argument("--depuis-date", help="Seulement à partir de ce jour (AAAA-MM-JJ)")
+    export.add_argument("--etat", help="Fichier JSON des versions déjà exportées, un par jeu (exports incrémentaux successifs)")
+    export.add_argument("--sortie", default="-", help="Fichier, dossier (un fichier par historique) ou - (sortie standard)")
+    export.set_defaults(func=cmd_export)
+
+    export_serveur = sous_parsers.add_parser("export-serveur", help="Servir GET /export aux outils BI (clé API)")
+    export_serveur.add_argument("--hote", default=boulangerie_export.HOTE_EXPORT)
+    export_serveur.add_argument("--port", type=int, default=boulangerie_export.PORT_EXPORT)
+    export_serveur.set_defaults(func=cmd_export_serveur)
+
+    cle = sous_parsers.add_parser("cle-api", help="Générer la clé API d'un compte (révoque la précédente)")
+    cle.add_argument("--tenant", required=True, help="Email du compte")
+    cle.set_defaults(func=cmd_cle_api)
+
+    anomalies = sous_parsers.add_parser("anomalies", help="Anomalies détectées à l'écriture de l'historique")
+    cible = anomalies.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique .db")
+    anomalies.add_argument("--non-vues", action="store_true", help="Seulement les anomalies non lues")
+    anomalies.add_argument("--reconstruire", action="store_true",
+                           help="Recalculer statistiques et anomalies sur tout l'historique")
+    anomalies.set_defaults(func=cmd_anomalies)
+
+    features = sous_parsers.add_parser("features", help="Magasin de features d'entraînement (mis à jour à l'écriture)")
+    cible = features.add_mutually_exclusive_group(required=True)
+    cible.add_argument("--tenant", help="Email du compte")
+    cible.add_argument("--historique", help="Fichier historique .db")
+    features.add_argument("--ville", help="Ville de la météo jointe (change la ville : reconstruction)")
+    features.add_argument("--reconstruire", action="store_true", help="Recalculer toutes les lignes")
+    features.add_argument("--lignes", type=int, default=10, help="Dernières lignes affichées")
+    features.set_defaults(func=cmd_features)
+
+    charge = sous_parsers.add_parser("test-charge",
+                                     help="Sessions simultanées simulées : latence par menu, CPU, mémoire")
+    charge.add_argument("--utilisateurs", type=int, default=10, help="Sessions authentifiées simultanées")
+    charge.add_argument("--iterations", type=int, default=3, help="Parcours des menus par session")
+    charge.add_argument("--boulangeries", type=int, default=None,
+                        help="Historiques partagés par les utilisateurs (défaut : 1 pour 5 utilisateurs)")
+    charge.add_argument("--jours", type=int, default=365, help="Jours d'historique synthétique")
+    charge.add_argument("--produits", type=int, default=8, help="Produits par boulangerie")
+    charge.add_argument("--sans-ecritures", action="store_true", help="Ne pas enregistrer de prédictions")
+    charge.add_argument("--pause", type=float, default=1.0, help="Temps de réflexion moyen entre deux clics (s)")
+    charge.add_argument("--json", help="Écrire le résumé dans ce fichier (suivi des régressions)")
+    charge.set_defaults(func=cmd_test_charge)
+
+    etat = sous_parsers.add_parser("etat", help="Backend d'état partagé (comptes, sessions, pointeurs d'historique)")
+    etat_cmd = etat.add_subparsers(dest="action", required=True)
+
+    migrer = etat_cmd.add_parser("migrer", help="Copier les documents de comptes vers un autre backend")
+    migrer.add_argument("--depuis", choices=list(boulangerie_etat.BACKENDS_ETAT), default="fichiers")
+    migrer.add_argument("--vers", choices=list(boulangerie_etat.BACKENDS_ETAT), required=True,
+                        help="Backend cible (redis : BOULANGERIE_ETAT_URL)")
+    migrer.set_defaults(func=cmd_etat_migrer)
+
+    pointeur = etat_cmd.add_parser("pointeur", help="Afficher ou déplacer l'historique d'un compte")
+    pointeur.add_argument("--tenant", required=True, help="Email du compte")
+    pointeur.add_argument("--historique", help="Nouvel emplacement (ex. volume partagé entre répliques)")
+    pointeur.set_defaults(func=cmd_etat_pointeur)
+
+    taches = sous_parsers.add_parser("taches", help="File des tâches de fond (prévisions, exports, e-mails)")
+    taches_cmd = taches.add_subparsers(dest="action", required=True)
+
+    lister_taches = taches_cmd.add_parser("lister", help="Tâches récentes et leur statut")
+    lister_taches.add_argument("--tenant", help="Limiter à un compte (email)")
+    lister_taches.set_defaults(func=cmd_taches_lister)
+
+    purger_taches = taches_cmd.add_parser("purger", help="Supprimer les tâches finies anciennes")
+    purger_taches.add_argument("--jours", type=int, default=boulangerie_taches.TACHES_CONSERVEES_JOURS)
+    purger_taches.set_defaults(func=cmd_taches_purger)
+
+    meteo = sous_parsers.add_parser("meteo", help="Table météo locale (ville, date)")
+    meteo_cmd = meteo.add_subparsers(dest="action", required=True)
+
+    rafraichir = meteo_cmd.add_parser("rafraichir", help="Tâche quotidienne : compléter historiques et prévisions")
+    rafraichir.add_argument("--users", default="users.json", help="Fichier des comptes")
+    rafraichir.add_argument("--fournisseur", choices=list(boulangerie_meteo.FOURNISSEURS_METEO),
+                            help="Fournisseur météo (défaut : BOULANGERIE_METEO_FOURNISSEUR ou open-meteo)")
+    rafraichir.set_defaults(func=cmd_meteo_rafraichir)
+
+    afficher = meteo_cmd.add_parser("afficher", help="Derniers jours stockés pour une ville")
+    afficher.add_argument("--ville", default=boulangerie_meteo.VILLE_DEFAUT)
+    afficher.add_argument("--jours", type=int, default=14)
+    afficher.set_defaults(func=cmd_meteo_afficher)
+
+    return parser
+
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1060 @@
+import os
+import glob
+import time
+from datetime import date, datetime
+import sqlite3
+import unicodedata
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from scipy.signal import lfilter
+
+JOURS_SEMAINE = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+METEOS = ["Soleil", "Nuageux", "Pluie", "Neige"]
+
+COLONNES_HISTORIQUE = [
+    "date", "jour", "meteo", "produit",
+    "production_habituelle", "ventes_moyennes",
+    "production_conseillee", "gaspillage_evite", "cout_gaspillage"
+]
+
+# Schéma mémoire unique de l'historique : catégories pour les libellés,
+# datetime64 pour les dates et types numériques étroits.
+SCHEMA_HISTORIQUE = {
+    "jour": pd.CategoricalDtype(JOURS_SEMAINE, ordered=True),
+    "meteo": pd.CategoricalDtype(METEOS),
+    "produit": "category",
+    "production_habituelle": "int32",
+    "ventes_moyennes": "int32",
+    "production_conseillee": "int32",
+    "gaspillage_evite": "int32",
+    "cout_gaspillage": "float64"
+}
+COLONNES_NUMERIQUES = [colonne for colonne, dtype in SCHEMA_HISTORIQUE.items() if dtype in ("int32", "float64")]
+
+# Import de caisse : en-têtes reconnus (normalisés sans accents ni majuscules)
+SYNONYMES_COLONNES = {
+    "date": ["date", "date_vente", "jour_vente", "datetime", "day", "date_ticket"],
+    "produit": ["produit", "article", "libelle", "designation", "product", "item", "nom_produit"],
+    "ventes_moyennes": ["ventes_moyennes", "ventes", "quantite", "qte", "qty", "quantity", "quantite_vendue"],
+    "production_habituelle": ["production_habituelle", "production", "fabrication", "quantite_produite"],
+    "meteo": ["meteo", "weather"],
+    "heure": ["heure", "hour", "heure_vente", "heure_ticket", "time"]
+}
+TAILLE_LOT_IMPORT = 100_000
+
+# Historique indexé : base SQLite par compte, clé primaire (date, produit) → upsert en O(log n).
+# Les anciens fichiers CSV du même nom sont migrés (dédoublonnés) à la première ouverture.
+SQL_TABLE_HISTORIQUE = """
+CREATE TABLE IF NOT EXISTS historique (
+    date TEXT NOT NULL,
+    jour TEXT,
+    meteo TEXT,
+    produit TEXT NOT NULL,
+    production_habituelle INTEGER,
+    ventes_moyennes INTEGER,
+    production_conseillee INTEGER,
+    gaspillage_evite INTEGER,
+    cout_gaspillage REAL,
+    PRIMARY KEY (date, produit)
+)
+"""
+_INSERTION = f"INTO historique ({', '.join(COLONNES_HISTORIQUE)}) VALUES ({', '.join('?' * len(COLONNES_HISTORIQUE))})"
+SQL_INSERTION_HISTORIQUE = f"INSERT OR IGNORE {_INSERTION}"
+SQL_UPSERT_HISTORIQUE = (
+    f"INSERT {_INSERTION} ON CONFLICT(date, produit) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in COLONNES_HISTORIQUE if c not in ("date", "produit"))
+)
+
+# Détection d'anomalies en flux : moyenne et second moment exponentiels (EWMA) par produit
+# et par série, mis à jour à chaque écriture ; une ligne est signalée si son écart à la
+# moyenne dépasse ANOMALIE_SEUIL écarts-types, après ANOMALIE_CHAUFFE observations.
+ANOMALIE_ALPHA = 0.1
+ANOMALIE_SEUIL = 3.0
+ANOMALIE_CHAUFFE = 7
+ANOMALIE_ECART_MIN = 1.0
+SERIES_ANOMALIES = {"ventes_moyennes": "deux_sens", "gaspillage_evite": "hausse"}
+
+SQL_TABLE_STATS_ANOMALIES = """
+CREATE TABLE IF NOT EXISTS stats_anomalies (
+    produit TEXT NOT NULL,
+    serie TEXT NOT NULL,
+    n INTEGER,
+    moyenne REAL,
+    moment2 REAL,
+    PRIMARY KEY (produit, serie)
+)
+"""
+SQL_TABLE_ANOMALIES = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    date TEXT NOT NULL,
+    produit TEXT NOT NULL,
+    serie TEXT NOT NULL,
+    valeur REAL,
+    attendu REAL,
+    score REAL,
+    detectee_le TEXT,
+    vue INTEGER DEFAULT 0,
+    PRIMARY KEY (date, produit, serie)
+)
+"""
+
+# Version de l'historique : compteur incrémenté par déclencheur à chaque ligne écrite. Les
+# tables annexes (anomalies, features) écrivent dans le même fichier sans changer la version.
+SQL_TABLES_VERSION = [
+    "CREATE TABLE IF NOT EXISTS historique_version (id INTEGER PRIMARY KEY CHECK (id = 0), valeur INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO historique_version SELECT 0, count(*) FROM historique",
+    *[f"CREATE TRIGGER IF NOT EXISTS historique_version_{nom} AFTER {evenement} ON historique BEGIN "
+      "UPDATE historique_version SET valeur = valeur + 1; END"
+      for nom, evenement in [("insertion", "INSERT"), ("modification", "UPDATE"), ("suppression", "DELETE")]]
+]
+
+# Version de chaque ligne écrite ou supprimée depuis la création de la table (exports incrémentaux :
+# « tout ce qui a changé depuis la version V »). La version notée est au moins celle qui suit
+# l'écriture, quel que soit l'ordre des déclencheurs : une ligne peut être renvoyée, jamais oubliée.
+# Avant la version d'origine (création du suivi, dernier remplacement complet), le suivi est incomplet.
+SQL_TABLES_MODIFICATIONS = [
+    "CREATE TABLE IF NOT EXISTS historique_modifications_origine (id INTEGER PRIMARY KEY CHECK (id = 0), "
+    "version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO historique_modifications_origine SELECT 0, valeur FROM historique_version",
+    "CREATE TABLE IF NOT EXISTS historique_modifications (date TEXT NOT NULL, produit TEXT NOT NULL, "
+    "version INTEGER NOT NULL, PRIMARY KEY (date, produit)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS historique_modifications_version ON historique_modifications (version)",
+    # Dans un déclencheur, INSERT OR REPLACE prend la politique de conflit de l'instruction appelante
+    # (l'upsert de l'historique) : la mise à jour est explicite. Anciens déclencheurs remplacés.
+    *[f"DROP TRIGGER IF EXISTS historique_modifications_{nom}" for nom in ("insertion", "modification", "suppression")],
+    *[f"CREATE TRIGGER IF NOT EXISTS historique_suivi_{nom} AFTER {evenement} ON historique BEGIN "
+      f"INSERT INTO historique_modifications VALUES ({ligne}.date, {ligne}.produit, "
+      f"(SELECT valeur + 1 FROM historique_version)) "
+      f"ON CONFLICT(date, produit) DO UPDATE SET version = excluded.version; END"
+      for nom, evenement, ligne in [("insertion", "INSERT", "NEW"), ("modification", "UPDATE", "NEW"),
+                                    ("suppression", "DELETE", "OLD")]]
+]
+
+# Instantanés Arrow IPC (non compressés) de l'historique, un fichier par version : tous les
+# processus Streamlit mappent le même fichier (pages partagées par le noyau) et la conversion
+# pandas n'en copie aucune colonne. Une nouvelle version est publiée à la première lecture
+# qui suit une écriture ; les plus anciennes sont effacées (un fichier déjà mappé reste lisible).
+INSTANTANES_CONSERVES = 2
+_instantanes = {}
+
+# Ventes horaires (optionnelles) : une ligne par (date, produit), les 24 heures empaquetées dans
+# un BLOB de 24 entiers 32 bits. 24 fois plus de mesures sans 24 fois plus de lignes ni d'index ;
+# les totaux journaliers alimentent l'historique, donc toutes les vues journalières.
+HEURES = 24
+SQL_TABLE_VENTES_HORAIRES = """
+CREATE TABLE IF NOT EXISTS ventes_horaires (
+    date TEXT NOT NULL,
+    produit TEXT NOT NULL,
+    heures BLOB NOT NULL,
+    PRIMARY KEY (date, produit)
+) WITHOUT ROWID
+"""
+
+# Archivage par paliers : au-delà de RETENTION_DETAIL_JOURS, les semaines complètes quittent la
+# base (palier chaud) pour un Parquet compressé d'agrégats par semaine et produit (palier froid).
+# À la lecture, chaque semaine archivée est redépliée sur ses jours d'origine (valeurs lissées
+# sur la semaine, totaux exacts) : rapports et modèles lisent les deux paliers sans le savoir.
+RETENTION_DETAIL_JOURS = int(os.environ.get("BOULANGERIE_RETENTION_JOURS", "400"))
+COLONNES_SOMMES = ["production_habituelle", "ventes_moyennes", "production_conseillee", "gaspillage_evite",
+                   "cout_gaspillage"]
+COLONNES_ARCHIVE = ["semaine", "produit", "jours", "meteo"] + COLONNES_SOMMES
+
+def fichier_historique(email):
+    user_safe = email.replace("@", "_").replace(".", "_")
+    return f"historique_{user_safe}.db"
+
+def _est_base(fichier):
+    return str(fichier).endswith(".db")
+
+def _existe(fichier):
+    return os.path.exists(fichier) or (_est_base(fichier) and os.path.exists(f"{fichier[:-len('.db')]}.csv"))
+
+def _connexion(fichier):
+    nouvelle = not os.path.exists(fichier)
+    con = sqlite3.connect(fichier, timeout=30)
+    for table in (SQL_TABLE_HISTORIQUE, SQL_TABLE_STATS_ANOMALIES, SQL_TABLE_ANOMALIES, *SQL_TABLES_VERSION,
+                  *SQL_TABLES_MODIFICATIONS, SQL_TABLE_VENTES_HORAIRES):
+        con.execute(table)
+    con.commit()
+    ancien_csv = f"{fichier[:-len('.db')]}.csv"
+    if nouvelle and os.path.exists(ancien_csv):
+        with con:
+            con.executemany(SQL_UPSERT_HISTORIQUE, _enregistrements(pd.read_csv(ancien_csv)))
+            _detecter_anomalies(con, _lire_base(con).sort_values("date", kind="stable"))
+    return con
+
+def _lire_base(con):
+    df = pd.read_sql_query(f"SELECT {', '.join(COLONNES_HISTORIQUE)} FROM historique ORDER BY rowid", con)
+    return appliquer_schema(df)
+
+def _detecter_anomalies(con, lignes, mise_a_jour=True):
+    # Un filtre récursif (lfilter) par produit et série et par lot : O(1) par ligne écrite.
+    # Sans mise à jour (corrections), les lignes sont notées contre les statistiques courantes.
+    if lignes.empty:
+        return 0
+
+    produits = lignes["produit"].astype(str)
+    marques = ", ".join("?" * produits.nunique())
+    stats = {
+        (produit, serie): (n, moyenne, moment2)
+        for produit, serie, n, moyenne, moment2 in con.execute(
+            f"SELECT produit, serie, n, moyenne, moment2 FROM stats_anomalies WHERE produit IN ({marques})",
+            list(produits.unique())
+        )
+    }
+    dates = lignes["date"].dt.strftime("%Y-%m-%d").to_numpy()
+    maintenant = datetime.now().isoformat(timespec="seconds")
+    a = ANOMALIE_ALPHA
+
+    anomalies = []
+    nouvelles_stats = []
+    for produit, positions in produits.groupby(produits, sort=False).indices.items():
+        for serie, sens in SERIES_ANOMALIES.items():
+            x = lignes[serie].to_numpy(dtype=float)[positions]
+            n0, m0, s0 = stats.get((produit, serie), (0, x[0], x[0] ** 2))
+
+            if mise_a_jour:
+                m = lfilter([a], [1, a - 1], x, zi=[(1 - a) * m0])[0]
+                s = lfilter([a], [1, a - 1], x ** 2, zi=[(1 - a) * s0])[0]
+                m_avant = np.concatenate([[m0], m[:-1]])
+                s_avant = np.concatenate([[s0], s[:-1]])
+                n_avant = n0 + np.arange(len(x))
+                nouvelles_stats.append((produit, serie, n0 + len(x), float(m[-1]), float(s[-1])))
+            else:
+                m_avant, s_avant, n_avant = np.full(len(x), m0), np.full(len(x), s0), np.full(len(x), n0)
+
+            ecart = np.maximum(np.sqrt(np.maximum(s_avant - m_avant ** 2, 0)), ANOMALIE_ECART_MIN)
+            score = (x - m_avant) / ecart
+            hors_norme = score > ANOMALIE_SEUIL if sens == "hausse" else np.abs(score) > ANOMALIE_SEUIL
+            for i in np.flatnonzero(hors_norme & (n_avant >= ANOMALIE_CHAUFFE)):
+                anomalies.append((dates[positions[i]], produit, serie, x[i], m_avant[i], score[i], maintenant))
+
+    if not mise_a_jour:
+        con.executemany("DELETE FROM anomalies WHERE date = ? AND produit = ?", zip(dates, produits))
+    con.executemany(
+        "INSERT INTO stats_anomalies (produit, serie, n, moyenne, moment2) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(produit, serie) DO UPDATE SET n = excluded.n, moyenne = excluded.moyenne, "
+        "moment2 = excluded.moment2",
+        nouvelles_stats
+    )
+    con.executemany(
+        "INSERT OR REPLACE INTO anomalies (date, produit, serie, valeur, attendu, score, detectee_le, vue) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+        anomalies
+    )
+    return len(anomalies)
+
+def _enregistrements(df):
+    df = appliquer_schema(df)
+    colonnes = [df["date"].dt.strftime("%Y-%m-%d")]
+    colonnes += [df[c].astype(object).where(df[c].notna(), None) for c in ("jour", "meteo", "produit")]
+    colonnes += [df[c].tolist() for c in COLONNES_HISTORIQUE[4:]]
+    return list(zip(*colonnes))
+
+def appliquer_schema(df):
+    # Valeur absente (colonne manquante, cellule vide) : 0 ; valeur présente mais non numérique : refusée
+    df = df.reindex(columns=COLONNES_HISTORIQUE)
+    df["date"] = pd.to_datetime(df["date"])
+    invalides = []
+    for colonne, dtype in SCHEMA_HISTORIQUE.items():
+        if colonne in COLONNES_NUMERIQUES:
+            valeurs = pd.to_numeric(df[colonne], errors="coerce")
+            brutes = df[colonne]
+            mal_formees = valeurs.isna() & brutes.notna() & (brutes.astype("string").str.strip() != "")
+            invalides += [f"{colonne} = {brutes[i]!r} (ligne {i})" for i in df.index[mal_formees][:5]]
+            df[colonne] = valeurs.fillna(0).astype(dtype)
+        else:
+            df[colonne] = df[colonne].astype(dtype)
+    if invalides:
+        raise ValueError(f"Valeurs non numériques : {', '.join(invalides)}")
+    return df
+
+def initialiser_historique(fichier):
+    if _est_base(fichier):
+        _connexion(fichier).close()
+    elif not os.path.exists(fichier):
+        sauvegarder_historique(pd.DataFrame(columns=COLONNES_HISTORIQUE), fichier)
+
+def charger_historique(fichier, archive=True):
+    if not _existe(fichier):
+        return appliquer_schema(pd.DataFrame(columns=COLONNES_HISTORIQUE))
+
+    if _est_base(fichier):
+        con = _connexion(fichier)
+        try:
+            df = _lire_base(con)
+        finally:
+            con.close()
+        return _superposer(_deplier_archive(lire_archive(fichier)), df) if archive else df
+
+    df = pd.read_csv(
+        fichier,
+        dtype={colonne: dtype for colonne, dtype in SCHEMA_HISTORIQUE.items() if colonne not in COLONNES_NUMERIQUES},
+        parse_dates=["date"]
+    )
+    return appliquer_schema(df)
+
+def version_historique(fichier):
+    if not _existe(fichier):
+        return "0"
+    if not _est_base(fichier):
+        return str(os.stat(fichier).st_mtime_ns)
+
+    # Lecture directe (appelée à chaque rerun) ; schéma créé seulement pour une base antérieure au compteur
+    con = sqlite3.connect(fichier, timeout=30)
+    try:
+        return str(con.execute("SELECT valeur FROM historique_version").fetchone()[0])
+    except sqlite3.OperationalError:
+        con.close()
+        con = _connexion(fichier)
+        return str(con.execute("SELECT valeur FROM historique_version").fetchone()[0])
+    finally:
+        con.close()
+
+def origine_modifications(fichier):
+    # Plus petite version à partir de laquelle un export incrémental est complet (None : pas de suivi)
+    if not _est_base(fichier) or not _existe(fichier):
+        return None
+    con = _connexion(fichier)
+    try:
+        return con.execute("SELECT version FROM historique_modifications_origine").fetchone()[0]
+    finally:
+        con.close()
+
+def modifications_historique(fichier, depuis_version):
+    # Couples (date, produit) écrits ou supprimés après `depuis_version`
+    if not _est_base(fichier) or not _existe(fichier):
+        return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "produit": pd.Series(dtype=str)})
+    con = _connexion(fichier)
+    try:
+        modifications = pd.read_sql_query("SELECT date, produit FROM historique_modifications WHERE version > ?",
+                                          con, params=[int(depuis_version)], parse_dates=["date"])
+    finally:
+        con.close()
+    return modifications
+
+def _lot_export(df):
+    # Types Arrow stables d'un lot à l'autre : libellés en texte, valeurs absentes (suppressions) en nulls
+    return df.astype({
+        "jour": object, "meteo": object, "produit": object,
+        **{c: "Int32" for c in COLONNES_HISTORIQUE[4:8]}, "cout_gaspillage": "Float64"
+    })
+
+def parcourir_historique(fichier, depuis_version=None, depuis_date=None, taille_lot=TAILLE_LOT_IMPORT):
+    # Lots (DataFrame) de l'historique plus une colonne `supprimee`, sans tout charger en mémoire.
+    # Complet : semaines archivées dépliées puis détail. Incrémental (`depuis_version`) : dernier état
+    # de chaque couple écrit ou supprimé depuis, une suppression n'ayant que sa date et son produit.
+    colonnes = COLONNES_HISTORIQUE + ["supprimee"]
+    if not _existe(fichier):
+        return
+    borne = pd.Timestamp(depuis_date).normalize() if depuis_date is not None else pd.Timestamp.min
+    depuis = f"{borne:%Y-%m-%d}" if depuis_date is not None else ""
+
+    if not _est_base(fichier):
+        df = charger_historique(fichier)
+        df = df[df["date"] >= borne].assign(supprimee=False)
+        for debut in range(0, len(df), taille_lot):
+            yield _lot_export(df.iloc[debut:debut + taille_lot])
+        return
+
+    con = _connexion(fichier)
+    try:
+        if depuis_version is None:
+            archive = _deplier_archive(lire_archive(fichier))
+            archive = archive[archive["date"] >= borne]
+            if not archive.empty:
+                detail = pd.read_sql_query("SELECT date, produit FROM historique WHERE date <= ?", con,
+                                           params=[f"{archive['date'].max():%Y-%m-%d}"], parse_dates=["date"])
+                cles = pd.MultiIndex.from_arrays([archive["date"], archive["produit"].astype(str)])
+                archive = archive[~cles.isin(pd.MultiIndex.from_arrays([detail["date"], detail["produit"]]))]
+                archive = archive.sort_values(["date", "produit"], kind="stable").assign(supprimee=False)
+                for debut in range(0, len(archive), taille_lot):
+                    yield _lot_export(archive.iloc[debut:debut + taille_lot])
+            curseur = con.execute(
+                f"SELECT {', '.join(COLONNES_HISTORIQUE)}, 0 FROM historique WHERE date >= ? ORDER BY date, produit",
+                (depuis,)
+            )
+        else:
+            curseur = con.execute(
+                "SELECT m.date, h.jour, h.meteo, m.produit, "
+                f"{', '.join(f'h.{c}' for c in COLONNES_HISTORIQUE[4:])}, h.date IS NULL "
+                "FROM historique_modifications m LEFT JOIN historique h ON h.date = m.date AND h.produit = m.produit "
+                "WHERE m.version > ? AND m.date >= ? ORDER BY m.version, m.date, m.produit",
+                (int(depuis_version), depuis)
+            )
+        while lignes := curseur.fetchmany(taille_lot):
+            lot = pd.DataFrame.from_records(lignes, columns=colonnes)
+            lot["date"] = pd.to_datetime(lot["date"])
+            lot["supprimee"] = lot["supprimee"].astype(bool)
+            yield _lot_export(lot)
+    finally:
+        con.close()
+
+def _chemin_instantane(fichier, version):
+    return f"{os.path.splitext(fichier)[0]}.v{version}.arrow"
+
+def publier_instantane(fichier):
+    # Écriture atomique (fichier temporaire puis os.replace) ; None si l'historique a changé pendant la lecture
+    version = version_historique(fichier)
+    chemin = _chemin_instantane(fichier, version)
+    if os.path.exists(chemin):
+        return chemin
+
+    df = charger_historique(fichier)
+    if version_historique(fichier) != version:
+        return None
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with pa.OSFile(temporaire, "wb") as sortie, ipc.new_file(sortie, table.schema) as ecrivain:
+        ecrivain.write_table(table)
+    os.replace(temporaire, chemin)
+
+    anciens = sorted(glob.glob(f"{os.path.splitext(fichier)[0]}.v*.arrow"), key=os.path.getmtime)
+    for ancien in anciens[:-INSTANTANES_CONSERVES]:
+        if ancien != chemin:
+            try:
+                os.remove(ancien)
+            except FileNotFoundError:
+                pass
+    return chemin
+
+def charger_historique_partage(fichier):
+    # Lecture seule : un DataFrame adossé à l'instantané mappé, commun à toutes les sessions du processus
+    version = version_historique(fichier)
+    courant = _instantanes.get(fichier)
+    if courant is not None and courant[0] == version:
+        return courant[1]
+    if version == "0":
+        return charger_historique(fichier)
+
+    try:
+        chemin = publier_instantane(fichier)
+        if chemin is None:
+            return charger_historique(fichier)
+        table = ipc.open_file(pa.memory_map(chemin)).read_all()
+    except FileNotFoundError:
+        # Instantané purgé entre la publication et l'ouverture par une écriture concurrente
+        return charger_historique(fichier)
+
+    df = table.to_pandas(split_blocks=True, self_destruct=False)
+    _instantanes[fichier] = (version, df)
+    return df
+
+def sauvegarder_historique(df, fichier):
+    df = appliquer_schema(df)
+
+    if _est_base(fichier):
+        con = _connexion(fichier)
+        try:
+            with con:
+                con.execute("DELETE FROM historique")
+                con.executemany(SQL_UPSERT_HISTORIQUE, _enregistrements(df))
+                # Remplacement complet : les exports incrémentaux antérieurs repartent d'un export complet
+                con.execute("DELETE FROM historique_modifications")
+                con.execute("UPDATE historique_modifications_origine SET version = (SELECT valeur FROM historique_version)")
+                # Statistiques et anomalies de l'ancien contenu : rejouées sur le nouveau
+                _reconstruire_anomalies(con)
+            # `df` remplace tout l'historique, semaines archivées comprises
+            if os.path.exists(fichier_archive(fichier)):
+                os.remove(fichier_archive(fichier))
+        finally:
+            con.close()
+        return df
+
+    tmp = f"{fichier}.{os.getpid()}.tmp"
+    df.to_csv(tmp, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp, fichier)
+    return df
+
+def upsert_historique(lignes, fichier):
+    # Retourne le nombre de couples (date, produit) déjà présents, donc corrigés
+    lignes = appliquer_schema(pd.DataFrame(lignes))
+
+    if not _est_base(fichier):
+        df = pd.concat([charger_historique(fichier), lignes], ignore_index=True)
+        avant = len(df)
+        df = df.drop_duplicates(subset=["date", "produit"], keep="last")
+        sauvegarder_historique(df, fichier)
+        return avant - len(df)
+
+    _refuser_archivees(lignes, fichier)
+    enregistrements = _enregistrements(lignes)
+    con = _connexion(fichier)
+    try:
+        with con:
+            existantes = np.array([
+                con.execute("SELECT 1 FROM historique WHERE date = ? AND produit = ?", (e[0], e[3])).fetchone() is not None
+                for e in enregistrements
+            ], dtype=bool)
+            con.executemany(SQL_UPSERT_HISTORIQUE, enregistrements)
+            _detecter_anomalies(con, lignes[~existantes])
+            _detecter_anomalies(con, lignes[existantes], mise_a_jour=False)
+    finally:
+        con.close()
+    return int(existantes.sum())
+
+def cles_historique(fichier):
+    if not _existe(fichier):
+        return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "produit": pd.Series(dtype=str)})
+
+    if _est_base(fichier):
+        con = _connexion(fichier)
+        try:
+            cles = pd.read_sql_query("SELECT date, produit FROM historique", con)
+        finally:
+            con.close()
+        archivees = _deplier_archive(lire_archive(fichier))[["date", "produit"]]
+        cles = pd.concat([archivees.astype({"produit": str}), cles.assign(date=pd.to_datetime(cles["date"]))],
+                         ignore_index=True)
+    else:
+        cles = pd.read_csv(fichier, usecols=["date", "produit"])
+    return cles.assign(date=pd.to_datetime(cles["date"]).dt.normalize())
+
+def dedoublonner_historique(fichier):
+    if _est_base(fichier):
+        # La clé primaire interdit les doublons ; l'ouverture migre l'éventuel CSV dédoublonné
+        _connexion(fichier).close()
+        return 0
+
+    df = charger_historique(fichier)
+    avant = len(df)
+    df = df.drop_duplicates(subset=["date", "produit"], keep="last")
+    if len(df) < avant:
+        sauvegarder_historique(df, fichier)
+    return avant - len(df)
+
+def lister_anomalies(fichier, depuis=None, produit=None, non_vues=False):
+    colonnes = ["date", "produit", "serie", "valeur", "attendu", "score", "detectee_le", "vue"]
+    if not _est_base(fichier) or not _existe(fichier):
+        return pd.DataFrame(columns=colonnes)
+
+    conditions, parametres = [], []
+    if depuis is not None:
+        conditions.append("date >= ?")
+        parametres.append(f"{pd.Timestamp(depuis):%Y-%m-%d}")
+    if produit is not None:
+        conditions.append("produit = ?")
+        parametres.append(produit)
+    if non_vues:
+        conditions.append("vue = 0")
+    filtre = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    con = _connexion(fichier)
+    try:
+        anomalies = pd.read_sql_query(
+            f"SELECT {', '.join(colonnes)} FROM anomalies {filtre} ORDER BY date DESC, produit", con, params=parametres
+        )
+    finally:
+        con.close()
+    return anomalies.assign(date=pd.to_datetime(anomalies["date"]))
+
+def marquer_anomalies_vues(fichier):
+    if not _est_base(fichier) or not _existe(fichier):
+        return 0
+    con = _connexion(fichier)
+    try:
+        with con:
+            return con.execute("UPDATE anomalies SET vue = 1 WHERE vue = 0").rowcount
+    finally:
+        con.close()
+
+def _reconstruire_anomalies(con):
+    con.execute("DELETE FROM stats_anomalies")
+    con.execute("DELETE FROM anomalies")
+    return _detecter_anomalies(con, _lire_base(con).sort_values("date", kind="stable"))
+
+def reconstruire_anomalies(fichier):
+    # Rejoue tout l'historique dans l'ordre chronologique (après changement de paramètres)
+    con = _connexion(fichier)
+    try:
+        with con:
+            return _reconstruire_anomalies(con)
+    finally:
+        con.close()
+
+def fichier_archive(fichier):
+    return f"{os.path.splitext(fichier)[0]}.archive.parquet"
+
+def lire_archive(fichier):
+    # Agrégats bruts : semaine (lundi), produit, jours (masque des jours présents, bit 0 = lundi), météo dominante, sommes
+    chemin = fichier_archive(fichier)
+    if not os.path.exists(chemin):
+        return pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c == "semaine" else "int64")
+                             for c in COLONNES_ARCHIVE})
+    return pq.read_table(chemin).to_pandas()
+
+def limite_archive(fichier):
+    # Premier jour après la dernière semaine archivée ; None sans archive. Les jours antérieurs ne sont
+    # plus que des totaux hebdomadaires : une écriture les rendrait faux, elle est refusée.
+    chemin = fichier_archive(fichier)
+    if not os.path.exists(chemin):
+        return None
+    semaines = pq.read_table(chemin, columns=["semaine"]).column("semaine").to_pandas()
+    return None if semaines.empty else semaines.max() + pd.Timedelta(days=7)
+
+def _refuser_archivees(lignes, fichier):
+    limite = limite_archive(fichier)
+    if limite is not None and (lignes["date"] < limite).any():
+        raise ValueError(f"Semaines archivées : aucune écriture avant le {limite:%d/%m/%Y}")
+
+def _agreger_semaines(df):
+    jour = df["date"].dt.dayofweek
+    lignes = pd.DataFrame({
+        "semaine": df["date"] - pd.to_timedelta(jour, unit="D"),
+        "produit": df["produit"].astype(str),
+        "jours": np.left_shift(1, jour.to_numpy()).astype("int64"),
+        "meteo": df["meteo"].astype(object),
+        **{c: df[c].astype("float64" if c == "cout_gaspillage" else "int64") for c in COLONNES_SOMMES}
+    })
+    cles = ["semaine", "produit"]
+    # Couples (date, produit) uniques : la somme des bits donne le masque des jours
+    semaines = lignes.groupby(cles)[["jours"] + COLONNES_SOMMES].sum()
+    meteo = (lignes.dropna(subset=["meteo"]).groupby(cles + ["meteo"]).size().rename("n").reset_index()
+             .sort_values("n", ascending=False, kind="stable").drop_duplicates(cles).set_index(cles)["meteo"])
+    return semaines.join(meteo).reset_index()[COLONNES_ARCHIVE]
+
+def _deplier_archive(archive):
+    # Une ligne par jour présent ; entiers répartis sans perte (les premiers jours reçoivent le reste)
+    if archive.empty:
+        return appliquer_schema(pd.DataFrame(columns=COLONNES_HISTORIQUE))
+
+    bits = np.unpackbits(archive["jours"].to_numpy(dtype=np.uint8)[:, None], axis=1, bitorder="little")[:, :7]
+    ligne, jour = np.nonzero(bits)
+    n = bits.sum(axis=1).astype("int64")
+    rang = np.arange(len(ligne)) - np.repeat(np.cumsum(n) - n, n)
+    n = n[ligne]
+
+    df = pd.DataFrame({
+        "date": archive["semaine"].to_numpy(dtype="datetime64[ns]")[ligne] + jour.astype("timedelta64[D]"),
+        "jour": np.array(JOURS_SEMAINE)[jour],
+        "meteo": archive["meteo"].to_numpy()[ligne],
+        "produit": archive["produit"].to_numpy()[ligne]
+    })
+    for colonne in COLONNES_SOMMES:
+        total = archive[colonne].to_numpy()[ligne]
+        df[colonne] = total / n if colonne == "cout_gaspillage" else total // n + (rang < total % n)
+    return appliquer_schema(df)
+
+def _superposer(archive, detail):
+    # Semaines archivées devant le détail. Les écritures avant limite_archive sont refusées : un jour présent
+    # dans les deux paliers ne vient que d'une base corrigée avant ce refus, le détail l'emporte.
+    if archive.empty:
+        return detail
+    cles = pd.MultiIndex.from_arrays([archive["date"], archive["produit"].astype(str)])
+    archive = archive[~cles.isin(pd.MultiIndex.from_arrays([detail["date"], detail["produit"].astype(str)]))]
+    return appliquer_schema(pd.concat([archive, detail], ignore_index=True))
+
+def compacter_historique(fichier, retention_jours=RETENTION_DETAIL_JOURS, reference=None):
+    # Archive les semaines complètes antérieures à la fenêtre de détail puis réduit la base (VACUUM)
+    rapport = {"fichier": fichier, "limite": None, "lignes_archivees": 0, "lignes_detail": 0, "profils_horaires_supprimes": 0,
+               "semaines_archive": len(lire_archive(fichier)), "base_ko_avant": 0, "base_ko_apres": 0, "archive_ko": 0}
+    if not _est_base(fichier) or not _existe(fichier):
+        return rapport
+
+    reference = pd.Timestamp(reference or date.today()).normalize()
+    limite = reference - pd.Timedelta(days=retention_jours)
+    limite -= pd.Timedelta(days=limite.dayofweek)
+    rapport["limite"] = f"{limite:%Y-%m-%d}"
+    rapport["base_ko_avant"] = os.path.getsize(fichier) // 1024
+
+    con = _connexion(fichier)
+    try:
+        # Écritures bloquées de la lecture à la suppression : aucune ligne ancienne ne se perd
+        con.execute("BEGIN IMMEDIATE")
+        anciennes = appliquer_schema(pd.read_sql_query(
+            f"SELECT {', '.join(COLONNES_HISTORIQUE)} FROM historique WHERE date < ?", con, params=[rapport["limite"]]
+        ))
+        if not anciennes.empty:
+            semaines = _agreger_semaines(_superposer(_deplier_archive(lire_archive(fichier)), anciennes))
+            chemin = fichier_archive(fichier)
+            temporaire = f"{chemin}.{os.getpid()}.tmp"
+            pq.write_table(pa.Table.from_pandas(semaines, preserve_index=False), temporaire, compression="zstd")
+            os.replace(temporaire, chemin)
+            con.execute("DELETE FROM historique WHERE date < ?", (rapport["limite"],))
+            rapport["lignes_archivees"] = len(anciennes)
+            rapport["semaines_archive"] = len(semaines)
+        # L'archivage n'est pas une suppression pour les exports incrémentaux
+        con.execute("DELETE FROM historique_modifications WHERE date < ?", (rapport["limite"],))
+        # Le détail horaire ne sert qu'aux profils récents : ses totaux restent dans l'archive
+        rapport["profils_horaires_supprimes"] = con.execute(
+            "DELETE FROM ventes_horaires WHERE date < ?", (rapport["limite"],)
+        ).rowcount
+        con.commit()
+        if not anciennes.empty:
+            con.execute("VACUUM")
+        rapport["lignes_detail"] = con.execute("SELECT count(*) FROM historique").fetchone()[0]
+    finally:
+        con.close()
+
+    rapport["base_ko_apres"] = os.path.getsize(fichier) // 1024
+    if os.path.exists(fichier_archive(fichier)):
+        rapport["archive_ko"] = os.path.getsize(fichier_archive(fichier)) // 1024
+    return rapport
+
+def lister_historiques(dossier="."):
+    return sorted(glob.glob(os.path.join(dossier, "historique_*.db")) + glob.glob(os.path.join(dossier, "historique_*.csv")))
+
+def historique_synthetique(n, produits=20, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, n), unit="D")
+    ventes = rng.integers(0, 300, n)
+    production = ventes + rng.integers(0, 50, n)
+    return pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"),
+        "jour": np.array(JOURS_SEMAINE)[dates.dayofweek],
+        "meteo": rng.choice(METEOS, n),
+        "produit": rng.choice([f"Produit {i}" for i in range(produits)], n),
+        "production_habituelle": production,
+        "ventes_moyennes": ventes,
+        "production_conseillee": ventes,
+        "gaspillage_evite": production - ventes,
+        "cout_gaspillage": (production - ventes) * 0.5
+    })
+
+def mesurer_memoire_historique(n=1_000_000, fichier=None):
+    # Mémoire par million de lignes : inférence read_csv par défaut vs schéma typé
+    if fichier is None:
+        fichier = f"historique_mesure_{os.getpid()}.csv"
+        historique_synthetique(n).to_csv(fichier, index=False)
+        temporaire = True
+    else:
+        temporaire = False
+
+    try:
+        brut = pd.read_csv(fichier)
+        df_type = charger_historique(fichier)
+        lignes = len(brut)
+        par_million = 1_000_000 / max(lignes, 1)
+        return {
+            "lignes": lignes,
+            "avant_mo_par_million": brut.memory_usage(deep=True).sum() / 1024 ** 2 * par_million,
+            "apres_mo_par_million": df_type.memory_usage(deep=True).sum() / 1024 ** 2 * par_million
+        }
+    finally:
+        if temporaire:
+            os.remove(fichier)
+
+def _normaliser_entete(nom):
+    nom = unicodedata.normalize("NFKD", str(nom)).encode("ascii", "ignore").decode()
+    return nom.strip().lower().replace(" ", "_").replace("-", "_")
+
+def _correspondance_colonnes(entetes, colonnes=None):
+    correspondance = {}
+    for source, cible in (colonnes or {}).items():
+        correspondance[source] = cible
+
+    normalises = {_normaliser_entete(e): e for e in entetes if e not in correspondance}
+    for cible, synonymes in SYNONYMES_COLONNES.items():
+        if cible in correspondance.values():
+            continue
+        for synonyme in synonymes:
+            if synonyme in normalises:
+                correspondance[normalises[synonyme]] = cible
+                break
+
+    manquantes = {"date", "produit", "ventes_moyennes"} - set(correspondance.values())
+    if manquantes:
+        raise ValueError(f"Colonnes introuvables dans l'export : {', '.join(sorted(manquantes))}")
+    return correspondance
+
+def _detecter_separateur(source):
+    if hasattr(source, "read"):
+        position = source.tell()
+        entete = source.readline()
+        source.seek(position)
+        if isinstance(entete, bytes):
+            entete = entete.decode("utf-8", "ignore")
+    else:
+        with open(source, "r", encoding="utf-8", errors="ignore") as f:
+            entete = f.readline()
+    return ";" if entete.count(";") > entete.count(",") else ","
+
+def _lire_par_lots(source, taille_lot, format_fichier):
+    if format_fichier == "xlsx":
+        from openpyxl import load_workbook
+        classeur = load_workbook(source, read_only=True, data_only=True)
+        try:
+            lignes = classeur.active.iter_rows(values_only=True)
+            entetes = [str(e) for e in next(lignes)]
+            lot = []
+            for ligne in lignes:
+                lot.append(ligne)
+                if len(lot) >= taille_lot:
+                    yield pd.DataFrame(lot, columns=entetes)
+                    lot = []
+            if lot:
+                yield pd.DataFrame(lot, columns=entetes)
+        finally:
+            classeur.close()
+    else:
+        yield from pd.read_csv(source, sep=_detecter_separateur(source), chunksize=taille_lot, dtype=str)
+
+def _parser_dates(valeurs):
+    # ISO d'abord, puis format français (jour en premier) pour le reste
+    dates = pd.to_datetime(valeurs, format="ISO8601", errors="coerce")
+    restantes = dates.isna() & valeurs.notna()
+    if restantes.any():
+        dates[restantes] = pd.to_datetime(valeurs[restantes], dayfirst=True, errors="coerce")
+    return dates.dt.normalize()
+
+def _lignes_importees(agregat):
+    # Lignes d'historique d'un import de caisse : la production inconnue vaut la production déclarée ou les ventes
+    meteo = agregat["meteo"] if "meteo" in agregat else pd.Series("Nuageux", index=agregat.index)
+    return pd.DataFrame({
+        "date": agregat["date"],
+        "jour": np.array(JOURS_SEMAINE)[agregat["date"].dt.dayofweek.to_numpy()],
+        "meteo": meteo.where(meteo.isin(METEOS), "Nuageux"),
+        "produit": agregat["produit"],
+        "production_habituelle": agregat["production_habituelle"].round(),
+        "ventes_moyennes": agregat["ventes_moyennes"].round(),
+        "production_conseillee": agregat["production_habituelle"].round(),
+        "gaspillage_evite": 0,
+        "cout_gaspillage": 0.0
+    }).sort_values(["date", "produit"])
+
+def _corriger_ventes(lignes, ventes, couts_unitaires):
+    # Nouveau total de ventes d'un jour déjà saisi : la production conseillée garde son coefficient
+    # (jour × météo) et le gaspillage son coût unitaire, celui de la ligne ou à défaut celui du produit
+    anciennes = lignes["ventes_moyennes"].to_numpy(dtype=float)
+    coefficient = np.divide(lignes["production_conseillee"].to_numpy(dtype=float), anciennes,
+                            out=np.ones(len(lignes)), where=anciennes > 0)
+    cout_produit = lignes["produit"].astype(str).map(couts_unitaires).fillna(0).to_numpy(dtype=float, copy=True)
+    cout_unitaire = np.divide(lignes["cout_gaspillage"].to_numpy(dtype=float),
+                              lignes["gaspillage_evite"].to_numpy(dtype=float),
+                              out=cout_produit, where=lignes["gaspillage_evite"].to_numpy() > 0)
+    conseillee = (ventes * coefficient).astype(int)
+    gaspillage = np.maximum(lignes["production_habituelle"].to_numpy() - conseillee, 0)
+    return lignes.assign(ventes_moyennes=ventes, production_conseillee=conseillee, gaspillage_evite=gaspillage,
+                         cout_gaspillage=gaspillage * cout_unitaire)
+
+def importer_ventes(source, fichier_histo, colonnes=None, taille_lot=TAILLE_LOT_IMPORT,
+                    format_fichier=None, progression=None):
+    # Flux par lots : la mémoire dépend du nombre de couples (date, produit), pas du nombre de lignes
+    debut = time.perf_counter()
+    if format_fichier is None:
+        nom = getattr(source, "name", str(source)).lower()
+        format_fichier = "xlsx" if nom.endswith((".xlsx", ".xlsm")) else "csv"
+
+    rapport = {"lignes_lues": 0, "lignes_rejetees": 0, "lignes_ajoutees": 0, "doublons_ignores": 0}
+    limite = limite_archive(fichier_histo) if _est_base(fichier_histo) else None
+    agregat = None
+    correspondance = None
+    agregations = {"ventes_moyennes": "sum", "production_habituelle": "sum"}
+
+    for lot in _lire_par_lots(source, taille_lot, format_fichier):
+        if correspondance is None:
+            correspondance = _correspondance_colonnes(lot.columns, colonnes)
+            if "meteo" in correspondance.values():
+                agregations["meteo"] = "last"
+        lot = lot[list(correspondance)].rename(columns=correspondance)
+        rapport["lignes_lues"] += len(lot)
+
+        lot["date"] = _parser_dates(lot["date"].astype("string"))
+        lot["produit"] = lot["produit"].astype("string").str.strip()
+        for colonne in ("ventes_moyennes", "production_habituelle"):
+            if colonne in lot:
+                valeurs = lot[colonne].astype("string").str.replace(",", ".", regex=False)
+                lot[colonne] = pd.to_numeric(valeurs, errors="coerce")
+
+        valides = (lot["date"].notna() & lot["produit"].notna() & (lot["produit"] != "")
+                   & lot["ventes_moyennes"].notna() & (lot["ventes_moyennes"] >= 0))
+        if limite is not None:
+            valides &= lot["date"] >= limite
+        rapport["lignes_rejetees"] += int((~valides).sum())
+        lot = lot[valides]
+
+        if "production_habituelle" not in lot:
+            lot["production_habituelle"] = lot["ventes_moyennes"]
+        lot["production_habituelle"] = lot["production_habituelle"].fillna(lot["ventes_moyennes"])
+
+        somme = lot.groupby(["date", "produit"]).agg(agregations)
+        if agregat is not None:
+            somme = pd.concat([agregat, somme]).groupby(level=["date", "produit"]).agg(agregations)
+        agregat = somme
+
+        if progression is not None:
+            progression(rapport["lignes_lues"])
+
+    if agregat is not None and not agregat.empty:
+        nouvelles = agregat.reset_index()
+
+        if _existe(fichier_histo):
+            existantes = cles_historique(fichier_histo)
+            cles_existantes = pd.MultiIndex.from_arrays([existantes["date"], existantes["produit"].astype(str)])
+            deja = pd.MultiIndex.from_arrays([nouvelles["date"], nouvelles["produit"].astype(str)]).isin(cles_existantes)
+            rapport["doublons_ignores"] = int(deja.sum())
+            nouvelles = nouvelles[~deja]
+
+        nouvelles = _lignes_importees(nouvelles)
+
+        if not nouvelles.empty:
+            ajouter_historique(nouvelles, fichier_histo)
+        rapport["lignes_ajoutees"] = len(nouvelles)
+
+    rapport["duree_s"] = time.perf_counter() - debut
+    rapport["lignes_par_s"] = rapport["lignes_lues"] / max(rapport["duree_s"], 1e-9)
+    return rapport
+
+def ajouter_historique(df, fichier):
+    df = appliquer_schema(df)
+
+    if _est_base(fichier):
+        _refuser_archivees(df, fichier)
+        con = _connexion(fichier)
+        try:
+            with con:
+                # INSERT OR IGNORE : seules les lignes réellement insérées nourrissent les statistiques
+                presentes = pd.read_sql_query(
+                    "SELECT date, produit FROM historique WHERE date BETWEEN ? AND ?", con,
+                    params=[f"{df['date'].min():%Y-%m-%d}", f"{df['date'].max():%Y-%m-%d}"]
+                ) if not df.empty else pd.DataFrame(columns=["date", "produit"])
+                cles = pd.MultiIndex.from_arrays([df["date"].dt.strftime("%Y-%m-%d"), df["produit"].astype(str)])
+                deja = cles.isin(pd.MultiIndex.from_arrays([presentes["date"], presentes["produit"]]))
+                inserees = ~deja & ~cles.duplicated()
+                con.executemany(SQL_INSERTION_HISTORIQUE, _enregistrements(df))
+                _detecter_anomalies(con, df[inserees])
+        finally:
+            con.close()
+        return df
+
+    if not os.path.exists(fichier) or os.path.getsize(fichier) == 0:
+        return sauvegarder_historique(df, fichier)
+    df.to_csv(fichier, mode="a", header=False, index=False, date_format="%Y-%m-%d")
+    return df
+
+def _empaqueter_heures(matrice):
+    return [ligne.tobytes() for ligne in np.ascontiguousarray(matrice, dtype="<i4")]
+
+def charger_ventes_horaires(fichier, depuis=None, produits=None):
+    # date, produit, puis une colonne par heure (0 à 23)
+    colonnes = ["date", "produit"] + list(range(HEURES))
+    if not _est_base(fichier) or not _existe(fichier):
+        return pd.DataFrame(columns=colonnes)
+
+    conditions, parametres = [], []
+    if depuis is not None:
+        conditions.append("date >= ?")
+        parametres.append(f"{pd.Timestamp(depuis):%Y-%m-%d}")
+    if produits is not None:
+        conditions.append(f"produit IN ({', '.join('?' * len(produits))})")
+        parametres += [str(p) for p in produits]
+    filtre = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    con = _connexion(fichier)
+    try:
+        lignes = con.execute(f"SELECT date, produit, heures FROM ventes_horaires {filtre} ORDER BY date, produit",
+                             parametres).fetchall()
+    finally:
+        con.close()
+    if not lignes:
+        return pd.DataFrame(columns=colonnes)
+
+    dates, noms, blobs = zip(*lignes)
+    heures = np.frombuffer(b"".join(blobs), dtype="<i4").reshape(-1, HEURES)
+    horaires = pd.DataFrame(heures, columns=range(HEURES))
+    horaires.insert(0, "produit", pd.Categorical(noms))
+    horaires.insert(0, "date", pd.to_datetime(pd.Series(dates)))
+    return horaires
+
+def importer_ventes_horaires(source, fichier_histo, colonnes=None, taille_lot=TAILLE_LOT_IMPORT,
+                             format_fichier=None, progression=None):
+    # Tickets horodatés (colonne heure, ou heure dans la date) → profil horaire par (date, produit).
+    # Un profil réimporté remplace l'ancien ; le total du jour met à jour (ou crée) la ligne d'historique.
+    # Les tickets des semaines archivées sont rejetés.
+    if not _est_base(fichier_histo):
+        raise ValueError("Le détail horaire nécessite un historique SQLite (.db)")
+
+    debut = time.perf_counter()
+    if format_fichier is None:
+        nom = getattr(source, "name", str(source)).lower()
+        format_fichier = "xlsx" if nom.endswith((".xlsx", ".xlsm")) else "csv"
+
+    rapport = {"lignes_lues": 0, "lignes_rejetees": 0, "profils_horaires": 0, "lignes_ajoutees": 0,
+               "jours_mis_a_jour": 0}
+    limite = limite_archive(fichier_histo)
+    agregat = None
+    correspondance = None
+
+    for lot in _lire_par_lots(source, taille_lot, format_fichier):
+        if correspondance is None:
+            correspondance = _correspondance_colonnes(lot.columns, colonnes)
+        lot = lot[list(correspondance)].rename(columns=correspondance)
+        rapport["lignes_lues"] += len(lot)
+
+        horodatage = lot["date"].astype("string")
+        lot["date"] = _parser_dates(horodatage)
+        if "heure" in lot:
+            heure = pd.to_numeric(lot["heure"].astype("string").str.extract(r"^\s*(\d{1,2})", expand=False),
+                                  errors="coerce")
+        else:
+            heure = pd.to_datetime(horodatage, format="ISO8601", errors="coerce").dt.hour
+            heure = heure.fillna(pd.to_datetime(horodatage, dayfirst=True, errors="coerce").dt.hour)
+        lot["heure"] = heure
+        lot["produit"] = lot["produit"].astype("string").str.strip()
+        lot["ventes_moyennes"] = pd.to_numeric(lot["ventes_moyennes"].astype("string").str.replace(",", ".", regex=False),
+                                               errors="coerce")
+
+        valides = (lot["date"].notna() & lot["produit"].notna() & (lot["produit"] != "")
+                   & lot["heure"].between(0, HEURES - 1) & lot["ventes_moyennes"].notna()
+                   & (lot["ventes_moyennes"] >= 0))
+        if limite is not None:
+            valides &= lot["date"] >= limite
+        rapport["lignes_rejetees"] += int((~valides).sum())
+        lot = lot[valides].astype({"heure": int})
+
+        somme = lot.groupby(["date", "produit", "heure"])["ventes_moyennes"].sum()
+        if agregat is not None:
+            somme = pd.concat([agregat, somme]).groupby(level=["date", "produit", "heure"]).sum()
+        agregat = somme
+
+        if progression is not None:
+            progression(rapport["lignes_lues"])
+
+    if agregat is not None and not agregat.empty:
+        profils = agregat.round().unstack("heure", fill_value=0).reindex(columns=range(HEURES), fill_value=0)
+        cles = profils.index.to_frame(index=False)
+        totaux = cles.assign(ventes_moyennes=profils.sum(axis=1).to_numpy(),
+                             production_habituelle=profils.sum(axis=1).to_numpy())
+
+        con = _connexion(fichier_histo)
+        try:
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO ventes_horaires (date, produit, heures) VALUES (?, ?, ?)",
+                    zip(cles["date"].dt.strftime("%Y-%m-%d"), cles["produit"].astype(str),
+                        _empaqueter_heures(profils.to_numpy()))
+                )
+            detail = appliquer_schema(pd.read_sql_query(
+                f"SELECT {', '.join(COLONNES_HISTORIQUE)} FROM historique WHERE date BETWEEN ? AND ?", con,
+                params=[f"{cles['date'].min():%Y-%m-%d}", f"{cles['date'].max():%Y-%m-%d}"]
+            ))
+            couts_unitaires = dict(con.execute(
+                "SELECT produit, SUM(cout_gaspillage) / SUM(gaspillage_evite) FROM historique "
+                "WHERE gaspillage_evite > 0 GROUP BY produit"
+            ).fetchall())
+        finally:
+            con.close()
+
+        index_totaux = pd.MultiIndex.from_arrays([totaux["date"], totaux["produit"].astype(str)])
+        index_detail = pd.MultiIndex.from_arrays([detail["date"], detail["produit"].astype(str)])
+
+        # Jours déjà saisis : nouveau total, colonnes dérivées recalculées, écriture par l'upsert (anomalies comprises)
+        corrections = detail[index_detail.isin(index_totaux)].copy()
+        if not corrections.empty:
+            cles_corrections = pd.MultiIndex.from_arrays([corrections["date"], corrections["produit"].astype(str)])
+            ventes = pd.Series(totaux["ventes_moyennes"].to_numpy(), index=index_totaux)[cles_corrections].to_numpy()
+            corrections = _corriger_ventes(corrections, ventes, couts_unitaires)
+            rapport["jours_mis_a_jour"] = upsert_historique(corrections, fichier_histo)
+
+        nouvelles = _lignes_importees(totaux[~index_totaux.isin(index_detail)])
+        if not nouvelles.empty:
+            ajouter_historique(nouvelles, fichier_histo)
+        rapport["profils_horaires"] = len(profils)
+        rapport["lignes_ajoutees"] = len(nouvelles)
+
+    rapport["duree_s"] = time.perf_counter() - debut
+    rapport["lignes_par_s"] = rapport["lignes_lues"] / max(rapport["duree_s"], 1e-9)
+    return rapport
@@ -0,0 +1,193 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import secrets
+import threading
+
+from boulangerie_donnees import fichier_historique
+
+# État partagé entre répliques : comptes (documents JSON), sessions de connexion et pointeurs
+# d'historique. Fichiers locaux par défaut ; une base clé-valeur réseau (Redis) rend les
+# répliques sans état derrière un répartiteur de charge.
+BACKEND_ETAT_DEFAUT = os.environ.get("BOULANGERIE_ETAT", "fichiers")
+URL_ETAT = os.environ.get("BOULANGERIE_ETAT_URL", "redis://localhost:6379/0")
+DOSSIER_ETAT = os.environ.get("BOULANGERIE_DOSSIER_ETAT", ".")
+PREFIXE_KV = "boulangerie:"
+DUREE_SESSION = 12 * 3600
+DOCUMENTS_ETAT = ["users.json", "abonnements.json", "notifications.json", "roles.json", "stocks.json"]
+
+class EtatFichiers:
+    # Une clé = un fichier JSON sous `dossier` ; les documents gardent leur nom historique (users.json...)
+    def __init__(self, dossier=DOSSIER_ETAT):
+        self.dossier = dossier
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle if cle.endswith(".json") else f"{cle}.json")
+
+    def lire(self, cle):
+        chemin = self._chemin(cle)
+        if not os.path.exists(chemin):
+            return None
+        with open(chemin, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def ecrire(self, cle, valeur, duree=None):
+        # La durée n'est pas appliquée ici : les sessions portent leur propre date d'expiration
+        chemin = self._chemin(cle)
+        os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(valeur, f, indent=2, ensure_ascii=False)
+        os.replace(temporaire, chemin)
+
+    def supprimer(self, cle):
+        try:
+            os.remove(self._chemin(cle))
+        except FileNotFoundError:
+            pass
+
+class EtatKV:
+    # Client au protocole Redis (get/set/delete) : redis.Redis ou le substitut KVMemoire
+    def __init__(self, client, prefixe=PREFIXE_KV):
+        self.client = client
+        self.prefixe = prefixe
+
+    def lire(self, cle):
+        valeur = self.client.get(self.prefixe + cle)
+        return None if valeur is None else json.loads(valeur)
+
+    def ecrire(self, cle, valeur, duree=None):
+        self.client.set(self.prefixe + cle, json.dumps(valeur, ensure_ascii=False), ex=duree)
+
+    def supprimer(self, cle):
+        self.client.delete(self.prefixe + cle)
+
+class KVMemoire:
+    # Substitut local d'un serveur Redis (tests, démo) : mêmes appels, expiration comprise,
+    # partagé par toutes les sessions du processus comme le serait un serveur par les répliques
+    def __init__(self):
+        self._donnees = {}
+        self._verrou = threading.Lock()
+
+    def get(self, cle):
+        with self._verrou:
+            valeur, expire_le = self._donnees.get(cle, (None, None))
+            if expire_le is not None and expire_le <= time.time():
+                del self._donnees[cle]
+                return None
+            return valeur
+
+    def set(self, cle, valeur, ex=None):
+        with self._verrou:
+            self._donnees[cle] = (valeur.encode() if isinstance(valeur, str) else valeur,
+                                  time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *cles):
+        with self._verrou:
+            return sum(self._donnees.pop(cle, None) is not None for cle in cles)
+
+def _backend_redis(url=URL_ETAT):
+    import redis
+    return EtatKV(redis.Redis.from_url(url))
+
+_kv_memoire = KVMemoire()
+
+BACKENDS_ETAT = {
+    "fichiers": lambda: EtatFichiers(),
+    "redis": _backend_redis,
+    "memoire": lambda: EtatKV(_kv_memoire)
+}
+
+_etat = None
+
+def etat():
+    global _etat
+    if _etat is None:
+        _etat = BACKENDS_ETAT[BACKEND_ETAT_DEFAUT]()
+    return _etat
+
+def definir_backend_etat(nom):
+    global _etat
+    _etat = BACKENDS_ETAT[nom]()
+    return _etat
+
+def charger_document(nom, defaut=None):
+    valeur = etat().lire(nom)
+    if valeur is None:
+        return defaut if defaut else {}
+    return valeur
+
+def sauvegarder_document(nom, data):
+    etat().ecrire(nom, data)
+
+def creer_session(email, role=None, authentifie=True, duree=DUREE_SESSION):
+    # Jeton opaque ; une session non authentifiée attend la vérification 2FA de `email`
+    jeton = secrets.token_urlsafe(32)
+    etat().ecrire(f"sessions/{jeton}", {
+        "email": email, "role": role, "authentifie": authentifie, "expire_le": time.time() + duree
+    }, duree=duree)
+    return jeton
+
+def lire_session(jeton):
+    # Le jeton vient d'un cookie : seuls les caractères de secrets.token_urlsafe sont acceptés
+    if not jeton or not jeton.replace("-", "").replace("_", "").isalnum():
+        return None
+    session = etat().lire(f"sessions/{jeton}")
+    if session is None:
+        return None
+    if session["expire_le"] <= time.time():
+        etat().supprimer(f"sessions/{jeton}")
+        return None
+    return session
+
+def supprimer_session(jeton):
+    if jeton:
+        etat().supprimer(f"sessions/{jeton}")
+
+def pointeur_historique(email):
+    # Emplacement de l'historique du compte (volume partagé, autre machine...), sinon le fichier local par défaut
+    return etat().lire(f"historiques/{email}") or fichier_historique(email)
+
+def definir_pointeur_historique(email, chemin):
+    etat().ecrire(f"historiques/{email}", chemin)
+
+def _empreinte(secret):
+    # Le secret est aléatoire (256 bits) : une empreinte SHA-256 suffit, sans sel ni dérivation lente
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+def generer_cle_api(email):
+    # Clé « identifiant.secret » montrée une seule fois ; seule l'empreinte du secret est gardée.
+    # Une nouvelle clé révoque la précédente du compte.
+    ancienne = etat().lire(f"cles_api_comptes/{email}")
+    if ancienne:
+        etat().supprimer(f"cles_api/{ancienne}")
+    identifiant, secret = secrets.token_hex(8), secrets.token_urlsafe(32)
+    etat().ecrire(f"cles_api/{identifiant}", {"email": email, "empreinte": _empreinte(secret), "creee_le": time.time()})
+    etat().ecrire(f"cles_api_comptes/{email}", identifiant)
+    return f"{identifiant}.{secret}"
+
+def cle_api_existe(email):
+    return etat().lire(f"cles_api_comptes/{email}") is not None
+
+def verifier_cle_api(cle):
+    # Email du compte de la clé, None si elle est inconnue, révoquée ou fausse
+    identifiant, _, secret = (cle or "").partition(".")
+    if not identifiant.isalnum() or not secret:
+        return None
+    entree = etat().lire(f"cles_api/{identifiant}")
+    if entree is None or not hmac.compare_digest(_empreinte(secret), entree["empreinte"]):
+        return None
+    return entree["email"]
+
+def migrer_etat(source, destination):
+    # Copie des documents de comptes d'un backend à l'autre (passage des fichiers locaux à Redis)
+    copies = {}
+    for nom in DOCUMENTS_ETAT:
+        valeur = source.lire(nom)
+        if valeur is not None:
+            destination.ecrire(nom, valeur)
+            copies[nom] = len(valeur)
+    return copies
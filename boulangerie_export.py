@@ -0,0 +1,201 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from boulangerie_donnees import (HEURES, COLONNES_SOMMES, TAILLE_LOT_IMPORT, version_historique, origine_modifications,
+                                 modifications_historique, parcourir_historique, charger_historique_partage,
+                                 charger_ventes_horaires)
+from boulangerie_ia import previsions_produits
+from boulangerie_etat import charger_document, pointeur_historique, verifier_cle_api
+
+# Export en masse pour les outils BI : chaque jeu est écrit lot par lot (Parquet, flux Arrow IPC
+# ou CSV) sans construire le fichier en mémoire. La version de l'historique lue au début de
+# l'export est rendue à l'appelant (métadonnées du schéma, en-tête HTTP) : la passer en
+# `depuis_version` au prochain export ne transfère que ce qui a changé depuis.
+JEUX_EXPORT = ["historique", "semaines", "mois", "previsions", "horaires"]
+FORMATS_EXPORT = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "csv": ("text/csv; charset=utf-8", "csv")
+}
+PLANS_EXPORT = ["Pro", "Enterprise"]
+JOURS_PREVISION_EXPORT = 7
+MOTEUR_PREVISION_EXPORT = "numpy"
+PORT_EXPORT = 8600
+# Boucle locale par défaut : exposer l'API sur le réseau est un choix explicite (--hote 0.0.0.0)
+HOTE_EXPORT = "127.0.0.1"
+
+SCHEMAS_EXPORT = {
+    "historique": pa.schema([
+        ("date", pa.date32()), ("jour", pa.string()), ("meteo", pa.string()), ("produit", pa.string()),
+        ("production_habituelle", pa.int32()), ("ventes_moyennes", pa.int32()),
+        ("production_conseillee", pa.int32()), ("gaspillage_evite", pa.int32()),
+        ("cout_gaspillage", pa.float64()), ("supprimee", pa.bool_())
+    ]),
+    "cumuls": pa.schema([
+        ("periode", pa.date32()), ("produit", pa.string()), ("jours", pa.int32()),
+        *[(c, pa.float64() if c == "cout_gaspillage" else pa.int64()) for c in COLONNES_SOMMES]
+    ]),
+    "previsions": pa.schema([
+        ("produit", pa.string()), ("date", pa.date32()), ("prevision", pa.float64()),
+        ("prevision_basse", pa.float64()), ("prevision_haute", pa.float64())
+    ]),
+    "horaires": pa.schema([
+        ("date", pa.date32()), ("produit", pa.string()), *[(f"h{h:02d}", pa.int32()) for h in range(HEURES)]
+    ])
+}
+
+def _par_lots(df, taille_lot):
+    for debut in range(0, len(df), taille_lot):
+        yield df.iloc[debut:debut + taille_lot]
+
+def _periode(dates, jeu):
+    # Lundi de la semaine ou premier jour du mois
+    dates = dates.dt.normalize()
+    if jeu == "semaines":
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    return dates.dt.to_period("M").dt.start_time
+
+def _lots_cumuls(fichier, jeu, depuis_version, depuis_date, taille_lot):
+    # Cumuls par semaine (lundi) ou mois et produit ; en incrémental, les périodes touchées sont recalculées entières
+    df = charger_historique_partage(fichier)
+    periodes = _periode(df["date"], jeu)
+
+    garder = pd.Series(True, index=df.index)
+    if depuis_date is not None:
+        garder &= periodes >= _periode(pd.Series([pd.Timestamp(depuis_date)]), jeu).iloc[0]
+    if depuis_version is not None:
+        garder &= periodes.isin(_periode(modifications_historique(fichier, depuis_version)["date"], jeu))
+
+    cumuls = (df[garder].assign(periode=periodes[garder], produit=df.loc[garder, "produit"].astype(str))
+              .groupby(["periode", "produit"]).agg(jours=("date", "size"), **{c: (c, "sum") for c in COLONNES_SOMMES})
+              .reset_index())
+    yield from _par_lots(cumuls, taille_lot)
+
+def _lots_previsions(fichier, version, depuis_version, depuis_date, taille_lot, cle=None):
+    # Prévisions recalculées sur tout l'historique : rien de neuf tant que la version n'a pas bougé
+    if depuis_version is not None and int(version) <= depuis_version:
+        return
+    previsions = previsions_produits(charger_historique_partage(fichier), jours=JOURS_PREVISION_EXPORT,
+                                     cle=cle, moteur=MOTEUR_PREVISION_EXPORT)
+    lignes = pd.concat([
+        pd.DataFrame({"produit": str(produit), "date": pd.to_datetime(forecast["ds"]).to_numpy(),
+                      "prevision": forecast["yhat"].to_numpy(), "prevision_basse": forecast["yhat_lower"].to_numpy(),
+                      "prevision_haute": forecast["yhat_upper"].to_numpy()})
+        for produit, forecast in previsions.items() if forecast is not None
+    ] or [pd.DataFrame(columns=SCHEMAS_EXPORT["previsions"].names)], ignore_index=True)
+    if depuis_date is not None:
+        lignes = lignes[lignes["date"] >= pd.Timestamp(depuis_date)]
+    yield from _par_lots(lignes, taille_lot)
+
+def _lots_horaires(fichier, depuis_version, depuis_date, taille_lot):
+    horaires = charger_ventes_horaires(fichier, depuis=depuis_date)
+    if depuis_version is not None and not horaires.empty:
+        modifiees = modifications_historique(fichier, depuis_version)
+        cles = pd.MultiIndex.from_arrays([horaires["date"], horaires["produit"].astype(str)])
+        horaires = horaires[cles.isin(pd.MultiIndex.from_arrays([modifiees["date"], modifiees["produit"]]))]
+    horaires = horaires.rename(columns={h: f"h{h:02d}" for h in range(HEURES)})
+    yield from _par_lots(horaires.astype({"produit": object}), taille_lot)
+
+def _ecrivain(format_export, sortie, schema):
+    if format_export == "parquet":
+        return pq.ParquetWriter(sortie, schema, compression="zstd")
+    if format_export == "arrow":
+        return ipc.new_stream(sortie, schema)
+    return pacsv.CSVWriter(sortie, schema)
+
+def exporter(fichier, jeu, format_export, sortie, depuis_version=None, depuis_date=None,
+             taille_lot=TAILLE_LOT_IMPORT, debut=None, cle=None):
+    # `sortie` : chemin ou flux binaire. `debut(infos)` est appelé avant le premier octet écrit ;
+    # `cle` : compte propriétaire (registre de modèles des prévisions), None si inconnu
+    if jeu not in JEUX_EXPORT:
+        raise ValueError(f"Jeu inconnu : {jeu} ({', '.join(JEUX_EXPORT)})")
+    if format_export not in FORMATS_EXPORT:
+        raise ValueError(f"Format inconnu : {format_export} ({', '.join(FORMATS_EXPORT)})")
+
+    # Version lue avant les données : une écriture concurrente sera renvoyée au prochain export, jamais perdue
+    version = version_historique(fichier)
+    complet = depuis_version is None
+    if not complet:
+        origine = origine_modifications(fichier)
+        if origine is None or depuis_version < origine:
+            # Pas de suivi depuis cette version (CSV, base antérieure au suivi, historique remplacé)
+            depuis_version, complet = None, True
+    infos = {"jeu": jeu, "format": format_export, "version": version, "complet": complet, "lignes": 0}
+
+    if jeu == "historique":
+        lots = parcourir_historique(fichier, depuis_version, depuis_date, taille_lot)
+    elif jeu in ("semaines", "mois"):
+        lots = _lots_cumuls(fichier, jeu, depuis_version, depuis_date, taille_lot)
+    elif jeu == "previsions":
+        lots = _lots_previsions(fichier, version, depuis_version, depuis_date, taille_lot, cle)
+    else:
+        lots = _lots_horaires(fichier, depuis_version, depuis_date, taille_lot)
+
+    schema = SCHEMAS_EXPORT["cumuls" if jeu in ("semaines", "mois") else jeu].with_metadata({
+        "boulangerie.jeu": jeu, "boulangerie.version": version, "boulangerie.complet": str(complet).lower()
+    })
+    if debut is not None:
+        debut(infos)
+    with _ecrivain(format_export, sortie, schema) as ecrivain:
+        for lot in lots:
+            ecrivain.write_table(pa.Table.from_pandas(lot, schema=schema, preserve_index=False))
+            infos["lignes"] += len(lot)
+    return infos
+
+def compte_cle_api(cle):
+    # Email du compte dont la clé API est `cle`, si son plan donne accès à l'API
+    email = verifier_cle_api(cle)
+    if email is None:
+        return None, None
+    return email, charger_document("abonnements.json").get(email, {}).get("plan", "Gratuit")
+
+class GestionnaireExport(BaseHTTPRequestHandler):
+    # GET /export?jeu=&format=&depuis_version=&depuis_date= avec l'en-tête Authorization: Bearer <clé API>
+    def _erreur(self, code, message):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(f"{message}\n".encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/export":
+            return self._erreur(404, "Chemin inconnu : /export")
+
+        autorisation = self.headers.get("Authorization", "")
+        email, plan = compte_cle_api(autorisation[len("Bearer "):].strip() if autorisation.startswith("Bearer ") else "")
+        if email is None:
+            return self._erreur(401, "Clé API invalide")
+        if plan not in PLANS_EXPORT:
+            return self._erreur(403, "API réservée aux plans Pro et Enterprise")
+
+        params = {cle: valeurs[-1] for cle, valeurs in parse_qs(url.query).items()}
+        jeu, format_export = params.get("jeu", "historique"), params.get("format", "parquet")
+        try:
+            depuis_version = int(params["depuis_version"]) if params.get("depuis_version") else None
+            depuis_date = pd.Timestamp(params["depuis_date"]) if params.get("depuis_date") else None
+        except ValueError as e:
+            return self._erreur(400, f"Paramètre invalide : {e}")
+        if jeu not in JEUX_EXPORT or format_export not in FORMATS_EXPORT:
+            return self._erreur(400, f"jeu : {', '.join(JEUX_EXPORT)} ; format : {', '.join(FORMATS_EXPORT)}")
+
+        def en_tetes(infos):
+            # Réponse HTTP/1.0 sans longueur : le corps est diffusé lot par lot jusqu'à la fermeture
+            type_contenu, extension = FORMATS_EXPORT[format_export]
+            self.send_response(200)
+            self.send_header("Content-Type", type_contenu)
+            self.send_header("Content-Disposition", f'attachment; filename="{jeu}.{extension}"')
+            self.send_header("X-Boulangerie-Version", infos["version"])
+            self.send_header("X-Boulangerie-Complet", str(infos["complet"]).lower())
+            self.end_headers()
+
+        exporter(pointeur_historique(email), jeu, format_export, self.wfile, depuis_version, depuis_date,
+                 debut=en_tetes, cle=email)
+
+def serveur_export(hote=HOTE_EXPORT, port=PORT_EXPORT):
+    return ThreadingHTTPServer((hote, port), GestionnaireExport)
@@ -0,0 +1,208 @@
+import sqlite3
+from datetime import date, timedelta
+import pandas as pd
+import numpy as np
+
+from boulangerie_donnees import METEOS, initialiser_historique
+from boulangerie_meteo import meteo_locale
+
+# Variables explicatives par ligne d'historique (date, produit). Les ventes n'entrent
+# que décalées d'au moins un jour : une ligne ne voit jamais ses propres ventes.
+COLONNES_FEATURES = [
+    "jour_num", "meteo_num", "production_habituelle", "lag_7", "lag_14",
+    "moyenne_7", "moyenne_28", "ferie", "vacances", "temperature", "precipitation"
+]
+VERSION_FEATURES = "1"
+FENETRE_MAX = 28
+
+# Vacances scolaires approximées, toutes zones confondues : (mois, jour) de début et de fin
+PERIODES_VACANCES = [
+    ((1, 1), (1, 4)), ((2, 8), (3, 9)), ((4, 5), (5, 5)),
+    ((7, 5), (8, 31)), ((10, 19), (11, 3)), ((12, 20), (12, 31))
+]
+
+# Magasin de features dans la base du compte : des déclencheurs SQLite notent chaque
+# (date, produit) écrit ; seules ces lignes et les 28 jours suivants sont recalculés.
+SQL_TABLE_FEATURES = f"""
+CREATE TABLE IF NOT EXISTS features (
+    date TEXT NOT NULL,
+    produit TEXT NOT NULL,
+    {", ".join(f"{c} REAL" for c in COLONNES_FEATURES)},
+    PRIMARY KEY (date, produit)
+)
+"""
+SQL_TABLES_SUIVI = [
+    "CREATE TABLE IF NOT EXISTS features_en_attente (date TEXT NOT NULL, produit TEXT NOT NULL, "
+    "PRIMARY KEY (date, produit))",
+    "CREATE TABLE IF NOT EXISTS features_meta (cle TEXT PRIMARY KEY, valeur TEXT)",
+    # Même remarque que pour historique_modifications : pas de OR IGNORE dans un déclencheur
+    *[f"DROP TRIGGER IF EXISTS features_{nom}" for nom in ("insertion", "modification", "suppression")],
+    *[f"CREATE TRIGGER IF NOT EXISTS features_suivi_{nom} AFTER {evenement} ON historique BEGIN "
+      f"INSERT INTO features_en_attente VALUES ({ligne}.date, {ligne}.produit) "
+      f"ON CONFLICT(date, produit) DO NOTHING; END"
+      for nom, evenement, ligne in [("insertion", "INSERT", "NEW"), ("modification", "UPDATE", "NEW"),
+                                    ("suppression", "DELETE", "OLD")]]
+]
+
+def _paques(annee):
+    # Algorithme de Meeus/Jones/Butcher (calendrier grégorien)
+    a, b, c = annee % 19, annee // 100, annee % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    mois = (h + l - 7 * m + 90) // 25
+    return date(annee, mois, (h + l - 7 * m + 33 * mois + 19) % 32)
+
+def jours_feries(annees):
+    feries = []
+    for annee in annees:
+        paques = _paques(annee)
+        feries += [date(annee, m, j) for m, j in [(1, 1), (5, 1), (5, 8), (7, 14), (8, 15), (11, 1), (11, 11), (12, 25)]]
+        feries += [paques + timedelta(days=n) for n in (1, 39, 50)]
+    return pd.DatetimeIndex(feries)
+
+def est_vacances_scolaires(dates):
+    dates = pd.DatetimeIndex(dates)
+    mois_jour = dates.month * 100 + dates.day
+    vacances = np.zeros(len(dates), dtype=bool)
+    for (m1, j1), (m2, j2) in PERIODES_VACANCES:
+        vacances |= (mois_jour >= m1 * 100 + j1) & (mois_jour <= m2 * 100 + j2)
+    return vacances
+
+def calculer_features(df, meteo=None):
+    # Une ligne par ligne de `df` (même index) ; ventes manquantes (NaN) tolérées, p. ex. jours à prédire
+    if df.empty:
+        return pd.DataFrame(columns=["date", "produit"] + COLONNES_FEATURES)
+
+    dates = pd.to_datetime(df["date"]).dt.normalize()
+    produits = df["produit"].astype(str)
+
+    matrice = (pd.Series(pd.to_numeric(df["ventes_moyennes"], errors="coerce").to_numpy(dtype=float),
+                         index=pd.MultiIndex.from_arrays([dates, produits]))
+               .groupby(level=[0, 1]).mean().unstack())
+    calendrier = pd.date_range(dates.min(), dates.max(), freq="D")
+    matrice = matrice.reindex(calendrier)
+
+    lignes = ((dates - calendrier[0]).dt.days).to_numpy()
+    colonnes = matrice.columns.get_indexer(produits)
+    decalee = matrice.shift(1)
+
+    features = pd.DataFrame({
+        "date": dates,
+        "produit": produits,
+        "jour_num": dates.dt.dayofweek.astype(float),
+        "meteo_num": pd.Categorical(df["meteo"].astype(object), categories=METEOS).codes.astype(float),
+        "production_habituelle": pd.to_numeric(df["production_habituelle"], errors="coerce").astype(float),
+        "lag_7": matrice.shift(7).to_numpy()[lignes, colonnes],
+        "lag_14": matrice.shift(14).to_numpy()[lignes, colonnes],
+        "moyenne_7": decalee.rolling(7, min_periods=1).mean().to_numpy()[lignes, colonnes],
+        "moyenne_28": decalee.rolling(FENETRE_MAX, min_periods=1).mean().to_numpy()[lignes, colonnes],
+        "ferie": dates.isin(jours_feries(range(dates.min().year, dates.max().year + 1))).astype(float),
+        "vacances": est_vacances_scolaires(dates).astype(float)
+    }, index=df.index)
+    features["meteo_num"] = features["meteo_num"].where(features["meteo_num"] >= 0)
+
+    if meteo is not None and not meteo.empty:
+        meteo = meteo.set_index(pd.to_datetime(meteo["date"]))
+        features["temperature"] = meteo["temperature"].reindex(dates).to_numpy(dtype=float)
+        features["precipitation"] = meteo["precipitation"].reindex(dates).to_numpy(dtype=float)
+    else:
+        features["temperature"] = np.nan
+        features["precipitation"] = np.nan
+    return features
+
+def _connexion_features(fichier):
+    initialiser_historique(fichier)
+    con = sqlite3.connect(fichier, timeout=30)
+    con.execute(SQL_TABLE_FEATURES)
+    for sql in SQL_TABLES_SUIVI:
+        con.execute(sql)
+    return con
+
+def _meteo_compte(con):
+    ligne = con.execute("SELECT valeur FROM features_meta WHERE cle = 'ville'").fetchone()
+    return meteo_locale(ligne[0]) if ligne and ligne[0] else None
+
+def mettre_a_jour_features(fichier, ville=None, reconstruire=False):
+    # Recalcule les lignes en attente ; reconstruction complète si la version ou la ville change
+    con = _connexion_features(fichier)
+    try:
+        with con:
+            meta = dict(con.execute("SELECT cle, valeur FROM features_meta").fetchall())
+            if (reconstruire or meta.get("version") != VERSION_FEATURES
+                    or (ville is not None and meta.get("ville") != ville)):
+                con.execute("DELETE FROM features")
+                con.execute("INSERT OR IGNORE INTO features_en_attente SELECT date, produit FROM historique")
+                con.executemany("INSERT OR REPLACE INTO features_meta VALUES (?, ?)",
+                                [("version", VERSION_FEATURES), ("ville", ville or meta.get("ville", ""))])
+
+            attente = pd.read_sql_query("SELECT date, produit FROM features_en_attente", con, parse_dates=["date"])
+            meteo = _meteo_compte(con)
+            recalculees = 0
+
+            for produit, groupe in attente.groupby("produit"):
+                debut, fin = groupe["date"].min(), groupe["date"].max() + timedelta(days=FENETRE_MAX)
+                historique = pd.read_sql_query(
+                    "SELECT date, meteo, produit, production_habituelle, ventes_moyennes FROM historique "
+                    "WHERE produit = ? AND date BETWEEN ? AND ?",
+                    con, params=[produit, f"{debut - timedelta(days=FENETRE_MAX):%Y-%m-%d}", f"{fin:%Y-%m-%d}"]
+                )
+                features = calculer_features(historique, meteo)
+                features = features[features["date"] >= debut]
+
+                con.execute("DELETE FROM features WHERE produit = ? AND date BETWEEN ? AND ?",
+                            (produit, f"{debut:%Y-%m-%d}", f"{fin:%Y-%m-%d}"))
+                con.executemany(
+                    f"INSERT INTO features VALUES ({', '.join('?' * (len(COLONNES_FEATURES) + 2))})",
+                    zip(features["date"].dt.strftime("%Y-%m-%d"), features["produit"],
+                        *[features[c].astype(object).where(features[c].notna(), None) for c in COLONNES_FEATURES])
+                )
+                recalculees += len(features)
+
+            con.execute("DELETE FROM features_en_attente")
+
+            # Météo arrivée après le calcul (complétée en différé) : seules les colonnes météo sont reprises
+            if meteo is not None and not meteo.empty:
+                con.executemany(
+                    "UPDATE features SET temperature = ?, precipitation = ? WHERE date = ? AND temperature IS NULL",
+                    zip(meteo["temperature"], meteo["precipitation"], meteo["date"].dt.strftime("%Y-%m-%d"))
+                )
+    finally:
+        con.close()
+    return recalculees
+
+def features_historique(fichier, produit=None):
+    mettre_a_jour_features(fichier)
+    con = _connexion_features(fichier)
+    try:
+        filtre, parametres = ("WHERE produit = ?", [produit]) if produit is not None else ("", [])
+        features = pd.read_sql_query(f"SELECT * FROM features {filtre} ORDER BY date", con,
+                                     params=parametres, parse_dates=["date"])
+    finally:
+        con.close()
+    features[COLONNES_FEATURES] = features[COLONNES_FEATURES].astype(float)
+    return features
+
+def features_prediction(df_produit, date_cible, meteo, production, fichier=None):
+    # Ligne de features d'un jour à prédire, à partir des 28 jours qui le précèdent
+    date_cible = pd.Timestamp(date_cible).normalize()
+    dates = pd.to_datetime(df_produit["date"])
+    recent = df_produit[(dates >= date_cible - timedelta(days=FENETRE_MAX)) & (dates < date_cible)]
+    cible = pd.DataFrame([{
+        "date": date_cible, "meteo": meteo, "produit": str(df_produit["produit"].iloc[0]),
+        "production_habituelle": production, "ventes_moyennes": np.nan
+    }])
+
+    meteo_compte = None
+    if fichier is not None:
+        con = _connexion_features(fichier)
+        try:
+            meteo_compte = _meteo_compte(con)
+        finally:
+            con.close()
+
+    lignes = pd.concat([recent[cible.columns].astype(object), cible], ignore_index=True)
+    return calculer_features(lignes, meteo_compte)[COLONNES_FEATURES].to_numpy(dtype=float)[-1:]
@@ -0,0 +1,1138 @@
+import os
+import json
+import time
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, unquote
+import pandas as pd
+import numpy as np
+import joblib
+from scipy.special import ndtr, ndtri
+from prophet import Prophet
+from sklearn.ensemble import RandomForestRegressor
+
+from boulangerie_donnees import JOURS_SEMAINE, METEOS, HEURES
+from boulangerie_etat import pointeur_historique
+from boulangerie_features import (
+    COLONNES_FEATURES, VERSION_FEATURES, calculer_features, features_historique, features_prediction
+)
+
+JOURS_NUM = {jour: i for i, jour in enumerate(JOURS_SEMAINE)}
+METEO_NUM = {meteo: i for i, meteo in enumerate(METEOS)}
+
+COUT_UNITAIRE_DEFAUT = {
+    "Pain classique": 0.5, "Baguette": 0.4, "Croissant": 0.6,
+    "Pain au chocolat": 0.7, "Pain complet": 0.6, "Pain de campagne": 0.55,
+    "Brioche": 0.8, "Éclair": 1.2, "Tarte aux pommes": 2.5, "Macaron": 1.5
+}
+
+PRIX_VENTE_DEFAUT = {
+    "Pain classique": 1.2, "Baguette": 1.1, "Croissant": 1.3,
+    "Pain au chocolat": 1.5, "Pain complet": 1.8, "Pain de campagne": 2.2,
+    "Brioche": 2.5, "Éclair": 3.2, "Tarte aux pommes": 6.0, "Macaron": 2.0
+}
+
+COEF_JOUR = {
+    "Lundi": 0.8, "Mardi": 0.9, "Mercredi": 1.0, "Jeudi": 1.0,
+    "Vendredi": 1.2, "Samedi": 1.4, "Dimanche": 1.3
+}
+
+COEF_METEO = {
+    "Soleil": 1.1, "Nuageux": 1.0, "Pluie": 0.85, "Neige": 0.7
+}
+
+# Calibration log-linéaire par compte : log(ventes) = b_produit + log c_jour + log c_meteo,
+# résolue sur les statistiques suffisantes (effectifs et sommes par produit × jour × météo)
+# avec un rappel (ridge) vers les coefficients globaux, puis vers ceux du compte par produit.
+CALIBRATION_MIN_LIGNES = 14
+CALIBRATION_RAPPEL = 5.0
+
+# Apprentissage incrémental : les nouvelles lignes ajoutent des arbres à la forêt
+# existante, et un ré-entraînement complet est forcé périodiquement pour limiter la dérive.
+RF_ARBRES_INITIAUX = 100
+RF_ARBRES_PAR_LOT = 10
+RF_ARBRES_MAX = 300
+# Dix arbres appris sur moins de quatre semaines (chaque jour de la semaine vu quatre fois) sur-apprennent le lot
+RF_LOT_MIN = 28
+MAJ_AVANT_REFIT_COMPLET = 20
+
+MOTEUR_PREVISION_DEFAUT = "prophet"
+# Lissage exponentiel à saisonnalité hebdomadaire : grille (alpha, gamma) évaluée
+# pour tous les produits à la fois ; (0, 1) correspond au naïf saisonnier.
+LISSAGE_ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5] * 4 + [0.0])
+LISSAGE_GAMMAS = np.array([0.05] * 5 + [0.1] * 5 + [0.2] * 5 + [0.4] * 5 + [1.0])
+PERIODE_SAISON = 7
+QUANTILES_INTERVALLE = (0.1, 0.9)
+# Prophet et le moteur NumPy donnent un intervalle à 80 % : demi-largeur = 1,28 écart-type
+Z_INTERVALLE = float(ndtri(QUANTILES_INTERVALLE[1]))
+
+# Simulation Monte Carlo : demande tirée (bootstrap) parmi les ventes observées pour le même
+# produit, jour et météo, avec repli sur (produit, jour) puis produit si trop peu d'observations.
+SIMULATION_SCENARIOS = 20_000
+SIMULATION_LOT = 5_000
+SIMULATION_MIN_ECHANTILLONS = 5
+
+# Prévision horaire : pour le jour de semaine visé, moyenne et variance pondérées (demi-vie en
+# semaines) des ventes de chaque (produit, heure) sur les SEMAINES_PROFIL dernières semaines, en
+# un passage sur le tenseur (jours, heures) indexé par produit. Fournées : heures de cuisson.
+SEMAINES_PROFIL = 8
+DEMI_VIE_PROFIL = 4
+FOURNEES_DEFAUT = [6, 11, 16]
+
+# Réconciliation hiérarchique : organisation > magasin > famille > produit. Les prévisions de base de
+# tous les nœuds (lissage sur les séries agrégées, Prophet ou Random Forest pour les produits) sont
+# projetées sur l'espace cohérent S G ŷ : ascendante (G ne garde que les produits), WLS structurelle
+# ou MinT (W = covariance des erreurs à un pas rétrécie vers sa diagonale), pour tous les jours d'un coup.
+FAMILLES_PRODUITS = {
+    "Pains": ["Pain classique", "Baguette", "Pain complet", "Pain de campagne"],
+    "Viennoiseries": ["Croissant", "Pain au chocolat", "Brioche"],
+    "Pâtisseries": ["Éclair", "Tarte aux pommes", "Macaron"]
+}
+FAMILLE_AUTRES = "Autres"
+NIVEAUX_HIERARCHIE = ["organisation", "magasin", "famille", "produit"]
+METHODES_RECONCILIATION = ["mint", "wls", "ascendante"]
+
+# Backtest à origine glissante : origines ancrées sur la première date pour
+# qu'un nouveau jour n'ajoute qu'un pli, les plis déjà calculés restant en cache.
+DOSSIER_BACKTESTS = "backtests"
+METHODES_BACKTEST = ["regle", "random_forest", "prophet", "numpy"]
+
+# Registre sur disque : modeles/<tenant>/<produit>/<type>/<version>.joblib
+DOSSIER_MODELES = "modeles"
+VERSIONS_CONSERVEES = 2
+
+_modeles_rf = {}
+_modeles_prophet = {}
+_calibrations = {}
+
+def version_donnees(df_produit):
+    empreinte = int(pd.util.hash_pandas_object(df_produit, index=False).sum()) & 0xFFFFFFFF
+    return f"{len(df_produit):08d}-{empreinte:08x}"
+
+def _somme_controle(df_produit):
+    # Somme de contrôle des colonnes apprises (date, météo, production, ventes) : quelques opérations
+    # numpy, cumulable lot par lot, là où version_donnees hache toutes les colonnes
+    jours = pd.to_datetime(df_produit["date"]).to_numpy(dtype="datetime64[D]").astype(np.int64)
+    meteo = pd.Categorical(df_produit["meteo"], categories=METEOS).codes.astype(np.int64)
+    valeurs = (jours * 1_000_003 + df_produit["ventes_moyennes"].to_numpy(dtype=np.int64) * 1_009
+               + df_produit["production_habituelle"].to_numpy(dtype=np.int64) * 31 + meteo)
+    return int(valeurs.sum())
+
+def _empreinte_rf(df_produit, somme):
+    return {"derniere_date": f"{pd.Timestamp(df_produit['date'].iloc[-1]):%Y-%m-%d}", "somme": somme}
+
+def _version_rf(n, somme):
+    return f"{n:08d}-{somme & 0xFFFFFFFF:08x}"
+
+def _dossier_modele(cle, produit, type_modele):
+    return os.path.join(DOSSIER_MODELES, quote(cle, safe=""), quote(produit, safe=""), type_modele)
+
+def _versions(dossier):
+    # Ordre d'écriture (mtime en ns) et non ordre des noms : une correction peut produire une version
+    # « plus petite » (moins de lignes, autre empreinte) qui reste pourtant la plus récente
+    if not os.path.isdir(dossier):
+        return []
+    fichiers = [f for f in os.listdir(dossier) if f.endswith(".joblib")]
+    dates = {}
+    for f in fichiers:
+        try:
+            dates[f] = os.stat(os.path.join(dossier, f)).st_mtime_ns
+        except FileNotFoundError:
+            pass
+    return [f[:-len(".joblib")] for f in sorted(dates, key=lambda f: (dates[f], f))]
+
+def enregistrer_modele(cle, produit, type_modele, version, etat):
+    dossier = _dossier_modele(cle, produit, type_modele)
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f"{version}.joblib")
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    joblib.dump(etat, tmp)
+    # mtime strictement supérieur aux versions existantes, même si l'horloge n'a pas avancé
+    dernieres = [os.stat(os.path.join(dossier, f"{v}.joblib")).st_mtime_ns for v in _versions(dossier) if v != version]
+    if dernieres and os.stat(tmp).st_mtime_ns <= max(dernieres):
+        os.utime(tmp, ns=(max(dernieres) + 1, max(dernieres) + 1))
+    os.replace(tmp, chemin)
+    purger_modeles(cle=cle, produit=produit, type_modele=type_modele, sauf=version)
+    return chemin
+
+def charger_modele(cle, produit, type_modele, version=None):
+    dossier = _dossier_modele(cle, produit, type_modele)
+    versions = _versions(dossier)
+    if version is None:
+        if not versions:
+            return None
+        version = versions[-1]
+    elif version not in versions:
+        return None
+    try:
+        # mmap : seuls les tableaux numpy stockés tels quels (paramètres Prophet) restent partagés entre
+        # processus via le cache de pages. Tree.__setstate__ recopie les nœuds des arbres : une forêt
+        # RandomForest chargée ainsi est privée à chaque processus, le mmap n'évite que la lecture.
+        return joblib.load(os.path.join(dossier, f"{version}.joblib"), mmap_mode="r")
+    except (OSError, EOFError, ValueError):
+        return None
+
+def lister_modeles(cle=None):
+    if not os.path.isdir(DOSSIER_MODELES):
+        return []
+
+    entrees = []
+    tenants = [quote(cle, safe="")] if cle is not None else sorted(os.listdir(DOSSIER_MODELES))
+    for tenant in tenants:
+        dossier_tenant = os.path.join(DOSSIER_MODELES, tenant)
+        if not os.path.isdir(dossier_tenant):
+            continue
+        for produit in sorted(os.listdir(dossier_tenant)):
+            dossier_produit = os.path.join(dossier_tenant, produit)
+            for type_modele in sorted(os.listdir(dossier_produit)):
+                dossier = os.path.join(dossier_produit, type_modele)
+                for version in _versions(dossier):
+                    chemin = os.path.join(dossier, f"{version}.joblib")
+                    entrees.append({
+                        "tenant": unquote(tenant),
+                        "produit": unquote(produit),
+                        "type": type_modele,
+                        "version": version,
+                        "taille": os.path.getsize(chemin),
+                        "modifie": time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(chemin)))
+                    })
+    return entrees
+
+def purger_modeles(garder=VERSIONS_CONSERVEES, cle=None, produit=None, type_modele=None, sauf=None):
+    # `sauf` : version qui vient d'être écrite, jamais supprimée
+    groupes = {}
+    for entree in lister_modeles(cle):
+        if produit is not None and entree["produit"] != produit:
+            continue
+        if type_modele is not None and entree["type"] != type_modele:
+            continue
+        groupes.setdefault((entree["tenant"], entree["produit"], entree["type"]), []).append(entree)
+
+    supprimes = []
+    for (tenant, nom_produit, type_entree), entrees in groupes.items():
+        dossier = _dossier_modele(tenant, nom_produit, type_entree)
+        for entree in entrees[:max(0, len(entrees) - garder)]:
+            if entree["version"] == sauf:
+                continue
+            os.remove(os.path.join(dossier, f"{entree['version']}.joblib"))
+            supprimes.append(entree)
+    return supprimes
+
+def _fichier_compte(cle):
+    # Historique du compte via le pointeur du backend d'état, None s'il n'existe pas (encore)
+    if cle is None:
+        return None
+    fichier = pointeur_historique(cle)
+    return fichier if os.path.exists(fichier) else None
+
+def encoder_features_rf(df, cle=None):
+    # Features lues dans le magasin du compte s'il couvre toutes les lignes, calculées sinon
+    fichier = _fichier_compte(cle)
+    if fichier is not None and df["produit"].nunique() == 1:
+        stock = features_historique(fichier, str(df["produit"].iloc[0])).set_index("date")
+        X = stock.reindex(pd.to_datetime(df["date"]))[COLONNES_FEATURES].to_numpy(dtype=float)
+        if not np.isnan(X[:, 0]).any():
+            return X
+    return calculer_features(df)[COLONNES_FEATURES].to_numpy(dtype=float)
+
+def _entrainer_rf_complet(df_produit, cle=None):
+    model = RandomForestRegressor(n_estimators=RF_ARBRES_INITIAUX, random_state=42, warm_start=True)
+    model.fit(encoder_features_rf(df_produit, cle), df_produit['ventes_moyennes'].to_numpy(dtype=float))
+    somme = _somme_controle(df_produit)
+    return {"modele": model, "n_vus": len(df_produit), "maj": 0, "version": _version_rf(len(df_produit), somme),
+            "empreinte": _empreinte_rf(df_produit, somme), "features": VERSION_FEATURES}
+
+def mettre_a_jour_modele_rf(df, produit, cle=None):
+    if df.empty:
+        return None
+
+    df_produit = df[df['produit'] == produit]
+
+    if len(df_produit) < 5:
+        return None
+
+    if cle is None:
+        return _entrainer_rf_complet(df_produit)["modele"]
+
+    etat = _modeles_rf.get((cle, produit))
+    if etat is None:
+        etat = charger_modele(cle, produit, "random_forest")
+    n = len(df_produit)
+
+    # Une correction (upsert) d'une ligne déjà apprise change l'empreinte du préfixe : refit complet.
+    # Dernière date apprise comparée d'abord, somme de contrôle du préfixe ensuite.
+    if (etat is None or n < etat["n_vus"] or etat.get("features") != VERSION_FEATURES
+            or "empreinte" not in etat
+            or _empreinte_rf(df_produit.iloc[:etat["n_vus"]], etat["empreinte"]["somme"]) != etat["empreinte"]
+            or _somme_controle(df_produit.iloc[:etat["n_vus"]]) != etat["empreinte"]["somme"]
+            or etat["maj"] >= MAJ_AVANT_REFIT_COMPLET
+            or etat["modele"].n_estimators + RF_ARBRES_PAR_LOT > RF_ARBRES_MAX):
+        etat = _entrainer_rf_complet(df_produit, cle)
+        enregistrer_modele(cle, produit, "random_forest", etat["version"], etat)
+    elif n - etat["n_vus"] >= RF_LOT_MIN:
+        nouvelles = df_produit.iloc[etat["n_vus"]:]
+        model = etat["modele"]
+        model.n_estimators += RF_ARBRES_PAR_LOT
+        model.fit(encoder_features_rf(nouvelles, cle), nouvelles['ventes_moyennes'].to_numpy(dtype=float))
+        somme = etat["empreinte"]["somme"] + _somme_controle(nouvelles)
+        etat["n_vus"] = n
+        etat["maj"] += 1
+        etat["empreinte"] = _empreinte_rf(df_produit, somme)
+        etat["version"] = _version_rf(n, somme)
+        enregistrer_modele(cle, produit, "random_forest", etat["version"], etat)
+
+    _modeles_rf[(cle, produit)] = etat
+    return etat["modele"]
+
+def version_modele_rf(cle, produit):
+    # Version du modèle en mémoire après mettre_a_jour_modele_rf (nom du fichier dans le registre)
+    etat = _modeles_rf.get((cle, produit))
+    return None if etat is None else etat["version"]
+
+def prediction_ia_random_forest(df, jour, meteo, produit, cle=None, date_cible=None):
+    model = mettre_a_jour_modele_rf(df, produit, cle)
+
+    if model is None:
+        return None
+    return predire_random_forest(model, df, jour, meteo, produit, cle, date_cible)
+
+def predire_random_forest(model, df, jour, meteo, produit, cle=None, date_cible=None):
+    # Prédiction seule, sans mise à jour ni écriture du modèle
+    if date_cible is None:
+        # Prochain jour (aujourd'hui compris) tombant le jour de semaine demandé
+        aujourd_hui = pd.Timestamp.today().normalize()
+        date_cible = aujourd_hui + pd.Timedelta(days=(JOURS_NUM[jour] - aujourd_hui.dayofweek) % 7)
+
+    df_produit = df[df['produit'] == produit]
+    prod_moy = df_produit['production_habituelle'].mean()
+    fichier = _fichier_compte(cle)
+    prediction = model.predict(features_prediction(df_produit, date_cible, meteo, prod_moy, fichier))[0]
+
+    return int(prediction)
+
+def _accumuler_calibration(etat, nouvelles):
+    jours = nouvelles["jour"].map(JOURS_NUM)
+    meteos = nouvelles["meteo"].map(METEO_NUM)
+    valides = jours.notna() & meteos.notna() & nouvelles["ventes_moyennes"].notna()
+    nouvelles = nouvelles[valides]
+
+    for produit in nouvelles["produit"].unique():
+        if produit not in etat["produits"]:
+            etat["produits"].append(produit)
+    n_produits = len(etat["produits"])
+    if etat["N"].shape[0] < n_produits:
+        ajout = np.zeros((n_produits - etat["N"].shape[0], 7, 4))
+        etat["N"] = np.concatenate([etat["N"], ajout])
+        etat["S"] = np.concatenate([etat["S"], ajout])
+
+    index_produits = {produit: i for i, produit in enumerate(etat["produits"])}
+    p = nouvelles["produit"].map(index_produits).to_numpy(dtype=int)
+    j = jours[valides].to_numpy(dtype=int)
+    m = meteos[valides].to_numpy(dtype=int)
+    log_ventes = np.log(np.maximum(nouvelles["ventes_moyennes"].to_numpy(dtype=float), 1.0))
+
+    np.add.at(etat["N"], (p, j, m), 1.0)
+    np.add.at(etat["S"], (p, j, m), log_ventes)
+
+def _normaliser_coefficients(log_jour, log_meteo):
+    coef_jour = np.exp(log_jour)
+    coef_jour = coef_jour / coef_jour.mean(axis=-1, keepdims=True)
+    coef_meteo = np.exp(log_meteo - log_meteo[..., [METEO_NUM["Nuageux"]]])
+    return coef_jour, coef_meteo
+
+def _resoudre_calibration(N, S):
+    P = N.shape[0]
+    rappel = CALIBRATION_RAPPEL
+    a_priori_jour = np.log([COEF_JOUR[j] for j in JOURS_NUM])
+    a_priori_meteo = np.log([COEF_METEO[m] for m in METEO_NUM])
+
+    n_pj, n_pm, n_jm = N.sum(axis=2), N.sum(axis=1), N.sum(axis=0)
+
+    # Niveau compte : intercept par produit, coefficients jour/météo partagés
+    k = P + 11
+    A = np.zeros((k, k))
+    A[:P, :P] = np.diag(N.sum(axis=(1, 2)))
+    A[:P, P:P + 7] = n_pj
+    A[:P, P + 7:] = n_pm
+    A[P:P + 7, P:P + 7] = np.diag(n_pj.sum(axis=0)) + rappel * np.eye(7)
+    A[P:P + 7, P + 7:] = n_jm
+    A[P + 7:, P + 7:] = np.diag(n_pm.sum(axis=0)) + rappel * np.eye(4)
+    A = np.triu(A) + np.triu(A, 1).T
+    b = np.concatenate([
+        S.sum(axis=(1, 2)),
+        S.sum(axis=(0, 2)) + rappel * a_priori_jour,
+        S.sum(axis=(0, 1)) + rappel * a_priori_meteo
+    ])
+    theta = np.linalg.solve(A + 1e-9 * np.eye(k), b)
+    log_jour, log_meteo = theta[P:P + 7], theta[P + 7:]
+
+    # Niveau produit : mêmes équations normales, en lot, rappelées vers le niveau compte
+    Ap = np.zeros((P, 12, 12))
+    Ap[:, 0, 0] = n_pj.sum(axis=1)
+    Ap[:, 0, 1:8] = n_pj
+    Ap[:, 0, 8:] = n_pm
+    Ap[:, 1:8, 1:8] = n_pj[:, :, None] * np.eye(7) + rappel * np.eye(7)
+    Ap[:, 1:8, 8:] = N
+    Ap[:, 8:, 8:] = n_pm[:, :, None] * np.eye(4) + rappel * np.eye(4)
+    Ap = np.triu(Ap) + np.transpose(np.triu(Ap, 1), (0, 2, 1))
+    bp = np.concatenate([
+        S.sum(axis=(1, 2))[:, None],
+        S.sum(axis=2) + rappel * log_jour,
+        S.sum(axis=1) + rappel * log_meteo
+    ], axis=1)
+    theta_p = np.linalg.solve(Ap + 1e-9 * np.eye(12), bp[:, :, None])[:, :, 0]
+
+    return _normaliser_coefficients(log_jour, log_meteo), _normaliser_coefficients(theta_p[:, 1:8], theta_p[:, 8:])
+
+def calibrer_coefficients(df, cle=None):
+    etat = _calibrations.get(cle) if cle is not None else None
+
+    # Même somme de contrôle que le RandomForest (quelques opérations numpy), cumulée lot par lot :
+    # pas de hachage complet de l'historique à chaque affichage
+    if (etat is None or len(df) < etat["n_vus"]
+            or etat["somme"] != _somme_controle(df.iloc[:etat["n_vus"]])):
+        etat = {"produits": [], "N": np.zeros((0, 7, 4)), "S": np.zeros((0, 7, 4)), "n_vus": 0, "somme": 0,
+                "coefs": None}
+
+    if etat["coefs"] is None or len(df) > etat["n_vus"]:
+        nouvelles = df.iloc[etat["n_vus"]:]
+        _accumuler_calibration(etat, nouvelles)
+        etat["n_vus"] = len(df)
+        etat["somme"] += _somme_controle(nouvelles)
+
+        if etat["N"].sum() < CALIBRATION_MIN_LIGNES:
+            etat["coefs"] = {"jour": dict(COEF_JOUR), "meteo": dict(COEF_METEO), "produits": {}, "calibre": False}
+        else:
+            (coef_jour, coef_meteo), (coef_jour_p, coef_meteo_p) = _resoudre_calibration(etat["N"], etat["S"])
+            etat["coefs"] = {
+                "jour": dict(zip(JOURS_NUM, np.round(coef_jour, 3).tolist())),
+                "meteo": dict(zip(METEO_NUM, np.round(coef_meteo, 3).tolist())),
+                "produits": {
+                    produit: {
+                        "jour": dict(zip(JOURS_NUM, np.round(coef_jour_p[i], 3).tolist())),
+                        "meteo": dict(zip(METEO_NUM, np.round(coef_meteo_p[i], 3).tolist()))
+                    }
+                    for i, produit in enumerate(etat["produits"])
+                },
+                "calibre": True
+            }
+
+        if cle is not None:
+            _calibrations[cle] = etat
+
+    return etat["coefs"]
+
+def coefficients_produit(df, produit, cle=None):
+    coefs = calibrer_coefficients(df, cle)
+    coefs_produit = coefs["produits"].get(produit, coefs)
+    return coefs_produit["jour"], coefs_produit["meteo"]
+
+def _params_init_prophet(model):
+    init = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        init[pname] = model.params[pname][0][0]
+    for pname in ['delta', 'beta']:
+        init[pname] = model.params[pname][0]
+    return init
+
+def _nouveau_modele_prophet():
+    return Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=True,
+        daily_seasonality=False
+    )
+
+def _prevision_prophet(df, produit, jours=7, cle=None):
+    df_produit = df[df["produit"] == produit]
+
+    df_prophet = pd.DataFrame({
+        'ds': pd.to_datetime(df_produit["date"]),
+        'y': df_produit["ventes_moyennes"]
+    })
+
+    if len(df_prophet) < 10:
+        return None
+
+    etat = None
+    if cle is not None:
+        etat = _modeles_prophet.get((cle, produit)) or charger_modele(cle, produit, "prophet")
+    n = len(df_prophet)
+    version = version_donnees(df_produit)
+
+    if etat is not None and etat.get("version") == version:
+        model = etat["modele"]
+    else:
+        model = _nouveau_modele_prophet()
+
+        if etat is not None and etat["maj"] < MAJ_AVANT_REFIT_COMPLET:
+            # Démarrage à chaud : l'optimiseur repart des paramètres précédents
+            try:
+                model.fit(df_prophet, init=_params_init_prophet(etat["modele"]))
+                maj = etat["maj"] + 1
+            except (ValueError, RuntimeError):
+                model = _nouveau_modele_prophet()
+                model.fit(df_prophet)
+                maj = 0
+        else:
+            model.fit(df_prophet)
+            maj = 0
+
+        if cle is not None:
+            etat = {"modele": model, "n_vus": n, "maj": maj, "version": version}
+            enregistrer_modele(cle, produit, "prophet", version, etat)
+
+    if cle is not None:
+        _modeles_prophet[(cle, produit)] = etat
+
+    future = model.make_future_dataframe(periods=jours)
+    forecast = model.predict(future)
+
+    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(jours)
+
+def _moteur_prophet(df, produits, jours, cle):
+    return {produit: _prevision_prophet(df, produit, jours, cle) for produit in produits}
+
+def _matrice_ventes(df):
+    ventes = df.assign(date=pd.to_datetime(df["date"])).groupby(["date", "produit"], observed=True)["ventes_moyennes"].mean()
+    return ventes.unstack("produit").asfreq("D")
+
+def lissage_saisonnier(Y, alphas=LISSAGE_ALPHAS, gammas=LISSAGE_GAMMAS, periode=PERIODE_SAISON):
+    # Y : (T, P) avec NaN pour les jours sans donnée ; récursion vectorisée sur (paramètres, produits)
+    T, P = Y.shape
+    a = alphas[:, None]
+    g = gammas[:, None]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        debut = Y[:4 * periode]
+        niveau0 = np.nanmean(debut, axis=0)
+        niveau0 = np.where(np.isnan(niveau0), np.nanmean(Y, axis=0), niveau0)
+        saison0 = np.zeros((periode, P))
+        for j in range(periode):
+            saison0[j] = np.nanmean(debut[j::periode], axis=0) - niveau0
+    saison0 = np.nan_to_num(saison0)
+
+    niveau = np.broadcast_to(niveau0, (len(alphas), P)).copy()
+    saison = np.broadcast_to(saison0, (len(alphas), periode, P)).copy()
+    erreurs = np.full((T, len(alphas), P), np.nan)
+
+    for t in range(T):
+        j = t % periode
+        y = Y[t]
+        observe = ~np.isnan(y)
+        err = np.where(observe, y - (niveau + saison[:, j, :]), 0.0)
+        if t >= periode:
+            erreurs[t] = np.where(observe, err, np.nan)
+        niveau += a * err
+        saison[:, j, :] += g * err
+
+    sse = np.nansum(erreurs ** 2, axis=0)
+    meilleur = np.argmin(sse, axis=0)
+    colonnes = np.arange(P)
+
+    return niveau[meilleur, colonnes], saison[meilleur, :, colonnes].T, erreurs[:, meilleur, colonnes]
+
+def _moteur_numpy(df, produits, jours, cle):
+    comptes = df["produit"].value_counts()
+    eligibles = [p for p in produits if comptes.get(p, 0) >= 10]
+    previsions = {produit: None for produit in produits}
+
+    if not eligibles:
+        return previsions
+
+    ventes = _matrice_ventes(df[df["produit"].isin(eligibles)])[eligibles]
+    Y = ventes.to_numpy(dtype=float)
+    T = len(Y)
+
+    niveau, saison, erreurs = lissage_saisonnier(Y)
+
+    horizons = np.arange(1, jours + 1)
+    yhat = niveau + saison[(T + horizons - 1) % PERIODE_SAISON]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        q_bas, q_haut = np.nanquantile(erreurs, QUANTILES_INTERVALLE, axis=0)
+    q_bas = np.nan_to_num(q_bas)
+    q_haut = np.nan_to_num(q_haut)
+    elargissement = np.sqrt(horizons)[:, None]
+
+    dates = pd.date_range(ventes.index[-1] + pd.Timedelta(days=1), periods=jours, freq="D")
+    for i, produit in enumerate(eligibles):
+        previsions[produit] = pd.DataFrame({
+            'ds': dates,
+            'yhat': np.maximum(yhat[:, i], 0),
+            'yhat_lower': np.maximum(yhat[:, i] + q_bas[i] * elargissement[:, 0], 0),
+            'yhat_upper': np.maximum(yhat[:, i] + q_haut[i] * elargissement[:, 0], 0)
+        })
+
+    return previsions
+
+MOTEURS_PREVISION = {
+    "prophet": _moteur_prophet,
+    "numpy": _moteur_numpy
+}
+
+def previsions_produits(df, produits=None, jours=7, cle=None, moteur=MOTEUR_PREVISION_DEFAUT):
+    if df.empty:
+        return {}
+    if produits is None:
+        produits = df["produit"].unique()
+    return MOTEURS_PREVISION[moteur](df, list(produits), jours, cle)
+
+def prediction_ia_prophet(df, produit, jours=7, cle=None, moteur=MOTEUR_PREVISION_DEFAUT):
+    if df.empty or produit not in df["produit"].unique():
+        return None
+
+    return previsions_produits(df, [produit], jours, cle, moteur).get(produit)
+
+def comparer_moteurs_prevision(df, jours=7, moteurs=None):
+    # Validation sur les `jours` derniers jours : latence d'ajustement et MAE par moteur
+    if moteurs is None:
+        moteurs = list(MOTEURS_PREVISION)
+
+    dates = pd.to_datetime(df["date"])
+    coupure = dates.max() - pd.Timedelta(days=jours)
+    apprentissage = df[dates <= coupure]
+    reel = _matrice_ventes(df[dates > coupure])
+
+    resultats = []
+    for moteur in moteurs:
+        debut = time.perf_counter()
+        previsions = previsions_produits(apprentissage, jours=jours, moteur=moteur)
+        duree = time.perf_counter() - debut
+
+        ecarts = []
+        for produit, forecast in previsions.items():
+            if forecast is None or produit not in reel.columns:
+                continue
+            observe = reel[produit].reindex(pd.to_datetime(forecast["ds"]).values)
+            ecarts.append(np.abs(forecast["yhat"].to_numpy() - observe.to_numpy()))
+
+        ecarts = np.concatenate(ecarts) if ecarts else np.array([])
+        resultats.append({
+            "moteur": moteur,
+            "produits": sum(f is not None for f in previsions.values()),
+            "duree_ms": duree * 1000,
+            "mae": float(np.nanmean(ecarts)) if np.isfinite(ecarts).any() else np.nan
+        })
+
+    return pd.DataFrame(resultats)
+
+def famille_produit(produit):
+    for famille, produits in FAMILLES_PRODUITS.items():
+        if produit in produits:
+            return famille
+    return FAMILLE_AUTRES
+
+def hierarchie_produits(series):
+    # Feuilles (magasin, produit) → nœuds de l'organisation aux produits et matrice d'agrégation S
+    # (nœuds × feuilles, 1 si la feuille entre dans le total du nœud) ; les feuilles terminent la liste
+    feuilles = pd.DataFrame(list(series), columns=["magasin", "produit"]).astype(str)
+    feuilles["famille"] = feuilles["produit"].map(famille_produit)
+
+    noeuds, blocs = [], []
+    for niveau, cles in zip(NIVEAUX_HIERARCHIE, [[], ["magasin"], ["magasin", "famille"], ["magasin", "famille", "produit"]]):
+        if cles:
+            codes, groupes = pd.MultiIndex.from_frame(feuilles[cles]).factorize()
+        else:
+            codes, groupes = np.zeros(len(feuilles), dtype=int), [()]
+        blocs.append(codes[None, :] == np.arange(len(groupes))[:, None])
+        noeuds += [{"niveau": niveau, **dict(zip(cles, groupe))} for groupe in groupes]
+
+    return pd.DataFrame(noeuds).reindex(columns=["niveau", "magasin", "famille", "produit"]), np.vstack(blocs).astype(float)
+
+def _covariance_retrecie(erreurs):
+    # Schäfer-Strimmer : corrélations rétrécies vers 0 d'autant plus qu'elles sont mal estimées.
+    # Erreurs absentes (jours sans vente, démarrage) comptées nulles ; None si moins de 2 jours
+    erreurs = erreurs[np.isfinite(erreurs).any(axis=1)]
+    T = len(erreurs)
+    if T < 2:
+        return None
+    centrees = np.nan_to_num(erreurs - np.nanmean(erreurs, axis=0))
+    ecarts = np.sqrt((centrees ** 2).sum(axis=0) / (T - 1))
+    ecarts = np.maximum(ecarts, 1e-3 * max(ecarts.max(), 1.0))
+    X = centrees / ecarts
+
+    correlation = X.T @ X / (T - 1)
+    moyenne = X.T @ X / T
+    variance = T / (T - 1) ** 3 * ((X ** 2).T @ (X ** 2) - T * moyenne ** 2)
+    hors_diagonale = ~np.eye(len(correlation), dtype=bool)
+    retrait = variance[hors_diagonale].sum() / max((correlation[hors_diagonale] ** 2).sum(), 1e-12)
+    correlation[hors_diagonale] *= 1 - min(max(retrait, 0.0), 1.0)
+    np.fill_diagonal(correlation, 1.0)
+    return correlation * np.outer(ecarts, ecarts)
+
+def reconcilier(base, S, methode="mint", erreurs=None):
+    # base : prévisions de base (nœuds × jours) dans l'ordre des lignes de S ; erreurs : (T × nœuds).
+    # Retourne les prévisions cohérentes de tous les nœuds, feuilles positives ou nulles
+    base = np.asarray(base, dtype=float)
+    # Nœuds identiques (famille d'un seul produit, magasin unique) : une seule ligne dans l'estimation,
+    # la plus basse (la base d'un produit peut venir d'un moteur unitaire)
+    uniques = np.sort(len(S) - 1 - np.unique(S[::-1], axis=0, return_index=True)[1])
+    S_u, base_u = S[uniques], base[uniques]
+
+    if methode == "ascendante":
+        lignes_feuilles = np.flatnonzero(S_u.sum(axis=1) == 1)
+        feuilles = np.zeros((S.shape[1], base.shape[1]))
+        feuilles[S_u[lignes_feuilles].argmax(axis=1)] = base_u[lignes_feuilles]
+    else:
+        W = _covariance_retrecie(erreurs[:, uniques]) if methode == "mint" and erreurs is not None else None
+        if W is None:
+            # WLS structurelle : variance proportionnelle au nombre de feuilles agrégées
+            W_inv_S = S_u / S_u.sum(axis=1, keepdims=True)
+        else:
+            W_inv_S = np.linalg.solve(W, S_u)
+        feuilles = np.linalg.solve(S_u.T @ W_inv_S, W_inv_S.T @ base_u)
+
+    return S @ np.maximum(feuilles, 0)
+
+def previsions_base_produits(df, dates, moteur, magasin, cle=None):
+    # Prévisions de base des moteurs unitaires pour la réconciliation : {(magasin, produit): Series par date}.
+    # Random Forest : météo neutre (Nuageux) faute de prévision météo pour chaque jour
+    dates = pd.DatetimeIndex(dates)
+    base = {}
+    for produit in df["produit"].unique():
+        if moteur == "random_forest":
+            valeurs = [prediction_ia_random_forest(df, JOURS_SEMAINE[d.dayofweek], "Nuageux", produit, cle, d)
+                       for d in dates]
+            if any(v is None for v in valeurs):
+                continue
+            base[(str(magasin), str(produit))] = pd.Series(valeurs, index=dates, dtype=float)
+        else:
+            derniere = pd.to_datetime(df.loc[df["produit"] == produit, "date"]).max()
+            forecast = prediction_ia_prophet(df, produit, jours=max((dates[-1] - derniere).days, 1), cle=cle,
+                                             moteur=moteur)
+            if forecast is not None:
+                base[(str(magasin), str(produit))] = pd.Series(forecast["yhat"].to_numpy(dtype=float),
+                                                               index=pd.to_datetime(forecast["ds"])).reindex(dates)
+    return base
+
+def previsions_hierarchiques(historiques, jours=7, methode="mint", moteur="numpy", cles=None):
+    # historiques : {magasin: historique}, cles : {magasin: compte} (registre des modèles). Lissage
+    # saisonnier de tous les nœuds en une passe (séries agrégées par S) ; avec moteur "prophet" ou
+    # "random_forest", leur prévision remplace la base des produits, W restant celle du lissage.
+    # Une ligne par nœud et par jour : base (incohérente) et prévision réconciliée
+    colonnes = ["niveau", "magasin", "famille", "produit", "ds", "base", "prevision"]
+    matrices = {str(magasin): _matrice_ventes(df) for magasin, df in historiques.items() if not df.empty}
+    if not matrices:
+        return pd.DataFrame(columns=colonnes)
+    ventes = pd.concat(matrices, axis=1).sort_index().asfreq("D")
+    ventes = ventes.loc[:, ventes.notna().sum() >= 10]
+    if ventes.empty:
+        return pd.DataFrame(columns=colonnes)
+
+    noeuds, S = hierarchie_produits(ventes.columns)
+    Y = ventes.to_numpy(dtype=float)
+    Y_noeuds = np.nan_to_num(Y) @ S.T
+    Y_noeuds[(~np.isnan(Y)).astype(float) @ S.T == 0] = np.nan
+
+    niveau, saison, erreurs = lissage_saisonnier(Y_noeuds)
+    horizons = np.arange(1, jours + 1)
+    base = (niveau + saison[(len(Y_noeuds) + horizons - 1) % PERIODE_SAISON]).T
+    dates = pd.date_range(ventes.index[-1] + pd.Timedelta(days=1), periods=jours, freq="D")
+
+    if moteur != "numpy":
+        base_produits = {}
+        for magasin, df in historiques.items():
+            base_produits.update(previsions_base_produits(df, dates, moteur, magasin, (cles or {}).get(magasin)))
+        premiere_feuille = len(noeuds) - S.shape[1]
+        for i, cle in enumerate(ventes.columns):
+            valeurs = base_produits.get((str(cle[0]), str(cle[1])))
+            if valeurs is not None and valeurs.reindex(dates).notna().all():
+                base[premiere_feuille + i] = valeurs.reindex(dates).to_numpy(dtype=float)
+
+    prevision = reconcilier(base, S, methode, erreurs)
+    resultat = noeuds.loc[noeuds.index.repeat(jours)].reset_index(drop=True)
+    resultat["ds"] = np.tile(dates, len(noeuds))
+    resultat["base"] = np.maximum(base, 0).ravel()
+    resultat["prevision"] = prevision.ravel()
+    return resultat[colonnes]
+
+def _tarifs(produits, couts=None, prix=None):
+    couts = couts or {}
+    prix = prix or {}
+    cout = np.array([couts.get(p, COUT_UNITAIRE_DEFAUT.get(p, 0.5)) for p in produits], dtype=float)
+    prix_vente = np.array([prix.get(p, PRIX_VENTE_DEFAUT.get(p, 2 * c)) for p, c in zip(produits, cout)], dtype=float)
+    return cout, prix_vente
+
+def _perte_normale(k):
+    return np.exp(-0.5 * k ** 2) / np.sqrt(2 * np.pi) - k * (1 - ndtr(k))
+
+def _quantile_normale_asymetrique(p, mode, sigma_bas, sigma_haut):
+    # Normale asymétrique : écart-type sigma_bas sous le mode, sigma_haut au-dessus
+    total = sigma_bas + sigma_haut
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sous = mode + sigma_bas * ndtri(p * total / (2 * sigma_bas))
+        dessus = mode + sigma_haut * ndtri(0.5 + (p * total - sigma_bas) / (2 * sigma_haut))
+    return np.where(total == 0, mode, np.where(p * total <= sigma_bas, sous, dessus))
+
+def _cout_attendu(quantite, mode, sigma_bas, sigma_haut, cout, marge):
+    # Invendus et ventes perdues attendus sous la normale asymétrique, sous forme fermée
+    total = sigma_bas + sigma_haut
+    esperance = mode + np.sqrt(2 / np.pi) * (sigma_haut - sigma_bas)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        perdues_dessus = 2 * sigma_haut ** 2 / total * _perte_normale((quantite - mode) / sigma_haut)
+        invendus_dessous = 2 * sigma_bas ** 2 / total * _perte_normale((mode - quantite) / sigma_bas)
+    perdues_dessus = np.where(sigma_haut > 0, perdues_dessus, 0)
+    invendus_dessous = np.where(sigma_bas > 0, invendus_dessous, 0)
+
+    perdues = np.where(quantite >= mode, perdues_dessus, esperance - quantite + invendus_dessous)
+    perdues = np.where(total > 0, perdues, np.maximum(mode - quantite, 0))
+    invendus = quantite - esperance + perdues
+    return invendus, perdues, cout * invendus + marge * perdues
+
+def optimiser_production(previsions, couts=None, prix=None):
+    # Vendeur de journaux : produire le quantile (prix - coût) / prix de la demande prévue.
+    # Demande normale asymétrique déduite de yhat_lower / yhat_upper ; un seul passage
+    # vectorisé sur (produits, jours).
+    previsions = {produit: f for produit, f in previsions.items() if f is not None}
+    colonnes = ["produit", "ds", "prevision", "ratio_critique", "quantite_optimale", "invendus_attendus",
+                "ventes_perdues_attendues", "cout_attendu", "cout_prevision_seule", "economie"]
+    if not previsions:
+        return pd.DataFrame(columns=colonnes)
+
+    produits = list(previsions)
+
+    moyenne = np.stack([previsions[p]["yhat"].to_numpy(dtype=float) for p in produits])
+    bas = np.stack([previsions[p]["yhat_lower"].to_numpy(dtype=float) for p in produits])
+    haut = np.stack([previsions[p]["yhat_upper"].to_numpy(dtype=float) for p in produits])
+
+    cout, prix_vente = _tarifs(produits, couts, prix)
+    cout, prix_vente = cout[:, None], prix_vente[:, None]
+    marge = np.maximum(prix_vente - cout, 0)
+    ratio = np.clip(marge / np.where(prix_vente > 0, prix_vente, np.inf), 1e-4, 1 - 1e-4)
+
+    sigma_bas = np.maximum(moyenne - bas, 0) / Z_INTERVALLE
+    sigma_haut = np.maximum(haut - moyenne, 0) / Z_INTERVALLE
+
+    quantite = np.maximum(np.round(_quantile_normale_asymetrique(ratio, moyenne, sigma_bas, sigma_haut)), 0)
+    invendus, perdues, cout_optimal = _cout_attendu(quantite, moyenne, sigma_bas, sigma_haut, cout, marge)
+    _, _, cout_prevision = _cout_attendu(np.maximum(np.round(moyenne), 0), moyenne, sigma_bas, sigma_haut,
+                                         cout, marge)
+
+    H = moyenne.shape[1]
+    resultat = pd.DataFrame({
+        "produit": np.repeat(produits, H),
+        "ds": np.concatenate([pd.to_datetime(previsions[p]["ds"]).to_numpy() for p in produits]),
+        "prevision": moyenne.ravel(),
+        "ratio_critique": np.broadcast_to(ratio, moyenne.shape).ravel(),
+        "quantite_optimale": quantite.ravel().astype(int),
+        "invendus_attendus": invendus.ravel(),
+        "ventes_perdues_attendues": perdues.ravel(),
+        "cout_attendu": cout_optimal.ravel(),
+        "cout_prevision_seule": cout_prevision.ravel()
+    })
+    resultat["economie"] = resultat["cout_prevision_seule"] - resultat["cout_attendu"]
+    return resultat[colonnes]
+
+def prevision_horaire(horaires, date_cible, totaux=None, semaines=SEMAINES_PROFIL):
+    # Une ligne par (produit, heure) : prévision, écart-type de l'heure et de la demande cumulée depuis
+    # minuit. `totaux` (produit → prévision du jour, p. ex. Random Forest) recale chaque profil.
+    colonnes = ["produit", "heure", "prevision", "ecart_type", "ecart_type_cumule"]
+    date_cible = pd.Timestamp(date_cible).normalize()
+    dates = pd.to_datetime(horaires["date"])
+    recents = ((dates < date_cible) & (dates >= date_cible - pd.Timedelta(weeks=semaines))
+               & (dates.dt.dayofweek == date_cible.dayofweek)).to_numpy()
+    if not recents.any():
+        return pd.DataFrame(columns=colonnes)
+
+    produits = pd.Categorical(horaires.loc[recents, "produit"].astype(str))
+    ventes = horaires.loc[recents, list(range(HEURES))].to_numpy(dtype=float)
+    semaines_ecart = (date_cible - dates[recents]).dt.days.to_numpy() // 7
+    poids = 0.5 ** ((semaines_ecart - 1) / DEMI_VIE_PROFIL)
+
+    P = len(produits.categories)
+    somme_poids = np.zeros(P)
+    np.add.at(somme_poids, produits.codes, poids)
+    moments = {}
+    for nom, valeurs in [("heure", ventes), ("cumul", ventes.cumsum(axis=1))]:
+        m1, m2 = np.zeros((P, HEURES)), np.zeros((P, HEURES))
+        np.add.at(m1, produits.codes, poids[:, None] * valeurs)
+        np.add.at(m2, produits.codes, poids[:, None] * valeurs ** 2)
+        m1, m2 = m1 / somme_poids[:, None], m2 / somme_poids[:, None]
+        moments[nom] = (m1, np.sqrt(np.maximum(m2 - m1 ** 2, 0)))
+
+    moyenne, ecart = moments["heure"]
+    ecart_cumule = moments["cumul"][1]
+    if totaux:
+        total = moyenne.sum(axis=1)
+        cible = np.array([totaux.get(p, np.nan) for p in produits.categories], dtype=float)
+        facteur = np.where(np.isfinite(cible) & (total > 0), cible / np.where(total > 0, total, 1), 1.0)[:, None]
+        moyenne, ecart, ecart_cumule = moyenne * facteur, ecart * facteur, ecart_cumule * facteur
+
+    return pd.DataFrame({
+        "produit": np.repeat(np.array(produits.categories, dtype=object), HEURES),
+        "heure": np.tile(np.arange(HEURES), P),
+        "prevision": moyenne.ravel(),
+        "ecart_type": ecart.ravel(),
+        "ecart_type_cumule": ecart_cumule.ravel()
+    })[colonnes]
+
+def recommander_fournees(prevision, fournees=FOURNEES_DEFAUT, couts=None, prix=None):
+    # Fournée k : ventes de son heure à la suivante (la première couvre aussi la nuit). Les invendus
+    # d'une fournée servent les suivantes : la production cumulée jusqu'à k est le quantile critique
+    # (prix - coût) / prix de la demande cumulée jusqu'à la fin de sa fenêtre, la fournée la différence.
+    colonnes = ["produit", "fournee", "heures", "ventes_prevues", "quantite"]
+    fournees = sorted(set(int(h) for h in fournees))
+    if prevision.empty or not fournees:
+        return pd.DataFrame(columns=colonnes)
+
+    produits = list(pd.unique(prevision["produit"]))
+    forme = (len(produits), HEURES)
+    moyenne = prevision["prevision"].to_numpy(dtype=float).reshape(forme)
+    ecart_cumule = prevision["ecart_type_cumule"].to_numpy(dtype=float).reshape(forme)
+
+    fins = np.array(fournees[1:] + [HEURES]) - 1
+    cumul = moyenne.cumsum(axis=1)[:, fins]
+    cout, prix_vente = _tarifs(produits, couts, prix)
+    ratio = np.clip(np.maximum(prix_vente - cout, 0) / np.where(prix_vente > 0, prix_vente, np.inf), 1e-4, 1 - 1e-4)
+    objectif = np.maximum(np.round(cumul + ecart_cumule[:, fins] * ndtri(ratio)[:, None]), 0)
+    objectif = np.maximum.accumulate(objectif, axis=1)
+
+    K = len(fournees)
+    return pd.DataFrame({
+        "produit": np.repeat(produits, K),
+        "fournee": np.tile([f"{h:02d}h" for h in fournees], len(produits)),
+        "heures": np.tile([f"{h:02d}h-{f + 1:02d}h" for h, f in zip(fournees, fins)], len(produits)),
+        "ventes_prevues": np.diff(cumul, axis=1, prepend=0).ravel(),
+        "quantite": np.diff(objectif, axis=1, prepend=0).ravel().astype(int)
+    })[colonnes]
+
+def plan_production_actuel(df):
+    # Production habituelle moyenne par produit, jour et météo : le plan de référence à modifier
+    plan = df.groupby(["produit", "jour", "meteo"], observed=True)["production_habituelle"].mean()
+    return plan.round().reset_index(name="production")
+
+def _reservoirs_demande(df, cellules):
+    ventes = df["ventes_moyennes"].to_numpy(dtype=float)
+    niveaux = [
+        df.groupby(["produit", "jour", "meteo"], observed=True).indices,
+        df.groupby(["produit", "jour"], observed=True).indices,
+        df.groupby("produit", observed=True).indices
+    ]
+
+    reservoirs = []
+    for produit, jour, meteo in cellules:
+        for niveau, cle in zip(niveaux, [(produit, jour, meteo), (produit, jour), produit]):
+            positions = niveau.get(cle)
+            if positions is not None and len(positions) >= SIMULATION_MIN_ECHANTILLONS:
+                break
+        reservoirs.append(ventes[positions] if positions is not None and len(positions) else np.array([np.nan]))
+    return reservoirs
+
+def _simuler_lot(valeurs, decalages, tailles, productions, cout, marge, scenarios, graine):
+    # Un tirage de demande par cellule et par scénario, partagé par tous les plans (mêmes aléas)
+    rng = np.random.default_rng(graine)
+    demande = valeurs[decalages + (rng.random((scenarios, len(tailles)), dtype=np.float32) * tailles).astype(np.int32)]
+
+    # fmax ignore les NaN : une cellule absente du plan (ou sans historique) compte pour zéro
+    ecart = productions[:, None, :] - demande[None]
+    invendus = np.fmax(ecart, 0)
+    perdues = np.fmax(-ecart, 0)
+
+    return {
+        "gaspillage": invendus.sum(axis=2),
+        "cout_gaspillage": (invendus * cout).sum(axis=2),
+        "ventes_perdues": perdues.sum(axis=2),
+        "marge_perdue": (perdues * marge).sum(axis=2),
+        "invendus_cellule": invendus.sum(axis=1),
+        "perdues_cellule": perdues.sum(axis=1)
+    }
+
+def simuler_plans(df, plans, scenarios=SIMULATION_SCENARIOS, couts=None, prix=None, processus=None, graine=0):
+    # plans : {nom: DataFrame produit / jour / meteo / production}. Chaque scénario tire une demande
+    # par cellule ; les totaux portent sur un jour de chaque cellule du plan.
+    noms = list(plans)
+    cellules = list(dict.fromkeys(
+        (r.produit, r.jour, r.meteo) for plan in plans.values() for r in plan.itertuples(index=False)
+    ))
+    index = {cellule: i for i, cellule in enumerate(cellules)}
+
+    productions = np.full((len(noms), len(cellules)), np.nan)
+    for k, nom in enumerate(noms):
+        plan = plans[nom]
+        positions = [index[c] for c in zip(plan["produit"], plan["jour"], plan["meteo"])]
+        productions[k, positions] = np.maximum(plan["production"].to_numpy(dtype=float), 0)
+
+    reservoirs = _reservoirs_demande(df, cellules)
+    tailles = np.array([len(r) for r in reservoirs])
+    decalages = np.cumsum(tailles) - tailles
+    valeurs = np.concatenate(reservoirs).astype(np.float32)
+
+    cout, prix_vente = _tarifs([c[0] for c in cellules], couts, prix)
+    marge = np.maximum(prix_vente - cout, 0)
+    cout, marge, productions = cout.astype(np.float32), marge.astype(np.float32), productions.astype(np.float32)
+
+    lots = [SIMULATION_LOT] * (scenarios // SIMULATION_LOT) + ([scenarios % SIMULATION_LOT] if scenarios % SIMULATION_LOT else [])
+    graines = np.random.SeedSequence(graine).spawn(len(lots))
+    taches = [(valeurs, decalages, tailles, productions, cout, marge, n, g) for n, g in zip(lots, graines)]
+
+    # fork uniquement, comme le backtest : spawn/forkserver ré-exécuteraient le script Streamlit
+    if processus == 1 or len(taches) == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        resultats = [_simuler_lot(*args) for args in taches]
+    else:
+        with ProcessPoolExecutor(max_workers=processus, mp_context=multiprocessing.get_context("fork")) as pool:
+            resultats = list(pool.map(_simuler_lot, *zip(*taches)))
+
+    totaux = {m: np.concatenate([r[m] for r in resultats], axis=1)
+              for m in ["gaspillage", "cout_gaspillage", "ventes_perdues", "marge_perdue"]}
+    cout_total = totaux["cout_gaspillage"] + totaux["marge_perdue"]
+
+    resume = pd.DataFrame({
+        "plan": noms,
+        "production": np.nansum(productions, axis=1),
+        **{m: valeurs_m.mean(axis=1) for m, valeurs_m in totaux.items()},
+        "cout_total": cout_total.mean(axis=1),
+        "cout_total_p05": np.percentile(cout_total, 5, axis=1),
+        "cout_total_p95": np.percentile(cout_total, 95, axis=1),
+        "proba_rupture": (totaux["ventes_perdues"] > 0).mean(axis=1)
+    })
+
+    invendus = sum(r["invendus_cellule"] for r in resultats) / scenarios
+    perdues = sum(r["perdues_cellule"] for r in resultats) / scenarios
+    details = pd.DataFrame([
+        {"plan": nom, "produit": p, "jour": j, "meteo": m, "production": productions[k, i],
+         "gaspillage": invendus[k, i], "ventes_perdues": perdues[k, i],
+         "demande_moyenne": float(np.nanmean(reservoirs[i]))}
+        for k, nom in enumerate(noms) for i, (p, j, m) in enumerate(cellules) if not np.isnan(productions[k, i])
+    ])
+
+    return resume, details, pd.DataFrame(cout_total.T, columns=noms)
+
+def _predire_pli(apprentissage, test, methode):
+    if methode == "regle":
+        base = apprentissage.groupby("produit", observed=True)["ventes_moyennes"].mean()
+        return (test["produit"].map(base).astype(float).to_numpy()
+                * test["jour"].map(COEF_JOUR).astype(float).to_numpy()
+                * test["meteo"].map(COEF_METEO).astype(float).to_numpy())
+
+    prediction = np.full(len(test), np.nan)
+
+    if methode == "random_forest":
+        # Ventes du pli masquées : les retards et moyennes glissantes ne voient que l'apprentissage
+        features = calculer_features(pd.concat(
+            [apprentissage, test.assign(ventes_moyennes=np.nan)], ignore_index=True
+        )).iloc[len(apprentissage):].reset_index(drop=True)
+        production = COLONNES_FEATURES.index("production_habituelle")
+
+        for produit, lignes in test.groupby("produit", observed=True):
+            model = mettre_a_jour_modele_rf(apprentissage, produit)
+            if model is None:
+                continue
+            X = features.loc[lignes.index, COLONNES_FEATURES].to_numpy(dtype=float)
+            X[:, production] = apprentissage.loc[apprentissage["produit"] == produit, "production_habituelle"].mean()
+            prediction[lignes.index.to_numpy()] = model.predict(X)
+        return prediction
+
+    dates_test = pd.to_datetime(test["date"])
+    jours = (dates_test.max() - pd.to_datetime(apprentissage["date"]).max()).days
+    previsions = previsions_produits(apprentissage, produits=test["produit"].unique(), jours=jours, moteur=methode)
+    for produit, forecast in previsions.items():
+        if forecast is None:
+            continue
+        yhat = pd.Series(forecast["yhat"].to_numpy(), index=pd.to_datetime(forecast["ds"]).to_numpy())
+        lignes = (test["produit"] == produit).to_numpy()
+        prediction[lignes] = yhat.reindex(dates_test[lignes].to_numpy()).to_numpy()
+    return prediction
+
+def _evaluer_pli(apprentissage, test, methode):
+    test = test.reset_index(drop=True)
+    prediction = _predire_pli(apprentissage, test, methode)
+    reel = test["ventes_moyennes"].to_numpy(dtype=float)
+    valide = ~np.isnan(prediction)
+
+    production = np.round(np.maximum(prediction[valide], 0))
+    cout = test["produit"].map(COUT_UNITAIRE_DEFAUT).astype(float).fillna(0.5).to_numpy()[valide]
+    invendus = np.maximum(production - reel[valide], 0)
+
+    return {
+        "n": int(valide.sum()),
+        "somme_erreurs": float(np.abs(prediction[valide] - reel[valide]).sum()),
+        "cout_gaspillage": float((invendus * cout).sum()),
+        "ruptures": float(np.maximum(reel[valide] - production, 0).sum())
+    }
+
+def _fichier_cache_backtest(cle):
+    return os.path.join(DOSSIER_BACKTESTS, f"{quote(cle, safe='')}.json")
+
+def backtester(df, cle=None, plis=8, horizon=7, apprentissage_min=28, methodes=None, processus=None):
+    if methodes is None:
+        methodes = METHODES_BACKTEST
+    if df.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    df = df.assign(_date=pd.to_datetime(df["date"])).sort_values("_date", kind="stable").reset_index(drop=True)
+    dates = df["_date"].to_numpy()
+    premiere = df["_date"].min()
+    derniere = df["_date"].max()
+
+    origines = pd.date_range(premiere + pd.Timedelta(days=apprentissage_min),
+                             derniere - pd.Timedelta(days=horizon - 1), freq=f"{horizon}D")[-plis:]
+    if len(origines) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Empreinte cumulée des lignes : la clé d'un pli change si ses données changent
+    empreintes = np.cumsum(pd.util.hash_pandas_object(df.drop(columns="_date"), index=False).to_numpy())
+
+    cache = {}
+    if cle is not None and os.path.exists(_fichier_cache_backtest(cle)):
+        with open(_fichier_cache_backtest(cle), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    plis_a_calculer = {}
+    resultats = {}
+    for origine in origines:
+        fin = origine + pd.Timedelta(days=horizon)
+        idx_origine = int(np.searchsorted(dates, origine.to_datetime64(), side="left"))
+        idx_fin = int(np.searchsorted(dates, fin.to_datetime64(), side="left"))
+        if idx_origine == 0 or idx_fin == idx_origine:
+            continue
+        for methode in methodes:
+            cle_pli = f"{methode}|{origine:%Y-%m-%d}|{horizon}|{idx_fin}-{int(empreintes[idx_fin - 1]):x}"
+            if cle_pli in cache:
+                resultats[cle_pli] = cache[cle_pli]
+            else:
+                plis_a_calculer[cle_pli] = (idx_origine, idx_fin, methode)
+
+    colonnes = [c for c in df.columns if c != "_date"]
+    if plis_a_calculer:
+        taches = {
+            cle_pli: (df.iloc[:debut][colonnes], df.iloc[debut:fin][colonnes], methode)
+            for cle_pli, (debut, fin, methode) in plis_a_calculer.items()
+        }
+        # fork uniquement : spawn/forkserver ré-exécuteraient le script Streamlit (__main__)
+        if processus == 1 or "fork" not in multiprocessing.get_all_start_methods():
+            for cle_pli, args in taches.items():
+                resultats[cle_pli] = _evaluer_pli(*args)
+        else:
+            with ProcessPoolExecutor(max_workers=processus, mp_context=multiprocessing.get_context("fork")) as pool:
+                futures = {cle_pli: pool.submit(_evaluer_pli, *args) for cle_pli, args in taches.items()}
+                for cle_pli, future in futures.items():
+                    resultats[cle_pli] = future.result()
+
+        if cle is not None:
+            os.makedirs(DOSSIER_BACKTESTS, exist_ok=True)
+            tmp = f"{_fichier_cache_backtest(cle)}.{os.getpid()}.tmp"
+            premiere_origine = f"{origines[0]:%Y-%m-%d}"
+            cache = {cle_pli: res for cle_pli, res in {**cache, **resultats}.items()
+                     if cle_pli.split("|")[1] >= premiere_origine}
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cache, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, _fichier_cache_backtest(cle))
+
+    details = pd.DataFrame([
+        {"methode": cle_pli.split("|")[0], "origine": cle_pli.split("|")[1], **res}
+        for cle_pli, res in resultats.items()
+    ])
+    resume = details.groupby("methode").agg(
+        plis=("origine", "nunique"),
+        n=("n", "sum"),
+        somme_erreurs=("somme_erreurs", "sum"),
+        cout_gaspillage=("cout_gaspillage", "sum"),
+        ruptures=("ruptures", "sum")
+    )
+    resume["mae"] = resume["somme_erreurs"] / resume["n"].where(resume["n"] > 0)
+    resume = resume.drop(columns="somme_erreurs").reindex(methodes).dropna(how="all").reset_index()
+
+    return resume.sort_values("cout_gaspillage"), details.sort_values(["origine", "methode"])
@@ -0,0 +1,135 @@
+from datetime import timedelta
+import pandas as pd
+import numpy as np
+
+from boulangerie_donnees import JOURS_SEMAINE, charger_historique_partage, version_historique
+
+# Index de sommes cumulées de l'historique : calendrier dense (un jour par ligne, un produit par
+# colonne). La somme d'une série sur une plage de dates est la différence de deux lignes du
+# cumul ; les sommes par jour de la semaine utilisent un cumul de 7 en 7 jours et le maximum une
+# table clairsemée (sparse table). Toute plage coûte O(produits), quelle que soit sa longueur.
+SERIES_INDEX = ["gaspillage_evite", "cout_gaspillage", "ventes_moyennes"]
+DECALAGES_COMPARAISON = {
+    "Période précédente": None,
+    "Mois précédent": pd.DateOffset(months=1),
+    "Année précédente": pd.DateOffset(years=1)
+}
+
+_index = {}
+
+def construire_index(df):
+    if df.empty:
+        return None
+
+    dates = df["date"].dt.normalize()
+    debut = dates.min()
+    jours = (dates.max() - debut).days + 1
+    produits = pd.Categorical(df["produit"].astype(str))
+    lignes = (dates - debut).dt.days.to_numpy()
+    colonnes = produits.codes
+
+    index = {"debut": debut, "jours": jours, "produits": list(produits.categories),
+             "valeurs": {}, "cumul": {}, "cumul7": {}}
+    for serie in SERIES_INDEX + ["lignes"]:
+        matrice = np.zeros((jours, len(produits.categories)))
+        valeurs = 1.0 if serie == "lignes" else df[serie].to_numpy(dtype=float)
+        np.add.at(matrice, (lignes, colonnes), valeurs)
+        index["valeurs"][serie] = matrice
+        index["cumul"][serie] = np.vstack([np.zeros((1, matrice.shape[1])), matrice.cumsum(axis=0)])
+        # cumul7[t + 7] = valeur du jour t + cumul7[t] : somme des jours t, t-7, t-14...
+        semaines = -(-jours // 7)
+        pas7 = np.zeros((semaines * 7, matrice.shape[1]))
+        pas7[:jours] = matrice
+        pas7 = pas7.reshape(semaines, 7, -1).cumsum(axis=0).reshape(semaines * 7, -1)[:jours]
+        index["cumul7"][serie] = np.vstack([np.zeros((7, matrice.shape[1])), pas7])
+
+    # Table clairsemée du maximum journalier par produit (jours sans ligne exclus)
+    niveau = np.where(index["valeurs"]["lignes"] > 0, index["valeurs"]["gaspillage_evite"], -np.inf)
+    index["maximum"] = [niveau]
+    largeur = 1
+    while 2 * largeur <= jours:
+        niveau = np.maximum(niveau[:-largeur], niveau[largeur:])
+        index["maximum"].append(niveau)
+        largeur *= 2
+    return index
+
+def index_historique(fichier):
+    # Reconstruit à chaque nouvelle version de l'historique, partagé par les sessions du processus
+    version = version_historique(fichier)
+    courant = _index.get(fichier)
+    if courant is None or courant[0] != version:
+        courant = (version, construire_index(charger_historique_partage(fichier)))
+        _index[fichier] = courant
+    return courant[1]
+
+def _bornes(index, debut, fin):
+    # Plage [debut, fin] (dates incluses) → lignes [a, b) du calendrier, bornée aux données
+    a = (pd.Timestamp(debut).normalize() - index["debut"]).days
+    b = (pd.Timestamp(fin).normalize() - index["debut"]).days + 1
+    return min(max(a, 0), index["jours"]), min(max(b, 0), index["jours"])
+
+def _colonnes(index, produits):
+    if produits is None:
+        return np.arange(len(index["produits"]))
+    positions = {p: i for i, p in enumerate(index["produits"])}
+    return np.array([positions[str(p)] for p in produits if str(p) in positions], dtype=int)
+
+def agreger_periode(index, debut, fin, produits=None):
+    vide = {serie: 0.0 for serie in SERIES_INDEX + ["lignes"]}
+    if index is None:
+        return {**vide, "moyenne_gaspillage": np.nan, "max_gaspillage": np.nan,
+                "par_produit": pd.DataFrame(columns=SERIES_INDEX), "par_jour": pd.DataFrame(columns=SERIES_INDEX + ["lignes"])}
+
+    a, b = _bornes(index, debut, fin)
+    colonnes = _colonnes(index, produits)
+    par_produit = pd.DataFrame({
+        serie: index["cumul"][serie][b, colonnes] - index["cumul"][serie][a, colonnes]
+        for serie in SERIES_INDEX + ["lignes"]
+    }, index=pd.Index(np.array(index["produits"], dtype=object)[colonnes], name="produit"))
+    resultat = {serie: float(par_produit[serie].sum()) for serie in SERIES_INDEX + ["lignes"]}
+
+    resultat["moyenne_gaspillage"] = (resultat["gaspillage_evite"] / resultat["lignes"]
+                                      if resultat["lignes"] else np.nan)
+    if b > a and len(colonnes):
+        niveau = int(np.log2(b - a))
+        table = index["maximum"][niveau]
+        maximum = max(table[a, colonnes].max(), table[b - 2 ** niveau, colonnes].max())
+        resultat["max_gaspillage"] = float(maximum) if np.isfinite(maximum) else np.nan
+    else:
+        resultat["max_gaspillage"] = np.nan
+
+    # Jours de la semaine : pour chaque résidu modulo 7, premier et dernier jour de la plage
+    premiers = np.arange(a, min(a + 7, b))
+    derniers = premiers + (b - 1 - premiers) // 7 * 7
+    par_jour = pd.DataFrame({
+        serie: (index["cumul7"][serie][derniers + 7][:, colonnes] - index["cumul7"][serie][premiers][:, colonnes]).sum(axis=1)
+        for serie in SERIES_INDEX + ["lignes"]
+    }, index=np.array(JOURS_SEMAINE)[(index["debut"].dayofweek + premiers) % 7])
+
+    resultat["par_produit"] = par_produit[par_produit["lignes"] > 0].drop(columns="lignes")
+    resultat["par_jour"] = par_jour.reindex([j for j in JOURS_SEMAINE if j in par_jour.index])
+    return resultat
+
+def serie_quotidienne(index, debut, fin, produits=None):
+    # Totaux par jour des produits choisis sur la plage (jours sans ligne exclus)
+    if index is None:
+        return pd.DataFrame(columns=["date"] + SERIES_INDEX)
+    a, b = _bornes(index, debut, fin)
+    colonnes = _colonnes(index, produits)
+    serie = pd.DataFrame({s: index["valeurs"][s][a:b, colonnes].sum(axis=1) for s in SERIES_INDEX + ["lignes"]})
+    serie.insert(0, "date", pd.date_range(index["debut"] + timedelta(days=a), periods=b - a, freq="D"))
+    return serie[serie["lignes"] > 0].drop(columns="lignes").reset_index(drop=True)
+
+def periode_precedente(debut, fin, comparaison="Période précédente"):
+    debut, fin = pd.Timestamp(debut).normalize(), pd.Timestamp(fin).normalize()
+    decalage = DECALAGES_COMPARAISON[comparaison]
+    if decalage is None:
+        duree = fin - debut + timedelta(days=1)
+        return debut - duree, fin - duree
+    # Une fin de mois reste une fin de mois (30/09 → 31/08, 31/03 → 28/02)
+    fin_avant = fin - decalage + pd.offsets.MonthEnd(0) if fin.is_month_end else fin - decalage
+    return debut - decalage, fin_avant
+
+def comparer_periodes(index, debut, fin, produits=None, comparaison="Période précédente"):
+    avant = periode_precedente(debut, fin, comparaison)
+    return agreger_periode(index, debut, fin, produits), agreger_periode(index, *avant, produits), avant
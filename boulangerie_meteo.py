@@ -0,0 +1,216 @@
+import os
+import sqlite3
+import zlib
+from datetime import date, datetime, timedelta
+import pandas as pd
+import numpy as np
+import requests
+
+from boulangerie_donnees import cles_historique
+from boulangerie_etat import charger_document, pointeur_historique
+
+# Météo locale partagée par tous les comptes : une ligne par (ville, date), remplie par
+# plages contiguës de jours manquants. Les jours récents (archive pas encore consolidée)
+# et les prévisions sont provisoires et re-téléchargés au plus une fois par jour.
+FICHIER_METEO = "meteo.db"
+VILLE_DEFAUT = "Paris"
+FOURNISSEUR_METEO_DEFAUT = os.environ.get("BOULANGERIE_METEO_FOURNISSEUR", "open-meteo")
+METEO_JOURS_PREVISION = 7
+METEO_DELAI_ARCHIVE = 5
+METEO_LOT_JOURS = 366
+METEO_FUSION_TROUS = 7
+
+URL_GEOCODAGE = "https://geocoding-api.open-meteo.com/v1/search"
+URL_ARCHIVE = "https://archive-api.open-meteo.com/v1/archive"
+URL_PREVISION = "https://api.open-meteo.com/v1/forecast"
+VARIABLES_JOURNALIERES = "temperature_2m_mean,precipitation_sum,weather_code"
+
+SQL_TABLE_METEO = """
+CREATE TABLE IF NOT EXISTS meteo (
+    ville TEXT NOT NULL,
+    date TEXT NOT NULL,
+    temperature REAL,
+    precipitation REAL,
+    condition TEXT,
+    provisoire INTEGER,
+    maj_le TEXT,
+    PRIMARY KEY (ville, date)
+)
+"""
+SQL_UPSERT_METEO = (
+    "INSERT INTO meteo (ville, date, temperature, precipitation, condition, provisoire, maj_le) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(ville, date) DO UPDATE SET "
+    "temperature = excluded.temperature, precipitation = excluded.precipitation, condition = excluded.condition, "
+    "provisoire = excluded.provisoire, maj_le = excluded.maj_le"
+)
+
+_session = None
+_coordonnees = {}
+
+def session_http():
+    # Une session (connexions keep-alive) pour tous les appels du processus
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers["User-Agent"] = "boulangerie-predict"
+    return _session
+
+def condition_meteo(codes):
+    # Codes météo WMO → catégories de l'application
+    codes = np.asarray(codes, dtype=float)
+    return np.select(
+        [codes <= 1, codes <= 48, ((codes >= 71) & (codes <= 77)) | (codes == 85) | (codes == 86)],
+        ["Soleil", "Nuageux", "Neige"],
+        "Pluie"
+    )
+
+def _coordonnees_ville(ville, session):
+    if ville not in _coordonnees:
+        reponse = session.get(URL_GEOCODAGE, params={"name": ville, "count": 1, "language": "fr"}, timeout=10)
+        reponse.raise_for_status()
+        resultats = reponse.json().get("results")
+        if not resultats:
+            raise ValueError(f"Ville inconnue : {ville}")
+        _coordonnees[ville] = (resultats[0]["latitude"], resultats[0]["longitude"])
+    return _coordonnees[ville]
+
+def fournisseur_open_meteo(ville, debut, fin, session):
+    latitude, longitude = _coordonnees_ville(ville, session)
+    limite_archive = date.today() - timedelta(days=METEO_DELAI_ARCHIVE)
+
+    morceaux = []
+    for url, d, f in [(URL_ARCHIVE, debut, min(fin, limite_archive)),
+                      (URL_PREVISION, max(debut, limite_archive + timedelta(days=1)), fin)]:
+        if d > f:
+            continue
+        reponse = session.get(url, params={
+            "latitude": latitude, "longitude": longitude,
+            "start_date": f"{d:%Y-%m-%d}", "end_date": f"{f:%Y-%m-%d}",
+            "daily": VARIABLES_JOURNALIERES, "timezone": "Europe/Paris"
+        }, timeout=30)
+        reponse.raise_for_status()
+        journalier = reponse.json()["daily"]
+        morceaux.append(pd.DataFrame({
+            "date": pd.to_datetime(journalier["time"]),
+            "temperature": pd.to_numeric(pd.Series(journalier["temperature_2m_mean"]), errors="coerce"),
+            "precipitation": pd.to_numeric(pd.Series(journalier["precipitation_sum"]), errors="coerce"),
+            "code": pd.to_numeric(pd.Series(journalier["weather_code"]), errors="coerce")
+        }))
+
+    df = pd.concat(morceaux, ignore_index=True).dropna(subset=["temperature"])
+    df["condition"] = condition_meteo(df["code"].fillna(3))
+    return df.drop(columns="code")
+
+def fournisseur_simule(ville, debut, fin, session=None):
+    # Météo déterministe par ville et date, sans réseau (tests, démo hors ligne)
+    dates = pd.date_range(debut, fin, freq="D")
+    rng = np.random.default_rng(zlib.crc32(f"{ville}|{debut:%Y-%m-%d}".encode()))
+    saison = np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 200) / 365)
+    temperature = 12 + 9 * saison + rng.normal(0, 3, len(dates))
+    precipitation = np.where(rng.random(len(dates)) < 0.35, rng.gamma(1.5, 3, len(dates)), 0.0)
+    condition = np.where(precipitation > 1, np.where(temperature < 1, "Neige", "Pluie"),
+                         np.where(rng.random(len(dates)) < 0.5, "Soleil", "Nuageux"))
+    return pd.DataFrame({"date": dates, "temperature": temperature.round(1),
+                         "precipitation": precipitation.round(1), "condition": condition})
+
+FOURNISSEURS_METEO = {
+    "open-meteo": fournisseur_open_meteo,
+    "simule": fournisseur_simule
+}
+
+def _connexion_meteo(fichier):
+    con = sqlite3.connect(fichier, timeout=30)
+    con.execute(SQL_TABLE_METEO)
+    return con
+
+def _plages(dates):
+    # Jours manquants regroupés en plages ; des trous courts sont comblés pour limiter les appels
+    if len(dates) == 0:
+        return []
+    coupures = np.flatnonzero(np.diff(dates.values) > np.timedelta64(METEO_FUSION_TROUS, "D")) + 1
+    plages = []
+    for morceau in np.split(dates, coupures):
+        debut, fin = morceau[0].date(), morceau[-1].date()
+        while debut <= fin:
+            fin_lot = min(fin, debut + timedelta(days=METEO_LOT_JOURS - 1))
+            plages.append((debut, fin_lot))
+            debut = fin_lot + timedelta(days=1)
+    return plages
+
+def completer_meteo(ville, dates, fournisseur=None, fichier=FICHIER_METEO, session=None):
+    fournisseur = FOURNISSEURS_METEO[fournisseur or FOURNISSEUR_METEO_DEFAUT]
+    dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(list(dates)))).normalize().unique().sort_values()
+    aujourd_hui = f"{date.today():%Y-%m-%d}"
+
+    con = _connexion_meteo(fichier)
+    try:
+        connues = pd.read_sql_query(
+            "SELECT date FROM meteo WHERE ville = ? AND (provisoire = 0 OR maj_le >= ?)",
+            con, params=[ville, aujourd_hui]
+        )
+        manquantes = dates.difference(pd.to_datetime(connues["date"]))
+
+        ajoutes = 0
+        limite_archive = pd.Timestamp(date.today() - timedelta(days=METEO_DELAI_ARCHIVE))
+        for debut, fin in _plages(manquantes):
+            df = fournisseur(ville, debut, fin, session or session_http())
+            maintenant = datetime.now().isoformat(timespec="seconds")
+            with con:
+                con.executemany(SQL_UPSERT_METEO, zip(
+                    [ville] * len(df), df["date"].dt.strftime("%Y-%m-%d"), df["temperature"].astype(float),
+                    df["precipitation"].astype(float), df["condition"], (df["date"] > limite_archive).astype(int),
+                    [maintenant] * len(df)
+                ))
+            ajoutes += len(df)
+    finally:
+        con.close()
+    return ajoutes
+
+def meteo_locale(ville, dates=None, fichier=FICHIER_METEO):
+    colonnes = ["date", "temperature", "precipitation", "condition"]
+    if not os.path.exists(fichier):
+        return pd.DataFrame(columns=colonnes)
+
+    con = _connexion_meteo(fichier)
+    try:
+        df = pd.read_sql_query(f"SELECT {', '.join(colonnes)} FROM meteo WHERE ville = ? ORDER BY date", con,
+                               params=[ville])
+    finally:
+        con.close()
+    df["date"] = pd.to_datetime(df["date"])
+    if dates is not None:
+        df = df[df["date"].isin(pd.to_datetime(pd.Series(list(dates))).dt.normalize())]
+    return df.reset_index(drop=True)
+
+def joindre_meteo(df, ville, fichier=FICHIER_METEO):
+    # Ajoute température et précipitations à l'historique par jointure locale sur la date
+    meteo = meteo_locale(ville, fichier=fichier)[["date", "temperature", "precipitation"]]
+    return df.merge(meteo, on="date", how="left")
+
+def meteo_du_jour(ville, fournisseur=None, fichier=FICHIER_METEO):
+    completer_meteo(ville, [date.today()], fournisseur=fournisseur, fichier=fichier)
+    aujourd_hui = meteo_locale(ville, [date.today()], fichier=fichier)
+    return None if aujourd_hui.empty else aujourd_hui.iloc[0].to_dict()
+
+def rafraichir_meteo(fichier_users="users.json", fournisseur=None, fichier=FICHIER_METEO):
+    # Tâche quotidienne : jours de l'historique de chaque compte et prochains jours, ville par ville
+    users = charger_document(fichier_users)
+
+    dates_par_ville = {}
+    prochains_jours = pd.date_range(date.today(), periods=METEO_JOURS_PREVISION + 1, freq="D")
+    for email, info in users.items():
+        ville = info.get("ville") or VILLE_DEFAUT
+        dates = pd.DatetimeIndex(cles_historique(pointeur_historique(email))["date"])
+        dates_par_ville[ville] = dates_par_ville.get(ville, pd.DatetimeIndex([])).union(dates)
+    if not dates_par_ville:
+        dates_par_ville[VILLE_DEFAUT] = pd.DatetimeIndex([])
+
+    rapport = {}
+    session = session_http()
+    for ville, dates in dates_par_ville.items():
+        try:
+            rapport[ville] = completer_meteo(ville, dates.union(prochains_jours), fournisseur=fournisseur,
+                                             fichier=fichier, session=session)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            rapport[ville] = f"erreur : {e}"
+    return rapport
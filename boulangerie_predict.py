@@ -9,16 +9,33 @@ import plotly.graph_objects as go
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from io import BytesIO
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import pyotp
 import qrcode
-from prophet import Prophet
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
 import requests
 import base64
+from boulangerie_donnees import (
+    JOURS_SEMAINE, charger_historique, charger_historique_partage, version_historique, initialiser_historique, upsert_historique, importer_ventes,
+    lister_anomalies, marquer_anomalies_vues, importer_ventes_horaires, charger_ventes_horaires
+)
+from boulangerie_meteo import VILLE_DEFAUT, meteo_du_jour, completer_meteo
+from boulangerie_features import mettre_a_jour_features
+from boulangerie_index import (
+    DECALAGES_COMPARAISON, index_historique, agreger_periode, serie_quotidienne, comparer_periodes
+)
+from boulangerie_taches import soumettre_tache, etat_tache, resultat_tache
+from boulangerie_export import JEUX_EXPORT, FORMATS_EXPORT
+from boulangerie_etat import (
+    DUREE_SESSION, charger_document, sauvegarder_document, creer_session, lire_session, supprimer_session,
+    pointeur_historique, generer_cle_api, cle_api_existe
+)
+from boulangerie_ia import (
+    COEF_JOUR, COEF_METEO, COUT_UNITAIRE_DEFAUT, PRIX_VENTE_DEFAUT,
+    previsions_produits, optimiser_production, plan_production_actuel, simuler_plans, mettre_a_jour_modele_rf,
+    predire_random_forest, version_modele_rf, charger_modele,
+    calibrer_coefficients, coefficients_produit, SEMAINES_PROFIL, FOURNEES_DEFAUT, prevision_horaire, recommander_fournees,
+    METHODES_RECONCILIATION, previsions_hierarchiques
+)
 
 st.set_page_config(
     page_title="Boulangerie Pro - Solution IA",
@@ -34,6 +51,16 @@ FICHIER_ABONNEMENTS = "abonnements.json"
 FICHIER_NOTIFICATIONS = "notifications.json"
 FICHIER_ROLES = "roles.json"
 FICHIER_STOCKS = "stocks.json"
+# Un tableau de bord affiche 4 figures et l'analyse 2 par produit : 16 entrées couvrent les vues
+# courantes de quelques comptes. La plus lourde (gaspillage par jour, un point par ligne) pèse environ
+# 90 Ko de JSON par an et par tranche de 10 produits : ~1 Mo pour 5 ans et 20 produits, soit au plus
+# une quinzaine de Mo par processus. Le TTL libère les versions d'historique qui ne sont plus lues.
+FIGURES_MAX = 16
+FIGURES_TTL = 3600
+
+PERIODES_GLISSANTES = {"7 derniers jours": 7, "30 derniers jours": 30, "3 derniers mois": 90}
+
+LIBELLES_SERIES = {"ventes_moyennes": "Volume de ventes", "gaspillage_evite": "Gaspillage"}
 
 PLANS_TARIFS = {
     "Gratuit": {
@@ -92,15 +119,12 @@ ROLES_PERMISSIONS = {
     "Employe": ["dashboard", "predictions"]
 }
 
+# Documents de comptes dans le backend d'état (fichiers locaux ou clé-valeur partagée entre répliques)
 def charger_json(fichier, defaut=None):
-    if os.path.exists(fichier):
-        with open(fichier, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return defaut if defaut else {}
+    return charger_document(fichier, defaut)
 
 def sauvegarder_json(fichier, data):
-    with open(fichier, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    sauvegarder_document(fichier, data)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -124,7 +148,7 @@ def verifier_limite_plan(email, action):
     plan_details = PLANS_TARIFS[plan_user["plan"]]
     
     if action == "predictions":
-        historique = pd.read_csv(get_fichier_histo(email)) if os.path.exists(get_fichier_histo(email)) else pd.DataFrame()
+        historique = charger_historique_partage(get_fichier_histo(email))
         if plan_details["predictions_max"] != -1:
             if len(historique) >= plan_details["predictions_max"]:
                 return False, f"Limite de {plan_details['predictions_max']} prédictions atteinte. Passez à un plan supérieur."
@@ -132,25 +156,9 @@ def verifier_limite_plan(email, action):
     return True, ""
 
 def envoyer_email(destinataire, sujet, contenu):
-    try:
-        EMAIL_SENDER = "votre-email@gmail.com"
-        EMAIL_PASSWORD = "votre-mot-de-passe-app"
-        
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_SENDER
-        msg['To'] = destinataire
-        msg['Subject'] = sujet
-        
-        msg.attach(MIMEText(contenu, 'html'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except:
-        return False
+    # Envoi SMTP par un worker ; un même message n'est envoyé qu'une fois par jour
+    return soumettre_tache("email", destinataire, str(date.today()),
+                           destinataire=destinataire, sujet=sujet, contenu=contenu)
 
 def generer_qr_2fa(email):
     secret = pyotp.random_base32()
@@ -159,6 +167,8 @@ def generer_qr_2fa(email):
         users[email]["2fa_secret"] = secret
         sauvegarder_json(FICHIER_USERS, users)
     
+    # QR construit ici et non par un worker : le secret TOTP qu'il encode ne doit pas rester
+    # dans taches.db (arguments et résultat y sont conservés plusieurs jours)
     totp_uri = pyotp.totp.TOTP(secret).provisioning_uri(
         name=email,
         issuer_name="Boulangerie Pro"
@@ -180,95 +190,106 @@ def verifier_code_2fa(email, code):
         return totp.verify(code)
     return False
 
-def prediction_ia_prophet(df, produit, jours=7):
-    if df.empty or produit not in df["produit"].unique():
-        return None
-    
-    df_produit = df[df["produit"] == produit].copy()
-    df_produit["date"] = pd.to_datetime(df_produit["date"])
-    
-    df_prophet = pd.DataFrame({
-        'ds': df_produit["date"],
-        'y': df_produit["ventes_moyennes"]
-    })
-    
-    if len(df_prophet) < 10:
-        return None
-    
-    model = Prophet(
-        yearly_seasonality=True,
-        weekly_seasonality=True,
-        daily_seasonality=False
-    )
-    model.fit(df_prophet)
-    
-    future = model.make_future_dataframe(periods=jours)
-    forecast = model.predict(future)
-    
-    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(jours)
+# Tâches de fond : la page soumet, puis un fragment interroge la file chaque seconde et relance
+# le script une fois la tâche finie (plus d'interrogation ensuite)
+@st.fragment(run_every=1)
+def suivi_tache(id_tache):
+    tache = etat_tache(id_tache)
+    if tache is None or tache["statut"] not in ("en_attente", "en_cours"):
+        st.rerun()
+    st.progress(tache["progression"], text=tache["message"] or "En attente d'un worker...")
 
-def prediction_ia_random_forest(df, jour, meteo, produit):
-    if df.empty:
-        return None
-    
-    df_encoded = df.copy()
-    df_encoded['jour_num'] = df_encoded['jour'].map({
-        'Lundi': 0, 'Mardi': 1, 'Mercredi': 2, 'Jeudi': 3,
-        'Vendredi': 4, 'Samedi': 5, 'Dimanche': 6
-    })
-    df_encoded['meteo_num'] = df_encoded['meteo'].map({
-        'Soleil': 0, 'Nuageux': 1, 'Pluie': 2, 'Neige': 3
-    })
-    
-    df_produit = df_encoded[df_encoded['produit'] == produit]
-    
-    if len(df_produit) < 5:
-        return None
-    
-    X = df_produit[['jour_num', 'meteo_num', 'production_habituelle']]
-    y = df_produit['ventes_moyennes']
-    
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X, y)
-    
-    jour_num = {'Lundi': 0, 'Mardi': 1, 'Mercredi': 2, 'Jeudi': 3,
-                'Vendredi': 4, 'Samedi': 5, 'Dimanche': 6}[jour]
-    meteo_num = {'Soleil': 0, 'Nuageux': 1, 'Pluie': 2, 'Neige': 3}[meteo]
-    
-    prod_moy = df_produit['production_habituelle'].mean()
-    prediction = model.predict([[jour_num, meteo_num, prod_moy]])[0]
-    
-    return int(prediction)
+@st.cache_data(max_entries=32, show_spinner=False)
+def resultat_tache_cache(id_tache):
+    return resultat_tache(id_tache)
+
+def attendre_tache(id_tache):
+    # (terminée, résultat) ; affiche la progression ou l'erreur sinon
+    tache = etat_tache(id_tache)
+    if tache is None:
+        return False, None
+    if tache["statut"] == "terminee":
+        return True, resultat_tache_cache(id_tache)
+    if tache["statut"] == "echec":
+        st.error(f"❌ Échec de la tâche : {tache['erreur']}")
+        return False, None
+    suivi_tache(id_tache)
+    return False, None
 
-def get_meteo_automatique(ville="Paris"):
+@st.cache_data(ttl=900, show_spinner=False)
+def get_meteo_automatique(ville=VILLE_DEFAUT):
     try:
-        API_KEY = "votre-cle-openweather"
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={ville}&appid={API_KEY}&lang=fr"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        
-        weather = data['weather'][0]['main']
-        mapping = {
-            'Clear': 'Soleil',
-            'Clouds': 'Nuageux',
-            'Rain': 'Pluie',
-            'Snow': 'Neige'
-        }
-        return mapping.get(weather, 'Nuageux')
+        meteo = meteo_du_jour(ville)
+        return meteo["condition"] if meteo else None
     except:
         return None
 
+def completer_meteo_compte(email):
+    # Température et précipitations de chaque jour de l'historique, dans la table météo locale
+    ville = get_user_info(email).get("ville") or VILLE_DEFAUT
+    try:
+        ajoutes = completer_meteo(ville, charger_historique(get_fichier_histo(email))["date"])
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+    mettre_a_jour_features(get_fichier_histo(email), ville=ville)
+    return ajoutes
+
+COOKIE_SESSION = "boulangerie_session"
+
+def ouvrir_session(email, role):
+    # Jeton dans un cookie (jamais dans l'URL, qui finit dans l'historique et les journaux) : une reconnexion
+    # servie par une autre réplique retrouve la session dans le backend. Écrit au prochain rendu, st.rerun
+    # suivant l'ouverture interromprait le script avant qu'il n'atteigne le navigateur.
+    supprimer_session(st.session_state.get("jeton_session"))
+    st.session_state.jeton_session = creer_session(email, role)
+    st.session_state.cookie_session = (st.session_state.jeton_session, DUREE_SESSION)
+
+def fermer_session():
+    supprimer_session(st.session_state.get("jeton_session"))
+    st.session_state.jeton_session = None
+    st.session_state.cookie_session = ("", 0)
+
+def ecrire_cookie_session():
+    # Cookie posé par JavaScript (Streamlit ne permet pas d'écrire les en-têtes HTTP) : il ne peut donc
+    # pas être HttpOnly et reste lisible par tout script injecté dans la page. SameSite=Strict et Secure
+    # limitent son envoi, pas sa lecture ; la durée de vie de la session borne l'exposition.
+    if st.session_state.get("cookie_session") is None:
+        return
+    jeton, duree = st.session_state.cookie_session
+    st.session_state.cookie_session = None
+    st.html(f"""<script>
+        parent.document.cookie = "{COOKIE_SESSION}={jeton}; Max-Age={duree}; Path=/; SameSite=Strict"
+            + (parent.location.protocol === "https:" ? "; Secure" : "");
+    </script>""", unsafe_allow_javascript=True)
+
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
     st.session_state.user_email = None
     st.session_state.user_role = None
     st.session_state.needs_2fa = False
+    
+    # Anciens liens ?session=... : le jeton ne doit plus rester dans l'adresse
+    st.query_params.pop("session", None)
+    jeton = st.session_state.get("jeton_session") or st.context.cookies.get(COOKIE_SESSION)
+    session = lire_session(jeton)
+    # Une session dont la 2FA n'a pas été validée n'est jamais restaurée
+    if session is not None and session["authentifie"]:
+        st.session_state.jeton_session = jeton
+        st.session_state.authenticated = True
+        st.session_state.user_email = session["email"]
+        st.session_state.user_role = session["role"]
+    elif jeton:
+        if session is not None:
+            supprimer_session(jeton)
+        st.session_state.jeton_session = None
+        st.session_state.cookie_session = ("", 0)
+
+ecrire_cookie_session()
 
 def get_fichier_histo(email=None):
     if email is None:
         email = st.session_state.user_email
-    user_safe = email.replace("@", "_").replace(".", "_")
-    return f"historique_{user_safe}.csv"
+    return pointeur_historique(email)
 
 if not st.session_state.authenticated:
     st.title("🥖 Boulangerie Pro - Solution IA de Gestion")
@@ -294,6 +315,7 @@ if not st.session_state.authenticated:
                         user_info = get_user_info(st.session_state.temp_email)
                         st.session_state.user_role = user_info.get("role", "Employe")
                         st.session_state.needs_2fa = False
+                        ouvrir_session(st.session_state.user_email, st.session_state.user_role)
                         st.rerun()
                     else:
                         st.error("❌ Code 2FA invalide")
@@ -310,6 +332,7 @@ if not st.session_state.authenticated:
                             st.session_state.authenticated = True
                             st.session_state.user_email = email
                             st.session_state.user_role = user_info.get("role", "Employe")
+                            ouvrir_session(email, st.session_state.user_role)
                             st.rerun()
                     else:
                         st.error("❌ Email ou mot de passe incorrect")
@@ -410,6 +433,7 @@ with st.sidebar:
         st.session_state.authenticated = False
         st.session_state.user_email = None
         st.session_state.user_role = None
+        fermer_session()
         st.rerun()
     
     st.divider()
@@ -428,148 +452,209 @@ st.title("🥖 Boulangerie Pro - Solution IA")
 
 FICHIER_HISTO = get_fichier_histo()
 
-if not os.path.exists(FICHIER_HISTO):
-    df_init = pd.DataFrame(columns=[
-        "date", "jour", "meteo", "produit",
-        "production_habituelle", "ventes_moyennes",
-        "production_conseillee", "gaspillage_evite", "cout_gaspillage"
-    ])
-    df_init.to_csv(FICHIER_HISTO, index=False)
+initialiser_historique(FICHIER_HISTO)
 
 PRODUITS_DEFAUT = ["Pain classique", "Baguette", "Croissant", "Pain au chocolat", "Pain complet",
                    "Pain de campagne", "Brioche", "Éclair", "Tarte aux pommes", "Macaron"]
-COUT_UNITAIRE_DEFAUT = {
-    "Pain classique": 0.5, "Baguette": 0.4, "Croissant": 0.6,
-    "Pain au chocolat": 0.7, "Pain complet": 0.6, "Pain de campagne": 0.55,
-    "Brioche": 0.8, "Éclair": 1.2, "Tarte aux pommes": 2.5, "Macaron": 1.5
-}
 
-COEF_JOUR = {
-    "Lundi": 0.8, "Mardi": 0.9, "Mercredi": 1.0, "Jeudi": 1.0,
-    "Vendredi": 1.2, "Samedi": 1.4, "Dimanche": 1.3
-}
+def charger_historique_cache(fichier, version):
+    # Pas de st.cache_data (une copie désérialisée par session) : instantané Arrow mappé, partagé
+    # en lecture seule par les sessions du processus et, via le cache de pages, par les autres workers.
+    # `version` n'est pas lue ici (charger_historique_partage suit lui-même la version de la base) : elle
+    # ne sert que de clé aux fonctions en cache qui l'appellent (figure_cache, suggestion_ia_cache...).
+    return charger_historique_partage(fichier)
+
+def version_fichier(fichier):
+    return version_historique(fichier)
+
+def bornes_periode(periode, premier_jour):
+    aujourd_hui = date.today()
+    if periode in PERIODES_GLISSANTES:
+        return aujourd_hui - timedelta(days=PERIODES_GLISSANTES[periode] - 1), aujourd_hui
+    if periode == "Ce mois":
+        return aujourd_hui.replace(day=1), aujourd_hui
+    if periode == "Cette année":
+        return aujourd_hui.replace(month=1, day=1), aujourd_hui
+    return premier_jour, aujourd_hui
+
+def figure_evolution_gaspillage(df):
+    return px.line(df.sort_values("date"), x="date", y="gaspillage_evite",
+                   title="Gaspillage évité par jour",
+                   labels={"date": "Date", "gaspillage_evite": "Unités évitées"})
+
+def figure_repartition_produits(df):
+    df_produit = df.groupby("produit", observed=True)["gaspillage_evite"].sum().reset_index()
+    return px.pie(df_produit, values="gaspillage_evite", names="produit",
+                  title="Gaspillage évité par produit")
+
+def figure_gaspillage_par_jour(df):
+    df_jour = df.groupby("jour", observed=True)["gaspillage_evite"].mean().reset_index()
+    ordre_jours = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+    df_jour["jour"] = pd.Categorical(df_jour["jour"], categories=ordre_jours, ordered=True)
+    df_jour = df_jour.sort_values("jour")
+    
+    return px.bar(df_jour, x="jour", y="gaspillage_evite",
+                  title="Gaspillage moyen évité par jour",
+                  labels={"jour": "Jour", "gaspillage_evite": "Unités évitées"})
+
+def figure_gaspillage_par_meteo(df):
+    df_meteo = df.groupby("meteo", observed=True)["gaspillage_evite"].mean().reset_index()
+    return px.bar(df_meteo, x="meteo", y="gaspillage_evite",
+                  title="Gaspillage moyen évité par météo",
+                  labels={"meteo": "Météo", "gaspillage_evite": "Unités évitées"})
+
+def figure_evolution_filtree(df_trend):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df_trend["date"], y=df_trend["gaspillage_evite"],
+                            mode='lines+markers', name='Gaspillage évité'))
+    fig.update_layout(title="Évolution", xaxis_title="Date", yaxis_title="Unités")
+    return fig
 
-COEF_METEO = {
-    "Soleil": 1.1, "Nuageux": 1.0, "Pluie": 0.85, "Neige": 0.7
+def figure_ventes_par_jour(df, produit):
+    return px.box(df[df["produit"] == produit], x="jour", y="ventes_moyennes",
+                  title="Distribution des ventes par jour")
+
+def figure_ventes_par_meteo(df, produit):
+    return px.box(df[df["produit"] == produit], x="meteo", y="ventes_moyennes",
+                  title="Distribution des ventes par météo")
+
+CONSTRUCTEURS_FIGURES = {
+    "evolution_gaspillage": figure_evolution_gaspillage,
+    "repartition_produits": figure_repartition_produits,
+    "gaspillage_par_jour": figure_gaspillage_par_jour,
+    "gaspillage_par_meteo": figure_gaspillage_par_meteo,
+    "ventes_par_jour": figure_ventes_par_jour,
+    "ventes_par_meteo": figure_ventes_par_meteo
 }
 
-if menu == "📊 Dashboard":
-    df_histo = pd.read_csv(FICHIER_HISTO)
+# Figure construite et sérialisée une fois par (historique du compte, version, graphique, filtres) :
+# st.plotly_chart est appelé dans la fonction en cache, Streamlit garde le message déjà sérialisé
+# (spec JSON) et le rejoue aux exécutions suivantes, dans le conteneur courant, sans refaire ni la
+# figure ni son JSON. Partagé entre sessions et menus ; voir FIGURES_MAX pour la borne mémoire.
+@st.cache_resource(max_entries=FIGURES_MAX, ttl=FIGURES_TTL, show_spinner=False)
+def figure_cache(fichier, version, graphique, *filtres):
+    figure = CONSTRUCTEURS_FIGURES[graphique](charger_historique_cache(fichier, version), *filtres)
+    st.plotly_chart(figure, use_container_width=True)
+
+def afficher_figure(graphique, *filtres):
+    figure_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO), graphique, *filtres)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def ventes_horaires_cache(fichier, version):
+    # Seules les semaines qui servent aux profils horaires sont lues
+    return charger_ventes_horaires(fichier, depuis=date.today() - timedelta(weeks=SEMAINES_PROFIL + 1))
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def suggestion_ia_cache(fichier, version, jour, meteo, produit, cle, date_cible, version_modele):
+    # Prédiction seule, sans effet de bord : le modèle est lu dans le registre à la version donnée
+    etat = charger_modele(cle, produit, "random_forest", version_modele)
+    if etat is None:
+        return None
+    return predire_random_forest(etat["modele"], charger_historique_cache(fichier, version), jour, meteo, produit,
+                                 cle=cle, date_cible=date_cible)
+
+def suggestion_ia(jour, meteo, produit, date_cible):
+    # Mise à jour du modèle (et écriture du registre) hors du cache ; sa version fait partie de la clé
+    df_histo = charger_historique_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO))
+    cle = st.session_state.user_email
+    if mettre_a_jour_modele_rf(df_histo, produit, cle=cle) is None:
+        return None
+    return suggestion_ia_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO), jour, meteo, produit, cle, date_cible,
+                               version_modele_rf(cle, produit))
+
+# Statistiques sur l'index de sommes cumulées : chaque plage (curseur, comparaison) se lit
+# en O(produits), sans refiltrer l'historique ; le fragment ne relance que cette partie.
+@st.fragment
+def statistiques_periode(index_histo):
+    premier_jour = index_histo["debut"].date()
+    dernier_jour = max((index_histo["debut"] + timedelta(days=index_histo["jours"] - 1)).date(), date.today())
     
-    if not df_histo.empty:
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        periode = st.selectbox(
+            "Période",
+            list(PERIODES_GLISSANTES) + ["Ce mois", "Cette année", "Tout", "Personnalisée"]
+        )
+    
+    with col2:
+        produit_filtre = st.multiselect(
+            "Produits",
+            options=index_histo["produits"],
+            default=index_histo["produits"]
+        )
+    
+    with col3:
+        comparaison = st.selectbox("Comparer à", ["Aucune"] + list(DECALAGES_COMPARAISON))
+    
+    if periode == "Personnalisée":
+        debut, fin = st.slider(
+            "Plage de dates",
+            min_value=premier_jour,
+            max_value=dernier_jour,
+            value=(max(premier_jour, dernier_jour - timedelta(days=29)), dernier_jour),
+            format="DD/MM/YYYY"
+        )
+    else:
+        debut, fin = bornes_periode(periode, premier_jour)
+    
+    if comparaison == "Aucune":
+        actuel, precedent = agreger_periode(index_histo, debut, fin, produit_filtre), None
+    else:
+        actuel, precedent, (debut_avant, fin_avant) = comparer_periodes(index_histo, debut, fin, produit_filtre, comparaison)
+        if precedent["lignes"]:
+            st.caption(f"Comparaison avec la période du {debut_avant:%d/%m/%Y} au {fin_avant:%d/%m/%Y}")
+        else:
+            st.caption(f"Aucune donnée du {debut_avant:%d/%m/%Y} au {fin_avant:%d/%m/%Y} pour comparer")
+            precedent = None
+    
+    def ecart(cle, format_ecart):
+        return None if precedent is None else format_ecart.format(actuel[cle] - precedent[cle])
+    
+    if actuel["lignes"]:
+        st.divider()
+        
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            total_evite = int(df_histo["gaspillage_evite"].sum())
-            st.metric("🥖 Gaspillage évité", f"{total_evite} unités")
+            st.metric("Total évité", f"{int(actuel['gaspillage_evite'])} unités", ecart("gaspillage_evite", "{:+.0f}"))
         
         with col2:
-            total_cout = df_histo["cout_gaspillage"].sum()
-            st.metric("💰 Économies", f"{total_cout:.2f} €")
+            st.metric("Économies", f"{actuel['cout_gaspillage']:.2f} €", ecart("cout_gaspillage", "{:+.2f} €"))
         
         with col3:
-            nb_jours = len(df_histo)
-            st.metric("📅 Jours suivis", nb_jours)
+            st.metric("Ventes", f"{int(actuel['ventes_moyennes'])}", ecart("ventes_moyennes", "{:+.0f}"))
         
         with col4:
-            if nb_jours > 0:
-                moy_jour = total_evite / nb_jours
-                st.metric("📊 Moyenne/jour", f"{moy_jour:.1f} unités")
+            st.metric("Moyenne/jour", f"{actuel['moyenne_gaspillage']:.1f}", ecart("moyenne_gaspillage", "{:+.1f}"))
         
         with col5:
-            predictions_utilisees = len(df_histo)
-            plan_details = PLANS_TARIFS[plan_info["plan"]]
-            max_pred = plan_details["predictions_max"]
-            if max_pred != -1:
-                st.metric("📈 Prédictions", f"{predictions_utilisees}/{max_pred}")
-            else:
-                st.metric("📈 Prédictions", f"{predictions_utilisees}")
-        
-        st.divider()
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("📈 Évolution du gaspillage évité")
-            df_temp = df_histo.copy()
-            df_temp["date"] = pd.to_datetime(df_temp["date"])
-            df_temp = df_temp.sort_values("date")
-            
-            fig = px.line(df_temp, x="date", y="gaspillage_evite",
-                         title="Gaspillage évité par jour",
-                         labels={"date": "Date", "gaspillage_evite": "Unités évitées"})
-            st.plotly_chart(fig, use_container_width=True)
-        
-        with col2:
-            st.subheader("🥖 Répartition par produit")
-            df_produit = df_histo.groupby("produit")["gaspillage_evite"].sum().reset_index()
-            fig = px.pie(df_produit, values="gaspillage_evite", names="produit",
-                        title="Gaspillage évité par produit")
-            st.plotly_chart(fig, use_container_width=True)
-        
-        st.divider()
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("📊 Performance par jour de la semaine")
-            df_jour = df_histo.groupby("jour")["gaspillage_evite"].mean().reset_index()
-            ordre_jours = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
-            df_jour["jour"] = pd.Categorical(df_jour["jour"], categories=ordre_jours, ordered=True)
-            df_jour = df_jour.sort_values("jour")
-            
-            fig = px.bar(df_jour, x="jour", y="gaspillage_evite",
-                        title="Gaspillage moyen évité par jour",
-                        labels={"jour": "Jour", "gaspillage_evite": "Unités évitées"})
-            st.plotly_chart(fig, use_container_width=True)
-        
-        with col2:
-            st.subheader("☁️ Impact météo")
-            df_meteo = df_histo.groupby("meteo")["gaspillage_evite"].mean().reset_index()
-            fig = px.bar(df_meteo, x="meteo", y="gaspillage_evite",
-                        title="Gaspillage moyen évité par météo",
-                        labels={"meteo": "Météo", "gaspillage_evite": "Unités évitées"})
-            st.plotly_chart(fig, use_container_width=True)
+            st.metric("Max en 1 jour", f"{int(actuel['max_gaspillage'])}", ecart("max_gaspillage", "{:+.0f}"))
         
         st.divider()
         
-        st.subheader("🔔 Alertes et recommandations")
+        st.plotly_chart(figure_evolution_filtree(serie_quotidienne(index_histo, debut, fin, produit_filtre)),
+                        use_container_width=True)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            if total_evite > 500:
-                st.success("🎉 Excellent ! Vous avez évité plus de 500 unités de gaspillage !")
-            elif total_evite > 200:
-                st.info("👍 Bon travail ! Continuez ainsi.")
-            else:
-                st.warning("💡 Pensez à utiliser les prédictions quotidiennement.")
+            top_produits = actuel["par_produit"]["gaspillage_evite"].sort_values(ascending=False)
+            st.markdown("#### 🏆 Top produits")
+            st.dataframe(top_produits.head(10), use_container_width=True)
         
         with col2:
-            df_recent = df_histo.tail(7)
-            tendance = df_recent["gaspillage_evite"].mean()
-            if tendance > 10:
-                st.warning(f"⚠️ Gaspillage élevé cette semaine ({tendance:.0f} unités/jour en moyenne)")
-            else:
-                st.success("✅ Production bien optimisée cette semaine")
-        
-        st.divider()
-        st.subheader("📋 Dernières entrées")
-        st.dataframe(df_histo.tail(10).iloc[::-1], use_container_width=True)
-    
+            par_jour = actuel["par_jour"]
+            top_jours = (par_jour["gaspillage_evite"] / par_jour["lignes"]).dropna().sort_values(ascending=False)
+            st.markdown("#### 📅 Meilleurs jours")
+            st.dataframe(top_jours.rename("gaspillage_evite"), use_container_width=True)
     else:
-        st.info("📊 Aucune donnée disponible. Commencez par créer une nouvelle prédiction.")
+        st.warning("Aucune donnée pour les filtres sélectionnés")
 
-elif menu == "📥 Nouvelle prédiction":
-    st.subheader("📥 Nouvelle prédiction de production")
-    
-    peut_predire, message = verifier_limite_plan(st.session_state.user_email, "predictions")
-    
-    if not peut_predire:
-        st.error(message)
-        st.info("💎 Passez à un plan supérieur pour continuer à utiliser les prédictions.")
-        st.stop()
-    
+# Fragments : un changement de widget ne ré-exécute que le formulaire de prédiction,
+# pas la barre latérale ni les lectures de comptes et d'historique du reste du script.
+@st.fragment
+def formulaire_prediction(plan):
     col1, col2 = st.columns(2)
     
     with col1:
@@ -580,8 +665,8 @@ elif menu == "📥 Nouvelle prédiction":
             ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
         )
         
-        meteo_auto = get_meteo_automatique()
-        if meteo_auto and plan_info["plan"] in ["Pro", "Enterprise"]:
+        meteo_auto = get_meteo_automatique(get_user_info(st.session_state.user_email).get("ville") or VILLE_DEFAUT)
+        if meteo_auto and plan in ["Pro", "Enterprise"]:
             st.info(f"☁️ Météo actuelle détectée : {meteo_auto}")
             meteo = st.selectbox(
                 "Conditions météo",
@@ -624,28 +709,40 @@ elif menu == "📥 Nouvelle prédiction":
             step=10
         )
         
-        df_histo = pd.read_csv(FICHIER_HISTO)
-        
-        if plan_info["plan"] in ["Starter", "Pro", "Enterprise"] and len(df_histo) >= 5:
-            st.markdown("#### 🤖 Suggestions IA")
-            
-            suggestion_rf = prediction_ia_random_forest(df_histo, jour, meteo, produit)
-            if suggestion_rf:
-                st.info(f"💡 IA Random Forest : {suggestion_rf} unités")
-        else:
-            if len(df_histo) > 0:
-                df_similaire = df_histo[
-                    (df_histo["produit"] == produit) &
-                    (df_histo["jour"] == jour)
-                ]
-                if not df_similaire.empty:
-                    suggestion = int(df_similaire["ventes_moyennes"].mean())
-                    st.info(f"💡 Historique : {suggestion} unités")
+        panneau_suggestions_ia(plan, jour, meteo, produit)
     
     st.divider()
     
+    panneau_resultats(plan, jour, meteo, produit, cout_unitaire, prod_habituelle, ventes_moy)
+
+@st.fragment
+def panneau_suggestions_ia(plan, jour, meteo, produit):
+    df_histo = charger_historique_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO))
+    
+    if plan in ["Starter", "Pro", "Enterprise"] and len(df_histo) >= 5:
+        st.markdown("#### 🤖 Suggestions IA")
+        
+        # Prochain jour de la semaine choisie : fériés, vacances et retards de ventes en dépendent
+        date_cible = date.today() + timedelta(days=(JOURS_SEMAINE.index(jour) - date.today().weekday()) % 7)
+        suggestion_rf = suggestion_ia(jour, meteo, produit, date_cible)
+        if suggestion_rf:
+            st.info(f"💡 IA Random Forest : {suggestion_rf} unités")
+    else:
+        if len(df_histo) > 0:
+            df_similaire = df_histo[
+                (df_histo["produit"] == produit) &
+                (df_histo["jour"] == jour)
+            ]
+            if not df_similaire.empty:
+                suggestion = int(df_similaire["ventes_moyennes"].mean())
+                st.info(f"💡 Historique : {suggestion} unités")
+
+@st.fragment
+def panneau_resultats(plan, jour, meteo, produit, cout_unitaire, prod_habituelle, ventes_moy):
     if ventes_moy > 0:
-        prod_conseillee = int(ventes_moy * COEF_JOUR[jour] * COEF_METEO[meteo])
+        df_histo = charger_historique_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO))
+        coef_jour, coef_meteo = coefficients_produit(df_histo, produit, cle=st.session_state.user_email)
+        prod_conseillee = int(ventes_moy * coef_jour[jour] * coef_meteo[meteo])
         gaspillage_evite = max(0, prod_habituelle - prod_conseillee)
         cout_gaspillage = gaspillage_evite * cout_unitaire
         
@@ -674,8 +771,6 @@ elif menu == "📥 Nouvelle prédiction":
         st.divider()
         
         if st.button("💾 Enregistrer cette prédiction", type="primary", use_container_width=True):
-            df = pd.read_csv(FICHIER_HISTO)
-            
             nouvelle_ligne = {
                 "date": date.today(),
                 "jour": jour,
@@ -688,15 +783,133 @@ elif menu == "📥 Nouvelle prédiction":
                 "cout_gaspillage": cout_gaspillage
             }
             
-            df = pd.concat([df, pd.DataFrame([nouvelle_ligne])], ignore_index=True)
-            df.to_csv(FICHIER_HISTO, index=False)
+            # Une seule ligne par (date, produit) : un second enregistrement le même jour corrige le premier
+            try:
+                corrections = upsert_historique([nouvelle_ligne], FICHIER_HISTO)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                return
+            mettre_a_jour_features(FICHIER_HISTO)
+            df = charger_historique_partage(FICHIER_HISTO)
+            
+            if plan in ["Starter", "Pro", "Enterprise"]:
+                mettre_a_jour_modele_rf(df, produit, cle=st.session_state.user_email)
+            calibrer_coefficients(df, cle=st.session_state.user_email)
             
-            st.success("✅ Prédiction enregistrée avec succès !")
-            st.balloons()
+            anomalies = lister_anomalies(FICHIER_HISTO, depuis=date.today(), produit=produit)
+            if corrections:
+                st.success("✅ Prédiction du jour corrigée !")
+            else:
+                st.success("✅ Prédiction enregistrée avec succès !")
+                st.balloons()
+            for _, anomalie in anomalies.iterrows():
+                st.warning(f"⚠️ Valeur inhabituelle : {LIBELLES_SERIES[anomalie['serie']]} = {anomalie['valeur']:.0f} "
+                           f"(attendu ≈ {anomalie['attendu']:.0f})")
     
     else:
         st.info("👆 Entrez les ventes moyennes pour obtenir une prédiction.")
 
+if menu == "📊 Dashboard":
+    df_histo = charger_historique_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO))
+    
+    if not df_histo.empty:
+        col1, col2, col3, col4, col5 = st.columns(5)
+        
+        with col1:
+            total_evite = int(df_histo["gaspillage_evite"].sum())
+            st.metric("🥖 Gaspillage évité", f"{total_evite} unités")
+        
+        with col2:
+            total_cout = df_histo["cout_gaspillage"].sum()
+            st.metric("💰 Économies", f"{total_cout:.2f} €")
+        
+        with col3:
+            nb_jours = len(df_histo)
+            st.metric("📅 Jours suivis", nb_jours)
+        
+        with col4:
+            if nb_jours > 0:
+                moy_jour = total_evite / nb_jours
+                st.metric("📊 Moyenne/jour", f"{moy_jour:.1f} unités")
+        
+        with col5:
+            predictions_utilisees = len(df_histo)
+            plan_details = PLANS_TARIFS[plan_info["plan"]]
+            max_pred = plan_details["predictions_max"]
+            if max_pred != -1:
+                st.metric("📈 Prédictions", f"{predictions_utilisees}/{max_pred}")
+            else:
+                st.metric("📈 Prédictions", f"{predictions_utilisees}")
+        
+        st.divider()
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📈 Évolution du gaspillage évité")
+            afficher_figure("evolution_gaspillage")
+        
+        with col2:
+            st.subheader("🥖 Répartition par produit")
+            afficher_figure("repartition_produits")
+        
+        st.divider()
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📊 Performance par jour de la semaine")
+            afficher_figure("gaspillage_par_jour")
+        
+        with col2:
+            st.subheader("☁️ Impact météo")
+            afficher_figure("gaspillage_par_meteo")
+        
+        st.divider()
+        
+        st.subheader("🔔 Alertes et recommandations")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if total_evite > 500:
+                st.success("🎉 Excellent ! Vous avez évité plus de 500 unités de gaspillage !")
+            elif total_evite > 200:
+                st.info("👍 Bon travail ! Continuez ainsi.")
+            else:
+                st.warning("💡 Pensez à utiliser les prédictions quotidiennement.")
+        
+        with col2:
+            anomalies = lister_anomalies(FICHIER_HISTO, depuis=df_histo["date"].max() - timedelta(days=6))
+            if not anomalies.empty:
+                for _, anomalie in anomalies.head(5).iterrows():
+                    st.warning(f"⚠️ {anomalie['date']:%d/%m} - {anomalie['produit']} : "
+                               f"{LIBELLES_SERIES[anomalie['serie']]} {anomalie['valeur']:.0f} "
+                               f"(attendu ≈ {anomalie['attendu']:.0f})")
+                if len(anomalies) > 5:
+                    st.caption(f"+ {len(anomalies) - 5} autre(s) anomalie(s) dans le centre de notifications")
+            else:
+                st.success("✅ Production bien optimisée cette semaine")
+        
+        st.divider()
+        st.subheader("📋 Dernières entrées")
+        st.dataframe(df_histo.tail(10).iloc[::-1], use_container_width=True)
+    
+    else:
+        st.info("📊 Aucune donnée disponible. Commencez par créer une nouvelle prédiction.")
+
+elif menu == "📥 Nouvelle prédiction":
+    st.subheader("📥 Nouvelle prédiction de production")
+    
+    peut_predire, message = verifier_limite_plan(st.session_state.user_email, "predictions")
+    
+    if not peut_predire:
+        st.error(message)
+        st.info("💎 Passez à un plan supérieur pour continuer à utiliser les prédictions.")
+        st.stop()
+    
+    formulaire_prediction(plan_info["plan"])
+
 elif menu == "🤖 IA Avancée" and st.session_state.user_role == "Admin":
     st.subheader("🤖 Prédictions Intelligence Artificielle")
     
@@ -704,67 +917,81 @@ elif menu == "🤖 IA Avancée" and st.session_state.user_role == "Admin":
         st.warning("🔒 Fonctionnalité réservée aux plans Starter et supérieurs")
         st.stop()
     
-    df_histo = pd.read_csv(FICHIER_HISTO)
+    df_histo = charger_historique_partage(FICHIER_HISTO)
     
     if len(df_histo) < 10:
         st.warning("📊 Minimum 10 entrées nécessaires pour l'IA. Continuez à utiliser l'application.")
         st.stop()
     
-    tab1, tab2 = st.tabs(["📈 Prévisions 7 jours (Prophet)", "🌲 Analyse (Random Forest)"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["📈 Prévisions 7 jours", "🌲 Analyse (Random Forest)", "🧪 Backtest",
+                                                        "⚖️ Production optimale", "🎲 Simulation", "⏰ Fournées",
+                                                        "🧺 Familles"])
     
     with tab1:
-        st.markdown("### Prévisions à 7 jours avec Prophet")
+        st.markdown("### Prévisions à 7 jours")
         
         produit_prevision = st.selectbox("Sélectionnez un produit", df_histo["produit"].unique())
+        moteur_prevision = st.radio(
+            "Moteur de prévision",
+            ["Prophet", "NumPy (rapide)"],
+            horizontal=True
+        )
         
         if st.button("🚀 Générer les prévisions", type="primary"):
-            with st.spinner("Calcul en cours avec l'IA..."):
-                forecast = prediction_ia_prophet(df_histo, produit_prevision, jours=7)
+            st.session_state.tache_prevision = (soumettre_tache(
+                "prevision", st.session_state.user_email, version_fichier(FICHIER_HISTO),
+                fichier_histo=FICHIER_HISTO, produit=produit_prevision, jours=7, cle=st.session_state.user_email,
+                moteur="prophet" if moteur_prevision == "Prophet" else "numpy"
+            ), produit_prevision)
+        
+        if "tache_prevision" in st.session_state:
+            id_tache, produit_prevision = st.session_state.tache_prevision
+            terminee, forecast = attendre_tache(id_tache)
+            
+            if terminee and forecast is not None:
+                st.success("✅ Prévisions générées !")
                 
-                if forecast is not None:
-                    st.success("✅ Prévisions générées !")
-                    
-                    forecast['ds'] = pd.to_datetime(forecast['ds'])
-                    forecast_display = forecast.copy()
-                    forecast_display.columns = ['Date', 'Prévision', 'Min', 'Max']
-                    forecast_display['Prévision'] = forecast_display['Prévision'].round(0).astype(int)
-                    forecast_display['Min'] = forecast_display['Min'].round(0).astype(int)
-                    forecast_display['Max'] = forecast_display['Max'].round(0).astype(int)
-                    
-                    st.dataframe(forecast_display, use_container_width=True)
-                    
-                    fig = go.Figure()
-                    fig.add_trace(go.Scatter(
-                        x=forecast['ds'],
-                        y=forecast['yhat'],
-                        mode='lines+markers',
-                        name='Prévision',
-                        line=dict(color='blue', width=2)
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=forecast['ds'],
-                        y=forecast['yhat_upper'],
-                        mode='lines',
-                        name='Max',
-                        line=dict(color='lightblue', width=1, dash='dash')
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=forecast['ds'],
-                        y=forecast['yhat_lower'],
-                        mode='lines',
-                        name='Min',
-                        line=dict(color='lightblue', width=1, dash='dash')
-                    ))
-                    
-                    fig.update_layout(
-                        title=f"Prévisions 7 jours - {produit_prevision}",
-                        xaxis_title="Date",
-                        yaxis_title="Ventes prévues"
-                    )
-                    
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.error("❌ Pas assez de données pour ce produit")
+                forecast['ds'] = pd.to_datetime(forecast['ds'])
+                forecast_display = forecast.copy()
+                forecast_display.columns = ['Date', 'Prévision', 'Min', 'Max']
+                forecast_display['Prévision'] = forecast_display['Prévision'].round(0).astype(int)
+                forecast_display['Min'] = forecast_display['Min'].round(0).astype(int)
+                forecast_display['Max'] = forecast_display['Max'].round(0).astype(int)
+                
+                st.dataframe(forecast_display, use_container_width=True)
+                
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(
+                    x=forecast['ds'],
+                    y=forecast['yhat'],
+                    mode='lines+markers',
+                    name='Prévision',
+                    line=dict(color='blue', width=2)
+                ))
+                fig.add_trace(go.Scatter(
+                    x=forecast['ds'],
+                    y=forecast['yhat_upper'],
+                    mode='lines',
+                    name='Max',
+                    line=dict(color='lightblue', width=1, dash='dash')
+                ))
+                fig.add_trace(go.Scatter(
+                    x=forecast['ds'],
+                    y=forecast['yhat_lower'],
+                    mode='lines',
+                    name='Min',
+                    line=dict(color='lightblue', width=1, dash='dash')
+                ))
+                
+                fig.update_layout(
+                    title=f"Prévisions 7 jours - {produit_prevision}",
+                    xaxis_title="Date",
+                    yaxis_title="Ventes prévues"
+                )
+                
+                st.plotly_chart(fig, use_container_width=True)
+            elif terminee:
+                st.error("❌ Pas assez de données pour ce produit")
     
     with tab2:
         st.markdown("### Analyse et importance des facteurs")
@@ -786,15 +1013,268 @@ elif menu == "🤖 IA Avancée" and st.session_state.user_role == "Admin":
             
             st.divider()
             
-            fig = px.box(df_produit, x="jour", y="ventes_moyennes",
-                        title="Distribution des ventes par jour")
-            st.plotly_chart(fig, use_container_width=True)
-            
-            fig2 = px.box(df_produit, x="meteo", y="ventes_moyennes",
-                         title="Distribution des ventes par météo")
-            st.plotly_chart(fig2, use_container_width=True)
+            afficher_figure("ventes_par_jour", produit_analyse)
+            afficher_figure("ventes_par_meteo", produit_analyse)
         else:
             st.warning("Pas assez de données pour ce produit")
+    
+    with tab3:
+        st.markdown("### Quelle méthode est la meilleure pour votre boulangerie ?")
+        st.caption("Rejoue l'historique semaine par semaine : règle (coefficients), Random Forest, Prophet et moteur NumPy.")
+        
+        if st.button("🧪 Lancer le backtest", type="primary"):
+            st.session_state.tache_backtest = soumettre_tache(
+                "backtest", st.session_state.user_email, version_fichier(FICHIER_HISTO),
+                fichier_histo=FICHIER_HISTO, cle=st.session_state.user_email
+            )
+        
+        if "tache_backtest" in st.session_state:
+            terminee, resultat = attendre_tache(st.session_state.tache_backtest)
+            
+            if terminee:
+                resume, details = resultat
+                if resume.empty:
+                    st.warning("📊 Historique trop court pour un backtest (minimum 5 semaines).")
+                else:
+                    noms_methodes = {"regle": "Règle (coefficients)", "random_forest": "Random Forest",
+                                     "prophet": "Prophet", "numpy": "NumPy"}
+                    meilleure = resume.iloc[0]
+                    st.success(f"🏆 Meilleure méthode : {noms_methodes[meilleure['methode']]} "
+                               f"({meilleure['cout_gaspillage']:.2f} € de gaspillage simulé)")
+                
+                    resume_display = resume.copy()
+                    resume_display["methode"] = resume_display["methode"].map(noms_methodes)
+                    resume_display.columns = ["Méthode", "Plis", "Jours testés", "Gaspillage (€)", "Ruptures (unités)", "MAE"]
+                    st.dataframe(resume_display.round(2), use_container_width=True)
+                
+                    fig = px.line(details, x="origine", y="cout_gaspillage", color="methode",
+                                  title="Gaspillage simulé par pli",
+                                  labels={"origine": "Début du pli", "cout_gaspillage": "Gaspillage (€)"})
+                    st.plotly_chart(fig, use_container_width=True)
+    
+    with tab4:
+        st.markdown("### Combien produire pour minimiser invendus et ventes perdues ?")
+        st.caption("Chaque invendu coûte son prix de revient, chaque rupture la marge perdue : "
+                   "la quantité optimale est le quantile (prix - coût) / prix de la demande prévue.")
+        
+        produits_optim = list(df_histo["produit"].unique())
+        tarifs = pd.DataFrame({
+            "Produit": produits_optim,
+            "Coût unitaire (€)": [COUT_UNITAIRE_DEFAUT.get(p, 0.5) for p in produits_optim],
+            "Prix de vente (€)": [PRIX_VENTE_DEFAUT.get(p, 2 * COUT_UNITAIRE_DEFAUT.get(p, 0.5)) for p in produits_optim]
+        })
+        tarifs = st.data_editor(tarifs, hide_index=True, disabled=["Produit"], use_container_width=True)
+        
+        moteur_optim = st.radio(
+            "Moteur de prévision",
+            ["NumPy (rapide)", "Prophet"],
+            horizontal=True,
+            key="moteur_optim"
+        )
+        
+        if st.button("⚖️ Optimiser la production", type="primary"):
+            with st.spinner("Optimisation en cours..."):
+                previsions = previsions_produits(df_histo, produits_optim, jours=7,
+                                                 cle=st.session_state.user_email,
+                                                 moteur="prophet" if moteur_optim == "Prophet" else "numpy")
+                plan_production = optimiser_production(
+                    previsions,
+                    couts=dict(zip(tarifs["Produit"], tarifs["Coût unitaire (€)"])),
+                    prix=dict(zip(tarifs["Produit"], tarifs["Prix de vente (€)"]))
+                )
+            
+            if plan_production.empty:
+                st.error("❌ Pas assez de données pour prévoir vos produits")
+            else:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Coût attendu (7 jours)", f"{plan_production['cout_attendu'].sum():.2f} €")
+                col2.metric("Invendus attendus", f"{plan_production['invendus_attendus'].sum():.0f} unités")
+                col3.metric("Économie vs prévision seule", f"{plan_production['economie'].sum():.2f} €")
+                
+                plan_production["ds"] = pd.to_datetime(plan_production["ds"]).dt.strftime("%a %d/%m")
+                st.dataframe(
+                    plan_production.pivot(index="produit", columns="ds", values="quantite_optimale"),
+                    use_container_width=True
+                )
+                
+                detail = plan_production.drop(columns="ratio_critique").round(2)
+                detail.columns = ["Produit", "Date", "Prévision", "Quantité optimale", "Invendus attendus",
+                                  "Ventes perdues attendues", "Coût attendu (€)", "Coût si prévision seule (€)",
+                                  "Économie (€)"]
+                with st.expander("Détail par produit et par jour"):
+                    st.dataframe(detail, use_container_width=True)
+    
+    with tab5:
+        st.markdown("### Et si je changeais ma production ?")
+        st.caption("Rejoue des milliers de journées tirées de votre historique (même produit, jour et météo) "
+                   "avec votre production habituelle puis avec la production modifiée.")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            produits_simulation = st.multiselect("Produits", list(df_histo["produit"].unique()),
+                                                 default=list(df_histo["produit"].unique())[:1])
+            jour_simulation = st.selectbox("Jour", ["Tous", "Lundi", "Mardi", "Mercredi", "Jeudi",
+                                                    "Vendredi", "Samedi", "Dimanche"], key="jour_simulation")
+            meteo_simulation = st.selectbox("Météo", ["Toutes", "Soleil", "Nuageux", "Pluie", "Neige"],
+                                            key="meteo_simulation")
+        
+        with col2:
+            ajustement = st.number_input("Variation de production (unités)", min_value=-500, max_value=500,
+                                         value=-20, step=5)
+            nb_scenarios = st.slider("Scénarios simulés", 1000, 50000, 20000, step=1000)
+        
+        if st.button("🎲 Simuler", type="primary") and produits_simulation:
+            plan_actuel = plan_production_actuel(df_histo)
+            plan_actuel = plan_actuel[plan_actuel["produit"].isin(produits_simulation)].reset_index(drop=True)
+            
+            cible = pd.Series(True, index=plan_actuel.index)
+            if jour_simulation != "Tous":
+                cible &= plan_actuel["jour"] == jour_simulation
+            if meteo_simulation != "Toutes":
+                cible &= plan_actuel["meteo"] == meteo_simulation
+            plan_actuel = plan_actuel[cible].reset_index(drop=True)
+            
+            if plan_actuel.empty:
+                st.warning("Aucune journée de ce type dans votre historique.")
+            else:
+                plan_modifie = plan_actuel.assign(production=(plan_actuel["production"] + ajustement).clip(lower=0))
+                
+                with st.spinner("Simulation en cours..."):
+                    resume, details, couts_scenarios = simuler_plans(
+                        df_histo, {"Actuel": plan_actuel, "Modifié": plan_modifie}, scenarios=nb_scenarios
+                    )
+                
+                actuel, modifie = resume.iloc[0], resume.iloc[1]
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("♻️ Gaspillage", f"{modifie['gaspillage']:.0f} unités",
+                            f"{modifie['gaspillage'] - actuel['gaspillage']:+.0f}", delta_color="inverse")
+                col2.metric("💰 Coût du gaspillage", f"{modifie['cout_gaspillage']:.2f} €",
+                            f"{modifie['cout_gaspillage'] - actuel['cout_gaspillage']:+.2f} €", delta_color="inverse")
+                col3.metric("🛒 Ventes perdues", f"{modifie['ventes_perdues']:.0f} unités",
+                            f"{modifie['ventes_perdues'] - actuel['ventes_perdues']:+.0f}", delta_color="inverse")
+                col4.metric("📉 Coût total", f"{modifie['cout_total']:.2f} €",
+                            f"{modifie['cout_total'] - actuel['cout_total']:+.2f} €", delta_color="inverse")
+                
+                st.caption(f"Moyennes sur {nb_scenarios} scénarios, pour une journée de chaque combinaison "
+                           f"produit / jour / météo sélectionnée ({len(plan_actuel)}).")
+                
+                fig = px.histogram(couts_scenarios.melt(var_name="Plan", value_name="Coût total (€)"),
+                                   x="Coût total (€)", color="Plan", barmode="overlay", nbins=60,
+                                   title="Distribution du coût (gaspillage + marge perdue)")
+                st.plotly_chart(fig, use_container_width=True)
+                
+                resume_display = resume.round(2)
+                resume_display.columns = ["Plan", "Production", "Gaspillage", "Coût gaspillage (€)", "Ventes perdues",
+                                          "Marge perdue (€)", "Coût total (€)", "Coût P5 (€)", "Coût P95 (€)",
+                                          "Probabilité de rupture"]
+                st.dataframe(resume_display, use_container_width=True)
+                
+                with st.expander("Détail par produit, jour et météo"):
+                    st.dataframe(details.round(1), use_container_width=True)
+    
+    with tab6:
+        st.markdown("### Combien cuire à chaque fournée ?")
+        st.caption("Profil horaire de chaque produit pour ce jour de la semaine (dernières semaines, les plus récentes "
+                   "pèsent plus). Les invendus d'une fournée servent les suivantes : la dernière fournée absorbe "
+                   "l'incertitude de l'après-midi. Tarifs de l'onglet Production optimale.")
+        
+        horaires = ventes_horaires_cache(FICHIER_HISTO, version_fichier(FICHIER_HISTO))
+        
+        if horaires.empty:
+            st.info("⏰ Aucune vente horaire : importez des tickets horodatés (📄 Rapports → Importer un historique de caisse).")
+        else:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                date_fournees = st.date_input("Jour de production", value=date.today() + timedelta(days=1))
+            
+            with col2:
+                heures_fournees = st.multiselect("Heures des fournées", list(range(24)), default=FOURNEES_DEFAUT,
+                                                 format_func=lambda h: f"{h:02d}h")
+            
+            prevision_heures = prevision_horaire(horaires, date_fournees)
+            
+            if prevision_heures.empty:
+                st.warning(f"Aucune vente horaire un {JOURS_SEMAINE[date_fournees.weekday()].lower()} "
+                           f"ces {SEMAINES_PROFIL} dernières semaines.")
+            elif heures_fournees:
+                fournees = recommander_fournees(
+                    prevision_heures, heures_fournees,
+                    couts=dict(zip(tarifs["Produit"], tarifs["Coût unitaire (€)"])),
+                    prix=dict(zip(tarifs["Produit"], tarifs["Prix de vente (€)"]))
+                )
+                
+                st.dataframe(fournees.pivot(index="produit", columns="fournee", values="quantite"),
+                             use_container_width=True)
+                
+                fig = px.imshow(prevision_heures.pivot(index="produit", columns="heure", values="prevision").round(1),
+                                aspect="auto", color_continuous_scale="Oranges",
+                                labels={"x": "Heure", "y": "Produit", "color": "Ventes prévues"},
+                                title="Ventes prévues par heure")
+                st.plotly_chart(fig, use_container_width=True)
+                
+                with st.expander("Détail par fournée"):
+                    detail = fournees.round(1)
+                    detail.columns = ["Produit", "Fournée", "Heures couvertes", "Ventes prévues", "Quantité à cuire"]
+                    st.dataframe(detail, hide_index=True, use_container_width=True)
+    
+    with tab7:
+        st.markdown("### Prévisions cohérentes par famille")
+        st.caption("Produits, familles (pains, viennoiseries, pâtisseries) et total de la boutique sont prévus "
+                   "séparément puis réconciliés : la somme des produits égale celle des familles et le total, "
+                   "pour planifier farine et beurre sur des chiffres qui se tiennent.")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            moteur_familles = st.radio("Prévision des produits", ["NumPy (rapide)", "Prophet", "Random Forest"],
+                                       horizontal=True, key="moteur_familles")
+        
+        with col2:
+            noms_reconciliation = {"mint": "MinT (erreurs corrélées)", "wls": "Pondérée (structure)",
+                                   "ascendante": "Ascendante (somme des produits)"}
+            methode_familles = st.radio("Réconciliation", METHODES_RECONCILIATION, horizontal=True,
+                                        format_func=noms_reconciliation.get, key="methode_familles")
+        
+        if st.button("🧺 Prévoir par famille", type="primary"):
+            magasin = get_user_info(st.session_state.user_email).get("entreprise") or "Ma boulangerie"
+            with st.spinner("Prévisions et réconciliation..."):
+                st.session_state.previsions_familles = previsions_hierarchiques(
+                    {magasin: df_histo}, jours=7, methode=methode_familles,
+                    moteur={"NumPy (rapide)": "numpy", "Prophet": "prophet", "Random Forest": "random_forest"}[moteur_familles],
+                    cles={magasin: st.session_state.user_email}
+                )
+        
+        if "previsions_familles" in st.session_state:
+            hierarchie = st.session_state.previsions_familles
+            
+            if hierarchie.empty:
+                st.error("❌ Pas assez de données pour prévoir vos produits")
+            else:
+                hierarchie = hierarchie.assign(jour=pd.to_datetime(hierarchie["ds"]).dt.strftime("%a %d/%m"))
+                total = hierarchie[hierarchie["niveau"] == "magasin"]
+                familles = hierarchie[hierarchie["niveau"] == "famille"]
+                produits = hierarchie[hierarchie["niveau"] == "produit"]
+                ecart = (produits.groupby("ds")["base"].sum() - total.set_index("ds")["base"]).abs().sum()
+                
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Total boutique (7 jours)", f"{total['prevision'].sum():.0f} unités")
+                col2.metric("Familles", familles["famille"].nunique())
+                col3.metric("Écart corrigé", f"{ecart:.0f} unités",
+                            help="Différence entre la somme des prévisions produits et la prévision du total, avant réconciliation")
+                
+                fig = px.bar(familles, x="jour", y="prevision", color="famille",
+                             title="Ventes prévues par famille",
+                             labels={"jour": "Jour", "prevision": "Ventes prévues", "famille": "Famille"})
+                st.plotly_chart(fig, use_container_width=True)
+                
+                st.dataframe(familles.pivot(index="famille", columns="jour", values="prevision")
+                             .reindex(columns=familles["jour"].unique()).round(0), use_container_width=True)
+                
+                with st.expander("Détail par produit"):
+                    st.dataframe(produits.pivot(index=["famille", "produit"], columns="jour", values="prevision")
+                                 .reindex(columns=produits["jour"].unique()).round(0), use_container_width=True)
 
 elif menu == "📦 Stocks" and st.session_state.user_role == "Admin":
     st.subheader("📦 Gestion des stocks et ingrédients")
@@ -904,15 +1384,25 @@ elif menu == "🔔 Notifications" and st.session_state.user_role == "Admin":
     with tab1:
         st.info("📧 Les notifications seront envoyées à " + st.session_state.user_email)
         
-        notifications_exemples = [
-            {"date": "2026-01-15", "type": "Alerte", "message": "Stock de farine faible"},
-            {"date": "2026-01-14", "type": "Info", "message": "Résumé hebdomadaire disponible"},
-            {"date": "2026-01-13", "type": "Alerte", "message": "Gaspillage élevé détecté"}
-        ]
+        anomalies = lister_anomalies(FICHIER_HISTO)
         
-        for notif in notifications_exemples:
-            with st.expander(f"{notif['date']} - {notif['type']}: {notif['message']}"):
-                st.write("Détails de la notification...")
+        if anomalies.empty:
+            st.success("✅ Aucune anomalie détectée dans votre historique")
+        else:
+            non_vues = int((anomalies["vue"] == 0).sum())
+            st.caption(f"{len(anomalies)} anomalie(s), dont {non_vues} non lue(s)")
+            
+            for _, anomalie in anomalies.head(50).iterrows():
+                nouveau = "🆕 " if anomalie["vue"] == 0 else ""
+                with st.expander(f"{nouveau}{anomalie['date']:%Y-%m-%d} - Alerte: {anomalie['produit']}, "
+                                 f"{LIBELLES_SERIES[anomalie['serie']].lower()} inhabituel"):
+                    st.write(f"Valeur enregistrée : {anomalie['valeur']:.0f} — attendu ≈ {anomalie['attendu']:.0f} "
+                             f"({anomalie['score']:+.1f} écarts-types)")
+                    st.caption(f"Détectée le {anomalie['detectee_le']}")
+            
+            if non_vues and st.button("✔️ Tout marquer comme lu"):
+                marquer_anomalies_vues(FICHIER_HISTO)
+                st.rerun()
     
     with tab2:
         st.markdown("### Configuration des alertes")
@@ -933,11 +1423,13 @@ elif menu == "🔌 API" and st.session_state.user_role == "Admin":
         st.warning("🔒 API réservée aux plans Pro et Enterprise")
         st.stop()
     
-    api_key = hashlib.sha256(st.session_state.user_email.encode()).hexdigest()[:32]
-    
     st.markdown("### 🔑 Votre clé API")
-    st.code(api_key)
-    st.caption("⚠️ Gardez cette clé secrète !")
+    # Seule l'empreinte de la clé est conservée : elle n'est affichée qu'à sa création
+    if cle_api_existe(st.session_state.user_email):
+        st.caption("Une clé est active. En générer une nouvelle révoque la précédente.")
+    if st.button("🔑 Générer une clé API"):
+        st.code(generer_cle_api(st.session_state.user_email))
+        st.caption("⚠️ Copiez cette clé maintenant : elle ne sera plus affichée. Gardez-la secrète !")
     
     st.divider()
     
@@ -968,6 +1460,18 @@ curl -X POST https://api.boulangerie-pro.com/predictions \\
 curl -X GET https://api.boulangerie-pro.com/stats \\
   -H "Authorization: Bearer YOUR_API_KEY"
         """, language="bash")
+    
+    with st.expander("GET /export - Export en masse pour les outils BI"):
+        st.markdown(f"""
+Jeux : {", ".join(f"`{j}`" for j in JEUX_EXPORT)} — formats : {", ".join(f"`{f}`" for f in FORMATS_EXPORT)}.
+La réponse est diffusée lot par lot ; l'en-tête `X-Boulangerie-Version` donne la version exportée :
+la repasser en `depuis_version` ne transfère que les lignes écrites ou supprimées depuis (`supprimee`).
+        """)
+        st.code("""
+curl -X GET "https://api.boulangerie-pro.com/export?jeu=historique&format=parquet&depuis_version=1234" \\
+  -H "Authorization: Bearer YOUR_API_KEY" -D entetes.txt -o historique.parquet
+        """, language="bash")
+        st.caption(f"Version actuelle de votre historique : {version_historique(get_fichier_histo(st.session_state.user_email))}")
 
 elif menu == "⚙️ Paramètres":
     st.subheader("⚙️ Paramètres")
@@ -987,12 +1491,18 @@ elif menu == "⚙️ Paramètres":
         st.divider()
         
         new_entreprise = st.text_input("Nom de l'entreprise", value=user_info.get('entreprise', ''))
+        new_ville = st.text_input("Ville (météo)", value=user_info.get('ville', VILLE_DEFAUT))
         
         if st.button("💾 Mettre à jour"):
             users = charger_json(FICHIER_USERS)
             users[st.session_state.user_email]["entreprise"] = new_entreprise
+            users[st.session_state.user_email]["ville"] = new_ville.strip() or VILLE_DEFAUT
             sauvegarder_json(FICHIER_USERS, users)
             st.success("✅ Informations mises à jour !")
+            
+            with st.spinner("Récupération de la météo de votre historique..."):
+                if completer_meteo_compte(st.session_state.user_email) is None:
+                    st.warning("⚠️ Météo indisponible pour cette ville, nouvel essai lors de la mise à jour quotidienne.")
     
     with tab2:
         st.markdown("### 🔐 Sécurité")
@@ -1032,10 +1542,13 @@ elif menu == "⚙️ Paramètres":
                 st.rerun()
         else:
             if st.button("🔐 Activer 2FA", type="primary"):
-                qr_bytes, secret = generer_qr_2fa(st.session_state.user_email)
-                
+                st.session_state.qr_2fa = generer_qr_2fa(st.session_state.user_email)
+            
+            if "qr_2fa" in st.session_state:
+                qr_bytes, secret = st.session_state.qr_2fa
                 st.image(qr_bytes, caption="Scannez ce QR code avec Google Authenticator")
-                st.code(secret, label="Ou entrez cette clé manuellement")
+                st.caption("Ou entrez cette clé manuellement")
+                st.code(secret)
                 
                 code_test = st.text_input("Entrez le code à 6 chiffres pour confirmer")
                 
@@ -1044,6 +1557,7 @@ elif menu == "⚙️ Paramètres":
                         users = charger_json(FICHIER_USERS)
                         users[st.session_state.user_email]["2fa_enabled"] = True
                         sauvegarder_json(FICHIER_USERS, users)
+                        del st.session_state.qr_2fa
                         st.success("✅ 2FA activé avec succès !")
                         st.rerun()
                     else:
@@ -1093,101 +1607,76 @@ elif menu == "⚙️ Paramètres":
         
         st.markdown("#### Coefficients de prédiction")
         
+        coefs = calibrer_coefficients(charger_historique(FICHIER_HISTO), cle=st.session_state.user_email)
+        
+        if coefs["calibre"]:
+            st.caption("✅ Coefficients calibrés sur votre historique (valeurs par défaut entre parenthèses)")
+        else:
+            st.caption("ℹ️ Coefficients par défaut : ils seront calibrés dès que votre historique sera suffisant")
+        
         with st.expander("📅 Coefficients par jour"):
-            for jour, coef in COEF_JOUR.items():
-                st.write(f"{jour}: {coef}")
+            for jour, coef in coefs["jour"].items():
+                st.write(f"{jour}: {coef} ({COEF_JOUR[jour]})")
         
         with st.expander("☁️ Coefficients météo"):
-            for meteo, coef in COEF_METEO.items():
-                st.write(f"{meteo}: {coef}")
+            for meteo, coef in coefs["meteo"].items():
+                st.write(f"{meteo}: {coef} ({COEF_METEO[meteo]})")
+        
+        if coefs["produits"]:
+            with st.expander("🥖 Coefficients par produit"):
+                st.dataframe(pd.DataFrame({
+                    produit: {**c["jour"], **c["meteo"]} for produit, c in coefs["produits"].items()
+                }).T, use_container_width=True)
 
 elif menu == "📈 Statistiques":
     st.subheader("📈 Statistiques avancées")
     
-    df_histo = pd.read_csv(FICHIER_HISTO)
+    index_histo = index_historique(FICHIER_HISTO)
     
-    if not df_histo.empty:
-        df_histo["date"] = pd.to_datetime(df_histo["date"])
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            periode = st.selectbox(
-                "Période",
-                ["7 derniers jours", "30 derniers jours", "3 derniers mois", "Tout"]
-            )
-        
-        with col2:
-            produit_filtre = st.multiselect(
-                "Produits",
-                options=df_histo["produit"].unique(),
-                default=df_histo["produit"].unique()
-            )
-        
-        if periode == "7 derniers jours":
-            date_limite = datetime.now() - timedelta(days=7)
-        elif periode == "30 derniers jours":
-            date_limite = datetime.now() - timedelta(days=30)
-        elif periode == "3 derniers mois":
-            date_limite = datetime.now() - timedelta(days=90)
-        else:
-            date_limite = df_histo["date"].min()
-        
-        df_filtre = df_histo[
-            (df_histo["date"] >= date_limite) &
-            (df_histo["produit"].isin(produit_filtre))
-        ]
-        
-        if not df_filtre.empty:
-            st.divider()
-            
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total évité", f"{int(df_filtre['gaspillage_evite'].sum())} unités")
-            
-            with col2:
-                st.metric("Économies", f"{df_filtre['cout_gaspillage'].sum():.2f} €")
-            
-            with col3:
-                st.metric("Moyenne/jour", f"{df_filtre['gaspillage_evite'].mean():.1f}")
-            
-            with col4:
-                st.metric("Max en 1 jour", f"{int(df_filtre['gaspillage_evite'].max())}")
-            
-            st.divider()
-            
-            df_trend = df_filtre.groupby("date").agg({
-                "gaspillage_evite": "sum",
-                "cout_gaspillage": "sum"
-            }).reset_index()
-            
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df_trend["date"], y=df_trend["gaspillage_evite"],
-                                    mode='lines+markers', name='Gaspillage évité'))
-            fig.update_layout(title="Évolution", xaxis_title="Date", yaxis_title="Unités")
-            st.plotly_chart(fig, use_container_width=True)
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                top_produits = df_filtre.groupby("produit")["gaspillage_evite"].sum().sort_values(ascending=False)
-                st.markdown("#### 🏆 Top produits")
-                st.dataframe(top_produits.head(10), use_container_width=True)
-            
-            with col2:
-                top_jours = df_filtre.groupby("jour")["gaspillage_evite"].mean().sort_values(ascending=False)
-                st.markdown("#### 📅 Meilleurs jours")
-                st.dataframe(top_jours, use_container_width=True)
-        else:
-            st.warning("Aucune donnée pour les filtres sélectionnés")
+    if index_histo is not None:
+        statistiques_periode(index_histo)
     else:
         st.info("📊 Aucune donnée disponible")
 
 elif menu == "📄 Rapports":
     st.subheader("📄 Rapports")
     
-    df_histo = pd.read_csv(FICHIER_HISTO)
+    with st.expander("📤 Importer un historique de caisse (CSV / Excel)"):
+        st.caption("Colonnes reconnues : date, produit/article/désignation, quantité/ventes, production (optionnelle), météo (optionnelle), heure (tickets horodatés). "
+                   "Les ventes sont agrégées par jour et par produit ; les jours déjà présents sont ignorés.")
+        
+        fichier_caisse = st.file_uploader("Export de caisse", type=["csv", "xlsx"])
+        horodate = st.checkbox("⏰ Tickets horodatés : garder le détail par heure (fournées)",
+                               help="Heure lue dans une colonne heure ou dans la date (ex. 12/10/2026 07:45). "
+                                    "Les totaux du jour mettent à jour l'historique.")
+        
+        if fichier_caisse is not None and st.button("📤 Importer", type="primary"):
+            barre = st.progress(0.0, text="Import en cours...")
+            try:
+                rapport = (importer_ventes_horaires if horodate else importer_ventes)(
+                    fichier_caisse, FICHIER_HISTO,
+                    progression=lambda lignes: barre.progress(0.5, text=f"{lignes:,} lignes lues".replace(",", " "))
+                )
+            except ValueError as e:
+                barre.empty()
+                st.error(f"❌ {e}")
+            else:
+                barre.progress(1.0, text="Import terminé")
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Lignes lues", f"{rapport['lignes_lues']:,}".replace(",", " "))
+                col2.metric("Jours × produits ajoutés", rapport["lignes_ajoutees"])
+                if horodate:
+                    col3.metric("Jours mis à jour", rapport["jours_mis_a_jour"])
+                else:
+                    col3.metric("Déjà présents", rapport["doublons_ignores"])
+                col4.metric("Lignes rejetées", rapport["lignes_rejetees"])
+                st.caption(f"⏱️ {rapport['duree_s']:.1f} s — {rapport['lignes_par_s']:,.0f} lignes/s".replace(",", " "))
+                
+                if rapport["lignes_ajoutees"]:
+                    with st.spinner("Récupération de la météo des jours importés..."):
+                        completer_meteo_compte(st.session_state.user_email)
+    
+    df_histo = charger_historique_partage(FICHIER_HISTO)
     
     if not df_histo.empty:
         col1, col2 = st.columns(2)
@@ -1195,23 +1684,44 @@ elif menu == "📄 Rapports":
         with col1:
             st.markdown("### 📥 Export PDF")
             if st.button("Générer PDF", use_container_width=True):
-                st.info("📄 Génération PDF disponible")
+                st.session_state.tache_pdf = soumettre_tache(
+                    "export_pdf", st.session_state.user_email, version_fichier(FICHIER_HISTO),
+                    fichier_histo=FICHIER_HISTO, entreprise=user_info.get("entreprise", "Boulangerie")
+                )
+            
+            if "tache_pdf" in st.session_state:
+                terminee, pdf = attendre_tache(st.session_state.tache_pdf)
+                if terminee:
+                    st.download_button(
+                        label="📥 Télécharger PDF",
+                        data=pdf,
+                        file_name=f"rapport_{date.today()}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
         
         with col2:
             st.markdown("### 📊 Export Excel")
             
             if "Excel" in PLANS_TARIFS[plan_info["plan"]]["exports"]:
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_histo.to_excel(writer, sheet_name='Historique', index=False)
+                # Classeur préparé en arrière-plan à la demande (une seule fois par version de l'historique) ;
+                # un échec reste affiché jusqu'au prochain clic au lieu d'être resoumis à chaque rendu
+                if st.button("Générer Excel", use_container_width=True):
+                    st.session_state.tache_excel = soumettre_tache(
+                        "export_excel", st.session_state.user_email, version_fichier(FICHIER_HISTO),
+                        fichier_histo=FICHIER_HISTO
+                    )
                 
-                st.download_button(
-                    label="📥 Télécharger Excel",
-                    data=output.getvalue(),
-                    file_name=f"rapport_{date.today()}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                if "tache_excel" in st.session_state:
+                    terminee, classeur = attendre_tache(st.session_state.tache_excel)
+                    if terminee:
+                        st.download_button(
+                            label="📥 Télécharger Excel",
+                            data=classeur,
+                            file_name=f"rapport_{date.today()}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            use_container_width=True
+                        )
             else:
                 st.warning("🔒 Export Excel réservé aux plans Starter+")
         
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import hashlib
+import sqlite3
+import smtplib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import BytesIO
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+import pandas as pd
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from boulangerie_donnees import charger_historique_partage
+from boulangerie_ia import prediction_ia_prophet, backtester
+
+# File de tâches locale : l'application soumet, un pool de workers exécute, la page interroge.
+# L'état (statut, progression, résultat sérialisé) est dans une base SQLite partagée par les
+# processus : une tâche identique (même type, compte, version des données et paramètres)
+# déjà en cours ou terminée n'est pas relancée.
+FICHIER_TACHES = "taches.db"
+MODE_TACHES_DEFAUT = os.environ.get("BOULANGERIE_TACHES_MODE", "threads")
+TACHES_WORKERS = int(os.environ.get("BOULANGERIE_TACHES_WORKERS", "2"))
+TACHES_DELAI_MAX = 15 * 60
+TACHES_CONSERVEES_JOURS = 7
+STATUTS_ACTIFS = ("en_attente", "en_cours")
+
+SQL_TABLE_TACHES = """
+CREATE TABLE IF NOT EXISTS taches (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    compte TEXT,
+    cle TEXT NOT NULL,
+    statut TEXT NOT NULL,
+    progression REAL DEFAULT 0,
+    message TEXT,
+    resultat BLOB,
+    erreur TEXT,
+    creee_le REAL,
+    maj_le REAL
+)
+"""
+SQL_INDEX_TACHES = "CREATE INDEX IF NOT EXISTS taches_cle ON taches (cle, creee_le)"
+
+def tache_prevision(progression, fichier_histo, produit, jours=7, cle=None, moteur="prophet"):
+    progression(0.1, "Chargement de l'historique")
+    df = charger_historique_partage(fichier_histo)
+    progression(0.3, "Ajustement du modèle")
+    return prediction_ia_prophet(df, produit, jours=jours, cle=cle, moteur=moteur)
+
+def tache_backtest(progression, fichier_histo, cle=None):
+    progression(0.1, "Chargement de l'historique")
+    df = charger_historique_partage(fichier_histo)
+    progression(0.2, "Rejeu des plis")
+    return backtester(df, cle=cle)
+
+def tache_export_excel(progression, fichier_histo):
+    progression(0.2, "Lecture de l'historique")
+    df = charger_historique_partage(fichier_histo)
+    progression(0.5, "Écriture du classeur")
+    sortie = BytesIO()
+    with pd.ExcelWriter(sortie, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name="Historique", index=False)
+    return sortie.getvalue()
+
+def tache_export_pdf(progression, fichier_histo, entreprise="Boulangerie"):
+    progression(0.2, "Lecture de l'historique")
+    df = charger_historique_partage(fichier_histo)
+    par_produit = df.groupby("produit", observed=True).agg(
+        ventes=("ventes_moyennes", "sum"), evite=("gaspillage_evite", "sum"), cout=("cout_gaspillage", "sum")
+    ).sort_values("ventes", ascending=False)
+
+    progression(0.6, "Mise en page")
+    sortie = BytesIO()
+    pdf = canvas.Canvas(sortie, pagesize=letter)
+    hauteur = letter[1]
+    y = hauteur - 60
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(50, y, f"Rapport - {entreprise}")
+    pdf.setFont("Helvetica", 10)
+    y -= 20
+    if not df.empty:
+        pdf.drawString(50, y, f"Du {df['date'].min():%d/%m/%Y} au {df['date'].max():%d/%m/%Y} - "
+                              f"{len(df)} enregistrements - {df['gaspillage_evite'].sum():.0f} unités évitées - "
+                              f"{df['cout_gaspillage'].sum():.2f} € économisés")
+    y -= 30
+    pdf.setFont("Helvetica-Bold", 10)
+    for x, titre in zip((50, 250, 350, 450), ("Produit", "Ventes", "Évité", "Économie (€)")):
+        pdf.drawString(x, y, titre)
+    pdf.setFont("Helvetica", 10)
+    for produit, ligne in par_produit.iterrows():
+        y -= 15
+        if y < 50:
+            pdf.showPage()
+            pdf.setFont("Helvetica", 10)
+            y = hauteur - 60
+        for x, valeur in zip((50, 250, 350, 450), (str(produit), f"{ligne['ventes']:.0f}",
+                                                   f"{ligne['evite']:.0f}", f"{ligne['cout']:.2f}")):
+            pdf.drawString(x, y, valeur)
+    pdf.save()
+    return sortie.getvalue()
+
+def tache_email(progression, destinataire, sujet, contenu):
+    EMAIL_SENDER = "votre-email@gmail.com"
+    EMAIL_PASSWORD = "votre-mot-de-passe-app"
+
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL_SENDER
+    msg["To"] = destinataire
+    msg["Subject"] = sujet
+    msg.attach(MIMEText(contenu, "html"))
+
+    progression(0.3, "Connexion au serveur SMTP")
+    server = smtplib.SMTP("smtp.gmail.com", 587, timeout=30)
+    server.starttls()
+    server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    server.send_message(msg)
+    server.quit()
+    return True
+
+TYPES_TACHES = {
+    "prevision": tache_prevision,
+    "backtest": tache_backtest,
+    "export_excel": tache_export_excel,
+    "export_pdf": tache_export_pdf,
+    "email": tache_email
+}
+
+def _connexion_taches(fichier):
+    con = sqlite3.connect(fichier, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(SQL_TABLE_TACHES)
+    con.execute(SQL_INDEX_TACHES)
+    return con
+
+_pool = None
+
+def _pool_taches():
+    # Threads par défaut ; processus (fork, comme les autres pools) pour les calculs CPU
+    global _pool
+    if _pool is None:
+        if MODE_TACHES_DEFAUT == "processus":
+            _pool = ProcessPoolExecutor(max_workers=TACHES_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        else:
+            _pool = ThreadPoolExecutor(max_workers=TACHES_WORKERS, thread_name_prefix="boulangerie-tache")
+        purger_taches()
+    return _pool
+
+def _executer(id_tache, type_tache, params, fichier):
+    con = _connexion_taches(fichier)
+
+    def progression(fraction, message=""):
+        with con:
+            con.execute("UPDATE taches SET progression = ?, message = ?, maj_le = ? WHERE id = ?",
+                        (float(fraction), message, time.time(), id_tache))
+
+    try:
+        with con:
+            con.execute("UPDATE taches SET statut = 'en_cours', maj_le = ? WHERE id = ?", (time.time(), id_tache))
+        resultat = TYPES_TACHES[type_tache](progression, **params)
+        with con:
+            con.execute(
+                "UPDATE taches SET statut = 'terminee', progression = 1, message = NULL, resultat = ?, maj_le = ? "
+                "WHERE id = ?", (pickle.dumps(resultat), time.time(), id_tache)
+            )
+    except Exception as e:
+        with con:
+            con.execute("UPDATE taches SET statut = 'echec', erreur = ?, maj_le = ? WHERE id = ?",
+                        (f"{type(e).__name__}: {e}", time.time(), id_tache))
+    finally:
+        con.close()
+
+def soumettre_tache(type_tache, compte, version=None, fichier=FICHIER_TACHES, **params):
+    # Identifiant d'une tâche identique encore valable, sinon d'une nouvelle tâche mise en file
+    cle = hashlib.sha256(json.dumps([type_tache, compte, version, params], sort_keys=True, default=str)
+                         .encode()).hexdigest()
+    maintenant = time.time()
+    con = _connexion_taches(fichier)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        existante = con.execute("SELECT id, statut, maj_le FROM taches WHERE cle = ? ORDER BY creee_le DESC LIMIT 1",
+                                (cle,)).fetchone()
+        # Une tâche active sans nouvelles depuis TACHES_DELAI_MAX est perdue (worker arrêté) : relancée
+        if existante and (existante[1] == "terminee"
+                          or (existante[1] in STATUTS_ACTIFS and maintenant - existante[2] < TACHES_DELAI_MAX)):
+            con.rollback()
+            return existante[0]
+
+        id_tache = uuid.uuid4().hex
+        con.execute("INSERT INTO taches (id, type, compte, cle, statut, creee_le, maj_le) "
+                    "VALUES (?, ?, ?, ?, 'en_attente', ?, ?)", (id_tache, type_tache, compte, cle, maintenant, maintenant))
+        con.commit()
+    finally:
+        con.close()
+
+    _pool_taches().submit(_executer, id_tache, type_tache, params, fichier)
+    return id_tache
+
+def etat_tache(id_tache, fichier=FICHIER_TACHES):
+    con = _connexion_taches(fichier)
+    try:
+        ligne = con.execute("SELECT id, type, statut, progression, message, erreur FROM taches WHERE id = ?",
+                            (id_tache,)).fetchone()
+    finally:
+        con.close()
+    if ligne is None:
+        return None
+    return dict(zip(["id", "type", "statut", "progression", "message", "erreur"], ligne))
+
+def resultat_tache(id_tache, fichier=FICHIER_TACHES):
+    con = _connexion_taches(fichier)
+    try:
+        ligne = con.execute("SELECT resultat FROM taches WHERE id = ? AND statut = 'terminee'", (id_tache,)).fetchone()
+    finally:
+        con.close()
+    return pickle.loads(ligne[0]) if ligne else None
+
+def lister_taches(compte=None, fichier=FICHIER_TACHES):
+    con = _connexion_taches(fichier)
+    try:
+        filtre, parametres = ("WHERE compte = ?", [compte]) if compte else ("", [])
+        taches = pd.read_sql_query(
+            f"SELECT id, type, compte, statut, progression, message, erreur, creee_le, maj_le FROM taches {filtre} "
+            "ORDER BY creee_le DESC", con, params=parametres
+        )
+    finally:
+        con.close()
+    taches["duree_s"] = (taches["maj_le"] - taches["creee_le"]).round(2)
+    for colonne in ("creee_le", "maj_le"):
+        taches[colonne] = pd.to_datetime(taches[colonne], unit="s").dt.floor("s")
+    return taches
+
+def purger_taches(jours=TACHES_CONSERVEES_JOURS, fichier=FICHIER_TACHES):
+    con = _connexion_taches(fichier)
+    try:
+        with con:
+            supprimees = con.execute("DELETE FROM taches WHERE creee_le < ? AND statut NOT IN (?, ?)",
+                                     (time.time() - jours * 86400, *STATUTS_ACTIFS)).rowcount
+            # Anciennes tâches qr_2fa : leur résultat encode un secret TOTP, supprimé sans attendre
+            supprimees += con.execute("DELETE FROM taches WHERE type = 'qr_2fa'").rowcount
+    finally:
+        con.close()
+    return supprimees
@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+import pytest
+
+# Météo simulée (pas de réseau) et fichiers de chaque test dans un dossier temporaire
+os.environ.setdefault("BOULANGERIE_METEO_FOURNISSEUR", "simule")
+
+from boulangerie_donnees import JOURS_SEMAINE
+
+
+@pytest.fixture
+def dossier(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def fichier(dossier):
+    return str(dossier / "historique_test_fr.db")
+
+
+def ligne(date="2026-10-01", produit="Baguette", ventes=10, production=12, meteo="Soleil"):
+    return {"date": date, "produit": produit, "jour": JOURS_SEMAINE[pd.Timestamp(date).dayofweek], "meteo": meteo,
+            "production_habituelle": production, "ventes_moyennes": ventes}
@@ -0,0 +1,53 @@
+import pandas as pd
+
+from boulangerie_donnees import (ajouter_historique, lister_anomalies, reconstruire_anomalies, sauvegarder_historique,
+                                 upsert_historique)
+from conftest import ligne
+
+
+def _mois(ventes_pic=None, jours=28):
+    ventes = [50 + j % 3 for j in range(jours)]
+    if ventes_pic is not None:
+        ventes[-1] = ventes_pic
+    return pd.DataFrame([ligne(date=f"2026-09-{j + 1:02d}", ventes=v) for j, v in enumerate(ventes)])
+
+
+def _stats(fichier):
+    import sqlite3
+    with sqlite3.connect(fichier) as con:
+        return con.execute("SELECT n, moyenne FROM stats_anomalies WHERE serie = 'ventes_moyennes'").fetchone()
+
+
+def test_pic_detecte_a_l_ecriture(fichier):
+    ajouter_historique(_mois(ventes_pic=400), fichier)
+    assert lister_anomalies(fichier)["date"].dt.strftime("%Y-%m-%d").tolist() == ["2026-09-28"]
+
+
+def test_lignes_ignorees_hors_statistiques(fichier):
+    ajouter_historique(_mois(), fichier)
+    avant = _stats(fichier)
+
+    # Mêmes clés : INSERT OR IGNORE n'écrit rien, les statistiques ne bougent pas
+    ajouter_historique(_mois(ventes_pic=400), fichier)
+
+    assert _stats(fichier) == avant
+    assert lister_anomalies(fichier).empty
+
+
+def test_remplacement_complet_reconstruit_les_anomalies(fichier):
+    ajouter_historique(_mois(ventes_pic=400), fichier)
+
+    sauvegarder_historique(_mois(), fichier)
+
+    assert lister_anomalies(fichier).empty
+    assert _stats(fichier)[0] == 28
+
+
+def test_reconstruction_equivaut_a_l_ecriture_au_fil_de_l_eau(fichier):
+    for _, jour in _mois(ventes_pic=400).iterrows():
+        upsert_historique([jour.to_dict()], fichier)
+    au_fil = lister_anomalies(fichier)[["date", "serie"]]
+
+    reconstruire_anomalies(fichier)
+
+    pd.testing.assert_frame_equal(lister_anomalies(fichier)[["date", "serie"]], au_fil)
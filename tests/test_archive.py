@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from boulangerie_donnees import (COLONNES_SOMMES, ajouter_historique, charger_historique, compacter_historique,
+                                 importer_ventes, limite_archive, upsert_historique)
+from conftest import ligne
+
+# Six semaines complètes (lundi 07/09/2026 → dimanche 18/10/2026), deux produits
+DATES = pd.date_range("2026-09-07", "2026-10-18")
+
+
+def _historique():
+    return pd.DataFrame([
+        {**ligne(date=f"{d:%Y-%m-%d}", produit=p, ventes=20 + i % 7 + 5 * k, production=30 + i % 5),
+         "production_conseillee": 25, "gaspillage_evite": 3 + i % 4, "cout_gaspillage": 0.75 * (3 + i % 4)}
+        for i, d in enumerate(DATES) for k, p in enumerate(["Baguette", "Croissant"])
+    ])
+
+
+def _semaines(df):
+    semaine = (df["date"] - pd.to_timedelta(df["date"].dt.dayofweek, unit="D")).dt.strftime("%Y-%m-%d")
+    df = df.assign(semaine=semaine, produit=df["produit"].astype(str))
+    return df.groupby(["semaine", "produit"])[COLONNES_SOMMES].sum().astype(float)
+
+
+@pytest.fixture
+def compacte(fichier):
+    ajouter_historique(_historique(), fichier)
+    rapport = compacter_historique(fichier, retention_jours=21, reference="2026-10-19")
+    assert rapport["limite"] == "2026-09-28" and rapport["lignes_archivees"] == 42
+    return fichier
+
+
+def test_superposition_garde_les_totaux_hebdomadaires(compacte):
+    df = charger_historique(compacte)
+    assert len(df) == len(_historique())
+    attendu = _historique().assign(date=lambda d: pd.to_datetime(d["date"]))
+    pd.testing.assert_frame_equal(_semaines(df), _semaines(attendu), check_dtype=False, atol=1e-3)
+
+
+def test_ecriture_dans_une_semaine_archivee_refusee(compacte):
+    assert limite_archive(compacte) == pd.Timestamp("2026-09-28")
+    avant = _semaines(charger_historique(compacte))
+
+    with pytest.raises(ValueError, match="archivées"):
+        upsert_historique([ligne(date="2026-09-16", ventes=500)], compacte)
+    with pytest.raises(ValueError):
+        ajouter_historique(pd.DataFrame([ligne(date="2026-09-27", produit="Pain")]), compacte)
+
+    pd.testing.assert_frame_equal(_semaines(charger_historique(compacte)), avant)
+
+
+def test_correction_apres_la_limite_acceptee(compacte):
+    upsert_historique([ligne(date="2026-09-28", ventes=99)], compacte)
+    df = charger_historique(compacte)
+    assert df[(df["date"] == "2026-09-28") & (df["produit"] == "Baguette")]["ventes_moyennes"].tolist() == [99]
+    assert len(df) == len(_historique())
+
+
+def test_import_rejette_les_jours_archives(compacte, dossier):
+    source = dossier / "caisse.csv"
+    pd.DataFrame({"date": ["2026-09-10", "2026-10-20"], "produit": ["Pain", "Pain"],
+                  "quantite": [5, 7]}).to_csv(source, index=False)
+
+    rapport = importer_ventes(str(source), compacte)
+
+    assert rapport["lignes_rejetees"] == 1 and rapport["lignes_ajoutees"] == 1
@@ -0,0 +1,128 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import boulangerie_etat
+from boulangerie_donnees import ajouter_historique
+from boulangerie_etat import generer_cle_api, verifier_cle_api, sauvegarder_document
+from boulangerie_export import HOTE_EXPORT, compte_cle_api, serveur_export
+from conftest import ligne
+
+
+@pytest.fixture
+def etat_local(dossier, monkeypatch):
+    monkeypatch.setattr(boulangerie_etat, "_etat", boulangerie_etat.EtatFichiers(str(dossier)))
+    return dossier
+
+
+def test_cle_api_aleatoire_et_stockee_hachee(etat_local):
+    cle = generer_cle_api("a@test.fr")
+    autre = generer_cle_api("b@test.fr")
+
+    assert cle != autre
+    assert verifier_cle_api(cle) == "a@test.fr"
+    assert verifier_cle_api(autre) == "b@test.fr"
+    stocke = "".join(p.read_text() for p in (etat_local / "cles_api").iterdir())
+    assert cle.split(".")[1] not in stocke
+
+
+@pytest.mark.parametrize("cle", ["", None, "inconnue", "abc.def", "../users.json.x"])
+def test_cle_api_invalide(etat_local, cle):
+    generer_cle_api("a@test.fr")
+    assert verifier_cle_api(cle) is None
+
+
+def test_nouvelle_cle_revoque_la_precedente(etat_local):
+    ancienne = generer_cle_api("a@test.fr")
+    nouvelle = generer_cle_api("a@test.fr")
+
+    assert verifier_cle_api(ancienne) is None
+    assert verifier_cle_api(nouvelle) == "a@test.fr"
+    identifiant, secret = nouvelle.split(".")
+    assert verifier_cle_api(f"{identifiant}.{secret[:-1]}x") is None
+
+
+def test_compte_cle_api_plan(etat_local):
+    sauvegarder_document("abonnements.json", {"a@test.fr": {"plan": "Pro"}})
+    assert compte_cle_api(generer_cle_api("a@test.fr")) == ("a@test.fr", "Pro")
+    assert compte_cle_api(generer_cle_api("b@test.fr")) == ("b@test.fr", "Gratuit")
+
+
+def _get(serveur, cle):
+    hote, port = serveur.server_address
+    requete = urllib.request.Request(f"http://{hote}:{port}/export?jeu=historique&format=csv",
+                                     headers={"Authorization": f"Bearer {cle}"})
+    try:
+        with urllib.request.urlopen(requete, timeout=30) as reponse:
+            return reponse.status, reponse.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def test_serveur_export_authentification(etat_local):
+    sauvegarder_document("abonnements.json", {"pro@test.fr": {"plan": "Pro"}})
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]),
+                       boulangerie_etat.pointeur_historique("pro@test.fr"))
+    pro, gratuit = generer_cle_api("pro@test.fr"), generer_cle_api("gratuit@test.fr")
+
+    serveur = serveur_export(port=0)
+    assert serveur.server_address[0] == HOTE_EXPORT == "127.0.0.1"
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    try:
+        assert _get(serveur, "mauvaise.cle")[0] == 401
+        assert _get(serveur, gratuit)[0] == 403
+        statut, corps = _get(serveur, pro)
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+    assert statut == 200
+    assert len(corps.strip().splitlines()) == 3
+
+
+def _lire_parquet(chemin):
+    import pyarrow.parquet as pq
+    table = pq.read_table(chemin)
+    return table.to_pandas(), table.schema.metadata
+
+
+def test_export_incremental(fichier, dossier):
+    from boulangerie_donnees import upsert_historique
+    from boulangerie_export import exporter
+    ajouter_historique(pd.DataFrame([ligne(date=f"2026-10-0{j}", produit=p) for j in range(1, 4)
+                                     for p in ("Baguette", "Croissant")]), fichier)
+
+    complet = exporter(fichier, "historique", "parquet", str(dossier / "complet.parquet"))
+    assert complet["complet"] and complet["lignes"] == 6
+
+    upsert_historique([ligne(date="2026-10-02", ventes=30), ligne(date="2026-10-04", produit="Croissant")], fichier)
+    increment = exporter(fichier, "historique", "parquet", str(dossier / "increment.parquet"),
+                         depuis_version=int(complet["version"]))
+    df, meta = _lire_parquet(dossier / "increment.parquet")
+
+    assert not increment["complet"] and meta[b"boulangerie.complet"] == b"false"
+    assert sorted(zip(df["date"].astype(str), df["produit"])) == [("2026-10-02", "Baguette"), ("2026-10-04", "Croissant")]
+    assert df.set_index("produit").loc["Baguette", "ventes_moyennes"] == 30
+
+    rien = exporter(fichier, "historique", "parquet", str(dossier / "rien.parquet"),
+                    depuis_version=int(increment["version"]))
+    assert rien["lignes"] == 0
+
+
+def test_export_cli_etat_par_jeu(fichier, dossier):
+    from boulangerie_cli import main
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]), fichier)
+    etat_export = str(dossier / "etat.json")
+
+    for jeu in ("historique", "semaines"):
+        assert main(["export", "--historique", fichier, "--jeu", jeu, "--etat", etat_export,
+                     "--sortie", str(dossier / f"{jeu}.parquet")]) == 0
+    versions = json.loads(open(etat_export).read())
+    assert set(versions) == {f"{fichier}:historique", f"{fichier}:semaines"}
+
+    # Le second jeu n'a pas hérité de la version du premier : son premier export est complet
+    df, meta = _lire_parquet(dossier / "semaines.parquet")
+    assert meta[b"boulangerie.complet"] == b"true" and len(df) == 2
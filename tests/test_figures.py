@@ -0,0 +1,30 @@
+import pandas as pd
+import plotly.io as pio
+from streamlit.testing.v1 import AppTest
+
+import boulangerie_etat
+from boulangerie_donnees import ajouter_historique
+from boulangerie_etat import creer_session, pointeur_historique, sauvegarder_document
+from conftest import ligne
+
+
+def test_figures_serialisees_une_fois(dossier, monkeypatch, request):
+    monkeypatch.setattr(boulangerie_etat, "_etat", boulangerie_etat.EtatFichiers(str(dossier)))
+    sauvegarder_document("users.json", {"a@test.fr": {"role": "Admin"}})
+    sauvegarder_document("abonnements.json", {"a@test.fr": {"plan": "Pro", "date_debut": "2026-10-01", "actif": True}})
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]), pointeur_historique("a@test.fr"))
+
+    serialisations = []
+    to_json = pio.to_json
+    monkeypatch.setattr(pio, "to_json", lambda *a, **k: serialisations.append(1) or to_json(*a, **k))
+
+    at = AppTest.from_file(str(request.config.rootpath / "boulangerie_predict.py"), default_timeout=120)
+    at.session_state["jeton_session"] = creer_session("a@test.fr", "Admin")
+    at.run()
+    assert not at.exception
+    premiers = len(serialisations)
+    assert len(at.get("plotly_chart")) == 4
+
+    at.run()
+    assert len(at.get("plotly_chart")) == 4
+    assert len(serialisations) == premiers
@@ -0,0 +1,52 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from boulangerie_donnees import ajouter_historique, charger_historique, upsert_historique, version_historique
+from conftest import ligne
+
+
+def test_correction_deux_fois_meme_cle(fichier):
+    ajouter_historique(pd.DataFrame([ligne(ventes=10)]), fichier)
+
+    assert upsert_historique([ligne(ventes=12)], fichier) == 1
+    assert upsert_historique([ligne(ventes=13)], fichier) == 1
+
+    df = charger_historique(fichier)
+    assert len(df) == 1
+    assert df["ventes_moyennes"].iloc[0] == 13
+
+
+def test_correction_note_la_version_de_la_ligne(fichier):
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]), fichier)
+    avant = int(version_historique(fichier))
+
+    upsert_historique([ligne(ventes=20)], fichier)
+
+    with sqlite3.connect(fichier) as con:
+        versions = dict(con.execute("SELECT produit, version FROM historique_modifications").fetchall())
+    assert versions["Baguette"] > avant
+    assert versions["Croissant"] <= avant
+
+
+def test_correction_apres_calcul_des_features(fichier):
+    from boulangerie_features import mettre_a_jour_features
+    ajouter_historique(pd.DataFrame([ligne(ventes=10)]), fichier)
+    mettre_a_jour_features(fichier)
+
+    upsert_historique([ligne(ventes=11)], fichier)
+    upsert_historique([ligne(ventes=12)], fichier)
+
+    assert charger_historique(fichier)["ventes_moyennes"].iloc[0] == 12
+
+
+@pytest.mark.parametrize("extension", ["db", "csv"])
+def test_upsert_insere_puis_corrige(dossier, extension):
+    fichier = str(dossier / f"historique_upsert.{extension}")
+    assert upsert_historique([ligne(), ligne(produit="Croissant")], fichier) == 0
+    assert upsert_historique([ligne(ventes=30), ligne(date="2026-10-02")], fichier) == 1
+
+    df = charger_historique(fichier).set_index(["date", "produit"]).sort_index()
+    assert len(df) == 3
+    assert df.loc[(pd.Timestamp("2026-10-01"), "Baguette"), "ventes_moyennes"] == 30
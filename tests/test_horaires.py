@@ -0,0 +1,50 @@
+import sqlite3
+
+import pandas as pd
+
+from boulangerie_donnees import ajouter_historique, charger_historique, charger_ventes_horaires, importer_ventes_horaires
+from conftest import ligne
+
+
+def _tickets(dossier, lignes, nom="tickets.csv"):
+    chemin = dossier / nom
+    pd.DataFrame(lignes, columns=["date", "produit", "quantite"]).to_csv(chemin, index=False)
+    return str(chemin)
+
+
+def test_import_horaire_nouveaux_jours(fichier, dossier):
+    source = _tickets(dossier, [("2026-10-01 07:10", "Baguette", 3), ("2026-10-01 07:40", "Baguette", 2),
+                                ("2026-10-01 18:05", "Baguette", 4), ("2026-10-01 08:00", "Croissant", 6)])
+    rapport = importer_ventes_horaires(source, fichier)
+
+    assert rapport["profils_horaires"] == 2 and rapport["lignes_ajoutees"] == 2 and rapport["jours_mis_a_jour"] == 0
+    horaires = charger_ventes_horaires(fichier).set_index("produit")
+    assert horaires.loc["Baguette", 7] == 5 and horaires.loc["Baguette", 18] == 4
+    assert charger_historique(fichier).set_index("produit").loc["Baguette", "ventes_moyennes"] == 9
+
+
+def test_import_horaire_recalcule_les_colonnes_derivees(fichier, dossier):
+    # Saisie du jour : 100 produits, 80 vendus, 88 conseillés (coefficient 1,1), 12 évités à 0,5 €
+    ajouter_historique(pd.DataFrame([{**ligne(ventes=80, production=100), "production_conseillee": 88,
+                                      "gaspillage_evite": 12, "cout_gaspillage": 6.0}]), fichier)
+    source = _tickets(dossier, [("2026-10-01 07:00", "Baguette", 40), ("2026-10-01 12:00", "Baguette", 50)])
+
+    rapport = importer_ventes_horaires(source, fichier)
+
+    assert rapport["jours_mis_a_jour"] == 1 and rapport["lignes_ajoutees"] == 0
+    jour = charger_historique(fichier).iloc[0]
+    assert jour["ventes_moyennes"] == 90
+    assert jour["production_conseillee"] == 99
+    assert jour["gaspillage_evite"] == 1
+    assert jour["cout_gaspillage"] == 0.5
+
+
+def test_import_horaire_detecte_les_anomalies_des_corrections(fichier, dossier):
+    ajouter_historique(pd.DataFrame([ligne(date=f"2026-09-{j:02d}", ventes=50 + j % 3) for j in range(1, 29)]), fichier)
+    source = _tickets(dossier, [("2026-09-28 08:00", "Baguette", 400)])
+
+    importer_ventes_horaires(source, fichier)
+
+    with sqlite3.connect(fichier) as con:
+        anomalies = con.execute("SELECT date, serie FROM anomalies").fetchall()
+    assert ("2026-09-28", "ventes_moyennes") in anomalies
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+import boulangerie_ia
+from boulangerie_ia import RF_LOT_MIN, mettre_a_jour_modele_rf
+from conftest import ligne
+
+
+def _jours(n, debut="2026-01-05", ventes=None):
+    dates = pd.date_range(debut, periods=n)
+    return pd.DataFrame([ligne(date=f"{d:%Y-%m-%d}", ventes=ventes or 40 + i % 7 * 3, production=60)
+                         for i, d in enumerate(dates)])
+
+
+@pytest.fixture(autouse=True)
+def modeles(dossier, monkeypatch):
+    monkeypatch.setattr(boulangerie_ia, "_modeles_rf", {})
+
+
+def _etat():
+    return boulangerie_ia._modeles_rf[("a@test.fr", "Baguette")]
+
+
+def test_rf_lot_minimal_avant_mise_a_jour():
+    df = _jours(60)
+    mettre_a_jour_modele_rf(df, "Baguette", cle="a@test.fr")
+    assert _etat()["n_vus"] == 60 and _etat()["maj"] == 0
+
+    plus = pd.concat([df, _jours(RF_LOT_MIN - 1, debut="2026-03-06")], ignore_index=True)
+    mettre_a_jour_modele_rf(plus, "Baguette", cle="a@test.fr")
+    assert _etat()["n_vus"] == 60
+
+    plus = pd.concat([df, _jours(RF_LOT_MIN, debut="2026-03-06")], ignore_index=True)
+    mettre_a_jour_modele_rf(plus, "Baguette", cle="a@test.fr")
+    assert _etat()["n_vus"] == 60 + RF_LOT_MIN and _etat()["maj"] == 1
+    assert _etat()["empreinte"]["derniere_date"] == f"{pd.Timestamp(plus['date'].iloc[-1]):%Y-%m-%d}"
+
+
+def test_rf_somme_controle_cumulee_egale_au_calcul_complet():
+    df = _jours(60 + RF_LOT_MIN)
+    mettre_a_jour_modele_rf(df.iloc[:60], "Baguette", cle="a@test.fr")
+    mettre_a_jour_modele_rf(df, "Baguette", cle="a@test.fr")
+    assert _etat()["maj"] == 1
+    assert _etat()["empreinte"]["somme"] == boulangerie_ia._somme_controle(df)
+
+
+def test_rf_correction_d_une_ligne_apprise_force_le_refit():
+    df = _jours(60)
+    mettre_a_jour_modele_rf(df, "Baguette", cle="a@test.fr")
+    plus = pd.concat([df, _jours(RF_LOT_MIN, debut="2026-03-06")], ignore_index=True)
+    mettre_a_jour_modele_rf(plus, "Baguette", cle="a@test.fr")
+    assert _etat()["maj"] == 1
+
+    corrige = plus.copy()
+    corrige.loc[10, "ventes_moyennes"] += 5
+    mettre_a_jour_modele_rf(corrige, "Baguette", cle="a@test.fr")
+    assert _etat()["maj"] == 0 and _etat()["n_vus"] == len(corrige)
+
+
+def test_rf_prediction_seule_sans_ecriture(dossier):
+    from boulangerie_ia import charger_modele, predire_random_forest, prediction_ia_random_forest, version_modele_rf
+    df = _jours(60)
+    attendu = prediction_ia_random_forest(df, "Lundi", "Soleil", "Baguette", cle="a@test.fr",
+                                          date_cible=pd.Timestamp("2026-03-09"))
+    fichiers = sorted(p.name for p in dossier.rglob("*.joblib"))
+
+    etat = charger_modele("a@test.fr", "Baguette", "random_forest", version_modele_rf("a@test.fr", "Baguette"))
+    assert predire_random_forest(etat["modele"], df, "Lundi", "Soleil", "Baguette", cle="a@test.fr",
+                                 date_cible=pd.Timestamp("2026-03-09")) == attendu
+    assert sorted(p.name for p in dossier.rglob("*.joblib")) == fichiers
+
+
+def test_features_lues_via_pointeur_historique(dossier, monkeypatch):
+    from boulangerie_donnees import ajouter_historique
+    from boulangerie_etat import definir_pointeur_historique
+
+    deplace = str(dossier / "volume" / "historique.db")
+    (dossier / "volume").mkdir()
+    df = _jours(30)
+    ajouter_historique(df, deplace)
+    definir_pointeur_historique("a@test.fr", deplace)
+
+    lus = []
+    lire = boulangerie_ia.features_historique
+    monkeypatch.setattr(boulangerie_ia, "features_historique", lambda f, p: lus.append(f) or lire(f, p))
+    boulangerie_ia.encoder_features_rf(df, cle="a@test.fr")
+
+    assert lus == [deplace]
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from boulangerie_donnees import charger_historique, importer_ventes
+
+
+def _caisse(dossier, contenu, nom="caisse.csv"):
+    chemin = dossier / nom
+    chemin.write_text(contenu, encoding="utf-8")
+    return str(chemin)
+
+
+CAISSE = """Date;Article;Quantité;Production
+01/10/2026;Baguette;3;
+01/10/2026;Baguette;4,0;
+01/10/2026;Croissant;5;12
+2026-10-02;Baguette;8;10
+pas une date;Baguette;1;
+02/10/2026;;2;
+02/10/2026;Croissant;-1;
+"""
+
+
+@pytest.mark.parametrize("taille_lot", [2, 100_000])
+def test_import_agrege_et_rejette(fichier, dossier, taille_lot):
+    rapport = importer_ventes(_caisse(dossier, CAISSE), fichier, taille_lot=taille_lot)
+
+    assert rapport["lignes_lues"] == 7 and rapport["lignes_rejetees"] == 3 and rapport["lignes_ajoutees"] == 3
+    df = charger_historique(fichier).set_index(["date", "produit"])
+    assert df.loc[(pd.Timestamp("2026-10-01"), "Baguette"), "ventes_moyennes"] == 7
+    assert df.loc[(pd.Timestamp("2026-10-01"), "Baguette"), "production_habituelle"] == 7
+    assert df.loc[(pd.Timestamp("2026-10-01"), "Croissant"), "production_habituelle"] == 12
+    assert df.loc[(pd.Timestamp("2026-10-02"), "Baguette"), "jour"] == "Vendredi"
+
+
+def test_reimport_ignore_les_jours_presents(fichier, dossier):
+    importer_ventes(_caisse(dossier, CAISSE), fichier)
+    rapport = importer_ventes(_caisse(dossier, CAISSE + "03/10/2026;Baguette;9;\n", "suite.csv"), fichier)
+
+    assert rapport["doublons_ignores"] == 3 and rapport["lignes_ajoutees"] == 1
+    assert len(charger_historique(fichier)) == 4
+
+
+def test_import_progression(fichier, dossier):
+    vues = []
+    importer_ventes(_caisse(dossier, CAISSE), fichier, taille_lot=3, progression=vues.append)
+    assert vues == [3, 6, 7]
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from boulangerie_donnees import JOURS_SEMAINE, appliquer_schema, historique_synthetique
+from boulangerie_index import (SERIES_INDEX, agreger_periode, comparer_periodes, construire_index, periode_precedente,
+                               serie_quotidienne)
+
+
+@pytest.fixture(scope="module")
+def historique():
+    df = appliquer_schema(historique_synthetique(5_000, produits=6, seed=3))
+    return df.drop_duplicates(["date", "produit"]).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def index(historique):
+    return construire_index(historique)
+
+
+PLAGES = [("2020-01-01", "2020-01-01"), ("2020-02-03", "2020-03-17"), ("2021-06-10", "2023-01-05"),
+          ("2019-06-01", "2020-01-10"), ("2025-05-01", "2026-01-01")]
+
+
+@pytest.mark.parametrize("debut,fin", PLAGES)
+@pytest.mark.parametrize("produits", [None, ["Produit 1", "Produit 4"]])
+def test_sommes_de_plage_egales_a_pandas(historique, index, debut, fin, produits):
+    masque = historique["date"].between(debut, fin)
+    if produits is not None:
+        masque &= historique["produit"].astype(str).isin(produits)
+    attendu = historique[masque]
+
+    resultat = agreger_periode(index, debut, fin, produits)
+
+    for serie in SERIES_INDEX:
+        assert resultat[serie] == pytest.approx(attendu[serie].astype(float).sum(), rel=1e-9, abs=1e-6)
+    assert resultat["lignes"] == len(attendu)
+    maximum = attendu["gaspillage_evite"].max() if len(attendu) else np.nan
+    assert resultat["max_gaspillage"] == pytest.approx(maximum, nan_ok=True)
+    par_jour = attendu.groupby(attendu["date"].dt.dayofweek)["ventes_moyennes"].sum()
+    par_jour.index = np.array(JOURS_SEMAINE)[par_jour.index]
+    for jour, total in par_jour.items():
+        assert resultat["par_jour"].loc[jour, "ventes_moyennes"] == total
+
+
+def test_serie_quotidienne(historique, index):
+    serie = serie_quotidienne(index, "2020-03-01", "2020-03-31")
+    attendu = (historique[historique["date"].between("2020-03-01", "2020-03-31")]
+               .groupby("date")["ventes_moyennes"].sum())
+    np.testing.assert_array_equal(serie.set_index("date")["ventes_moyennes"].to_numpy(), attendu.to_numpy())
+
+
+@pytest.mark.parametrize("comparaison,attendu", [
+    ("Période précédente", ("2026-09-01", "2026-09-30")),
+    ("Mois précédent", ("2026-09-01", "2026-09-30")),
+    ("Année précédente", ("2025-10-01", "2025-10-31")),
+])
+def test_periode_precedente(comparaison, attendu):
+    debut, fin = periode_precedente("2026-10-01", "2026-10-30" if comparaison == "Période précédente" else "2026-10-31",
+                                    comparaison)
+    assert (f"{debut:%Y-%m-%d}", f"{fin:%Y-%m-%d}") == attendu
+
+
+def test_comparer_periodes(index):
+    actuel, precedent, avant = comparer_periodes(index, "2021-03-01", "2021-03-31", comparaison="Année précédente")
+    assert (f"{avant[0]:%Y-%m-%d}", f"{avant[1]:%Y-%m-%d}") == ("2020-03-01", "2020-03-31")
+    assert precedent["lignes"] == agreger_periode(index, *avant)["lignes"]
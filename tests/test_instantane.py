@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+
+from boulangerie_donnees import ajouter_historique, charger_historique_partage, publier_instantane, upsert_historique
+from conftest import ligne
+
+
+def test_instantane_partage_puis_rafraichi(fichier):
+    ajouter_historique(pd.DataFrame([ligne("2026-10-01"), ligne("2026-10-02")]), fichier)
+
+    chemin = publier_instantane(fichier)
+    assert os.path.exists(chemin) and publier_instantane(fichier) == chemin
+
+    premier = charger_historique_partage(fichier)
+    assert charger_historique_partage(fichier) is premier
+    assert len(premier) == 2
+
+    upsert_historique([ligne("2026-10-02", ventes=11)], fichier)
+    second = charger_historique_partage(fichier)
+
+    assert second is not premier
+    assert publier_instantane(fichier) != chemin
+    assert second.set_index("date").loc[pd.Timestamp("2026-10-02"), "ventes_moyennes"] == 11
+    assert premier.set_index("date").loc[pd.Timestamp("2026-10-02"), "ventes_moyennes"] == 10
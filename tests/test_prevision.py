@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import boulangerie_ia
+from boulangerie_donnees import JOURS_SEMAINE, METEOS, appliquer_schema
+from boulangerie_ia import calibrer_coefficients, lissage_saisonnier, previsions_produits
+from conftest import ligne
+
+PROFIL = np.array([40, 42, 45, 50, 70, 90, 60], dtype=float)
+
+
+def _hebdomadaire(jours=84, produits=("Baguette", "Croissant")):
+    dates = pd.date_range("2026-06-01", periods=jours)
+    return appliquer_schema(pd.DataFrame([
+        ligne(date=f"{d:%Y-%m-%d}", produit=p, ventes=int(PROFIL[d.dayofweek] * (1 + k)))
+        for d in dates for k, p in enumerate(produits)
+    ]))
+
+
+def test_lissage_saisonnier_retrouve_un_profil_exact():
+    Y = np.tile(PROFIL, 12)[:, None]
+    niveau, saison, erreurs = lissage_saisonnier(Y)
+    prochaine_semaine = niveau + saison[np.arange(len(Y), len(Y) + 7) % 7]
+    np.testing.assert_allclose(prochaine_semaine[:, 0], PROFIL, atol=1e-6)
+
+
+def test_moteur_numpy_prevision_et_intervalles():
+    previsions = previsions_produits(_hebdomadaire(), jours=7, moteur="numpy")
+    baguette = previsions["Baguette"]
+    assert len(baguette) == 7 and baguette["ds"].iloc[0] == pd.Timestamp("2026-08-24")
+    np.testing.assert_allclose(baguette["yhat"], PROFIL[baguette["ds"].dt.dayofweek], atol=1e-3)
+    assert (baguette["yhat_lower"] <= baguette["yhat"]).all() and (baguette["yhat"] <= baguette["yhat_upper"]).all()
+    np.testing.assert_allclose(previsions["Croissant"]["yhat"], 2 * baguette["yhat"], atol=1e-3)
+
+
+def test_moteur_numpy_historique_trop_court():
+    assert previsions_produits(_hebdomadaire(jours=9), moteur="numpy") == {"Baguette": None, "Croissant": None}
+
+
+def test_calibration_suit_les_ventes(monkeypatch):
+    monkeypatch.setattr(boulangerie_ia, "_calibrations", {})
+    coefs = calibrer_coefficients(_hebdomadaire(), cle="a@test.fr")
+    assert coefs["calibre"]
+    jour = coefs["produits"]["Baguette"]["jour"]
+    assert jour["Samedi"] > jour["Vendredi"] > jour["Lundi"]
+    assert set(coefs["meteo"]) == set(METEOS) and set(jour) == set(JOURS_SEMAINE)
+
+
+def test_calibration_incrementale_egale_au_calcul_complet(monkeypatch):
+    monkeypatch.setattr(boulangerie_ia, "_calibrations", {})
+    df = _hebdomadaire()
+    calibrer_coefficients(df.iloc[:100], cle="a@test.fr")
+    incrementale = calibrer_coefficients(df, cle="a@test.fr")
+    assert incrementale == calibrer_coefficients(df)
+
+
+def test_calibration_refaite_apres_correction(monkeypatch):
+    monkeypatch.setattr(boulangerie_ia, "_calibrations", {})
+    df = _hebdomadaire()
+    calibrer_coefficients(df, cle="a@test.fr")
+
+    corrige = df.copy()
+    corrige.loc[corrige["jour"] == "Lundi", "ventes_moyennes"] *= 3
+    monkeypatch.setattr(boulangerie_ia, "version_donnees", lambda _: pytest.fail("hachage complet"))
+    assert calibrer_coefficients(corrige, cle="a@test.fr") == calibrer_coefficients(corrige)
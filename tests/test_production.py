@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import norm
+
+from boulangerie_ia import Z_INTERVALLE, _cout_attendu, optimiser_production, plan_production_actuel, simuler_plans
+from conftest import ligne
+
+
+def _prevision(moyenne, bas, haut, jours=3):
+    return pd.DataFrame({"ds": pd.date_range("2026-10-20", periods=jours), "yhat": float(moyenne),
+                         "yhat_lower": float(bas), "yhat_upper": float(haut)})
+
+
+def test_quantile_critique_normale_symetrique():
+    resultat = optimiser_production({"Baguette": _prevision(100, 80, 120)}, couts={"Baguette": 0.3},
+                                    prix={"Baguette": 1.2})
+    ratio = 0.9 / 1.2
+    sigma = 20 / Z_INTERVALLE
+    assert resultat["ratio_critique"].iloc[0] == pytest.approx(ratio)
+    assert (resultat["quantite_optimale"] == round(100 + sigma * norm.ppf(ratio))).all()
+    assert (resultat["economie"] >= -1e-9).all()
+
+
+def test_quantite_optimale_minimise_le_cout_attendu():
+    moyenne, sigma_bas, sigma_haut, cout, marge = 60.0, 6.0, 15.0, 0.5, 1.5
+    resultat = optimiser_production({"Croissant": _prevision(moyenne, moyenne - sigma_bas * Z_INTERVALLE,
+                                                              moyenne + sigma_haut * Z_INTERVALLE)},
+                                    couts={"Croissant": cout}, prix={"Croissant": cout + marge})
+    q = resultat["quantite_optimale"].iloc[0]
+    couts = {k: _cout_attendu(np.array(float(k)), moyenne, sigma_bas, sigma_haut, cout, marge)[2]
+             for k in range(q - 3, q + 4)}
+    assert min(couts, key=couts.get) == q
+
+
+def test_cout_attendu_forme_fermee_contre_monte_carlo():
+    rng = np.random.default_rng(0)
+    mode, sigma_bas, sigma_haut, cout, marge, q = 50.0, 5.0, 12.0, 0.4, 1.1, 58.0
+    # Normale asymétrique : une moitié (pondérée) de chaque côté du mode
+    dessous = rng.random(400_000) < sigma_bas / (sigma_bas + sigma_haut)
+    demande = np.where(dessous, mode - np.abs(rng.normal(0, sigma_bas, dessous.size)),
+                       mode + np.abs(rng.normal(0, sigma_haut, dessous.size)))
+    invendus, perdues, total = _cout_attendu(np.array(q), mode, sigma_bas, sigma_haut, cout, marge)
+    assert invendus == pytest.approx(np.maximum(q - demande, 0).mean(), rel=0.02)
+    assert perdues == pytest.approx(np.maximum(demande - q, 0).mean(), rel=0.02)
+
+
+def _historique():
+    rng = np.random.default_rng(1)
+    dates = pd.date_range("2026-06-01", periods=84)
+    return pd.DataFrame([ligne(date=f"{d:%Y-%m-%d}", produit=p, ventes=int(rng.integers(40, 61)), production=55,
+                               meteo="Soleil") for d in dates for p in ("Baguette", "Croissant")])
+
+
+def test_simulation_reproductible_et_ordonnee():
+    from boulangerie_donnees import appliquer_schema
+    df = appliquer_schema(_historique())
+    actuel = plan_production_actuel(df)
+    plans = {"actuel": actuel, "zero": actuel.assign(production=0), "large": actuel.assign(production=200)}
+
+    resume, details, couts = simuler_plans(df, plans, scenarios=2_000, processus=1, graine=7)
+    encore, _, _ = simuler_plans(df, plans, scenarios=2_000, processus=1, graine=7)
+
+    pd.testing.assert_frame_equal(resume, encore)
+    resume = resume.set_index("plan")
+    assert resume.loc["zero", "gaspillage"] == 0 and resume.loc["zero", "proba_rupture"] == 1
+    assert resume.loc["large", "ventes_perdues"] == 0
+    assert resume.loc["actuel", "cout_total"] < min(resume.loc["zero", "cout_total"], resume.loc["large", "cout_total"])
+    assert couts.shape == (2_000, 3)
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import boulangerie_etat
+from boulangerie_donnees import ajouter_historique
+from boulangerie_etat import creer_session, pointeur_historique, sauvegarder_document
+from conftest import ligne
+
+
+@pytest.fixture
+def rapports(dossier, monkeypatch, request):
+    monkeypatch.setattr(boulangerie_etat, "_etat", boulangerie_etat.EtatFichiers(str(dossier)))
+    sauvegarder_document("users.json", {"a@test.fr": {"role": "Admin"}})
+    sauvegarder_document("abonnements.json", {"a@test.fr": {"plan": "Pro", "date_debut": "2026-10-01", "actif": True}})
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]), pointeur_historique("a@test.fr"))
+
+    at = AppTest.from_file(str(request.config.rootpath / "boulangerie_predict.py"), default_timeout=120)
+    at.session_state["jeton_session"] = creer_session("a@test.fr", "Admin")
+    at.run()
+    at.sidebar.radio[0].set_value("📄 Rapports").run()
+    assert not at.exception
+    return at, dossier
+
+
+def _taches(dossier):
+    if not (dossier / "taches.db").exists():
+        return []
+    with sqlite3.connect(dossier / "taches.db") as con:
+        return [t for (t,) in con.execute("SELECT type FROM taches")]
+
+
+def test_excel_non_soumis_a_l_affichage(rapports):
+    at, dossier = rapports
+    at.run()
+    assert "export_excel" not in _taches(dossier)
+
+
+def test_excel_soumis_au_clic(rapports):
+    at, dossier = rapports
+    next(b for b in at.button if b.label == "Générer Excel").click().run()
+    assert _taches(dossier).count("export_excel") == 1
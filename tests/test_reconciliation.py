@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from boulangerie_ia import METHODES_RECONCILIATION, hierarchie_produits, previsions_hierarchiques, reconcilier
+from conftest import ligne
+
+
+def _magasin(produits, graine, jours=70):
+    rng = np.random.default_rng(graine)
+    dates = pd.date_range("2026-07-01", periods=jours)
+    return pd.DataFrame([ligne(date=f"{d:%Y-%m-%d}", produit=p,
+                               ventes=int(30 + 10 * (d.dayofweek >= 5) + rng.integers(0, 8)))
+                         for d in dates for p in produits])
+
+
+def test_matrice_d_agregation():
+    noeuds, S = hierarchie_produits([("A", "Baguette"), ("A", "Croissant"), ("B", "Baguette")])
+    assert noeuds["niveau"].tolist() == ["organisation", "magasin", "magasin", "famille", "famille", "famille",
+                                         "produit", "produit", "produit"]
+    assert S.shape == (9, 3)
+    np.testing.assert_array_equal(S[0], [1, 1, 1])
+    np.testing.assert_array_equal(S[-3:], np.eye(3))
+
+
+@pytest.mark.parametrize("methode", METHODES_RECONCILIATION)
+def test_reconciliation_coherente(methode):
+    _, S = hierarchie_produits([("A", "Baguette"), ("A", "Croissant"), ("B", "Baguette"), ("B", "Éclair")])
+    rng = np.random.default_rng(0)
+    base = rng.uniform(5, 50, (len(S), 3))
+    erreurs = rng.normal(0, 3, (40, len(S)))
+
+    prevision = reconcilier(base, S, methode, erreurs)
+
+    feuilles = prevision[-S.shape[1]:]
+    np.testing.assert_allclose(prevision, S @ feuilles, atol=1e-9)
+    assert (feuilles >= 0).all()
+
+
+@pytest.mark.parametrize("methode", METHODES_RECONCILIATION)
+def test_previsions_hierarchiques_sommes_par_niveau(methode):
+    historiques = {"Centre": _magasin(["Baguette", "Croissant", "Éclair"], 1),
+                   "Gare": _magasin(["Baguette", "Pain au chocolat"], 2)}
+
+    resultat = previsions_hierarchiques(historiques, jours=5, methode=methode)
+
+    assert set(resultat["niveau"]) == {"organisation", "magasin", "famille", "produit"}
+    produits = resultat[resultat["niveau"] == "produit"]
+    for niveau, cles in [("organisation", []), ("magasin", ["magasin"]), ("famille", ["magasin", "famille"])]:
+        attendu = produits.assign(famille=produits["produit"].map(
+            {"Baguette": "Pains", "Croissant": "Viennoiseries", "Pain au chocolat": "Viennoiseries",
+             "Éclair": "Pâtisseries"})).groupby(cles + ["ds"])["prevision"].sum()
+        obtenu = resultat[resultat["niveau"] == niveau].set_index(cles + ["ds"])["prevision"]
+        pd.testing.assert_series_equal(obtenu.sort_index(), attendu.sort_index(), check_names=False, atol=1e-6)
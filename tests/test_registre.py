@@ -0,0 +1,44 @@
+import numpy as np
+
+from boulangerie_ia import VERSIONS_CONSERVEES, charger_modele, enregistrer_modele, lister_modeles, purger_modeles
+
+
+def test_registre_versions_et_mmap(dossier):
+    for version in ["00000010-aa", "00000020-bb", "00000030-cc"]:
+        enregistrer_modele("a@test.fr", "Pain au chocolat", "random_forest", version,
+                           {"version": version, "poids": np.arange(100_000, dtype=float)})
+
+    entrees = lister_modeles("a@test.fr")
+    assert [e["version"] for e in entrees] == ["00000020-bb", "00000030-cc"][-VERSIONS_CONSERVEES:]
+    assert {e["produit"] for e in entrees} == {"Pain au chocolat"}
+
+    etat = charger_modele("a@test.fr", "Pain au chocolat", "random_forest")
+    assert etat["version"] == "00000030-cc"
+    assert isinstance(etat["poids"], np.memmap) and etat["poids"][-1] == 99_999
+    assert charger_modele("a@test.fr", "Pain au chocolat", "random_forest", "00000010-aa") is None
+    assert charger_modele("b@test.fr", "Pain au chocolat", "random_forest") is None
+
+
+def test_purge(dossier):
+    for produit in ["Baguette", "Croissant"]:
+        for version in ["1", "2"]:
+            enregistrer_modele("a@test.fr", produit, "prophet", version, {"version": version})
+
+    supprimes = purger_modeles(garder=1, cle="a@test.fr", produit="Baguette")
+
+    assert [(e["produit"], e["version"]) for e in supprimes] == [("Baguette", "1")]
+    assert [(e["produit"], e["version"]) for e in lister_modeles("a@test.fr")] == [
+        ("Baguette", "2"), ("Croissant", "1"), ("Croissant", "2")]
+
+
+def test_version_plus_petite_reste_la_plus_recente(dossier):
+    for version in ["00000100-ffffffff", "00000100-00000001", "00000100-00000000"]:
+        enregistrer_modele("a@test.fr", "Baguette", "random_forest", version, {"version": version})
+
+    assert [e["version"] for e in lister_modeles("a@test.fr")] == ["00000100-00000001", "00000100-00000000"]
+    assert charger_modele("a@test.fr", "Baguette", "random_forest", "00000100-00000000")["version"] == "00000100-00000000"
+    assert charger_modele("a@test.fr", "Baguette", "random_forest")["version"] == "00000100-00000000"
+
+    # Correction qui réduit le nombre de lignes : la nouvelle version n'est pas purgée
+    enregistrer_modele("a@test.fr", "Baguette", "random_forest", "00000090-12345678", {"version": "00000090-12345678"})
+    assert charger_modele("a@test.fr", "Baguette", "random_forest")["version"] == "00000090-12345678"
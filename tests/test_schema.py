@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from boulangerie_donnees import appliquer_schema, charger_historique, upsert_historique
+from boulangerie_export import exporter
+from conftest import ligne
+
+
+def test_valeurs_absentes_a_zero():
+    df = appliquer_schema(pd.DataFrame([{**ligne(), "ventes_moyennes": None, "production_habituelle": ""}]))
+    assert df["ventes_moyennes"].iloc[0] == 0 and df["production_habituelle"].iloc[0] == 0
+    assert df["gaspillage_evite"].iloc[0] == 0
+
+
+def test_valeurs_mal_formees_refusees():
+    with pytest.raises(ValueError, match="ventes_moyennes = 'douze'"):
+        appliquer_schema(pd.DataFrame([ligne(), {**ligne(produit="Croissant"), "ventes_moyennes": "douze"}]))
+
+
+def test_ecriture_mal_formee_refusee_sans_rien_ecrire(fichier):
+    upsert_historique([ligne(ventes=10)], fichier)
+    with pytest.raises(ValueError):
+        upsert_historique([{**ligne(), "ventes_moyennes": "n/a"}], fichier)
+    assert charger_historique(fichier)["ventes_moyennes"].tolist() == [10]
+
+
+def test_cout_gaspillage_en_float64(fichier, dossier):
+    cout = 1234567.89
+    upsert_historique([{**ligne(), "gaspillage_evite": 3, "cout_gaspillage": cout}], fichier)
+
+    df = charger_historique(fichier)
+    assert df["cout_gaspillage"].dtype == np.float64 and df["cout_gaspillage"].iloc[0] == cout
+
+    exporter(fichier, "historique", "parquet", str(dossier / "h.parquet"))
+    table = pq.read_table(dossier / "h.parquet")
+    assert str(table.schema.field("cout_gaspillage").type) == "double"
+    assert table.column("cout_gaspillage")[0].as_py() == cout
@@ -0,0 +1,41 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import boulangerie_etat
+from boulangerie_etat import creer_session, lire_session, sauvegarder_document
+
+APPLICATION = "boulangerie_predict.py"
+
+
+@pytest.fixture
+def application(dossier, monkeypatch, request):
+    monkeypatch.setattr(boulangerie_etat, "_etat", boulangerie_etat.EtatFichiers(str(dossier)))
+    sauvegarder_document("users.json", {"a@test.fr": {"role": "Admin"}})
+    return str(request.config.rootpath / APPLICATION)
+
+
+def _restaurer(application, jeton):
+    at = AppTest.from_file(application, default_timeout=120)
+    at.session_state["jeton_session"] = jeton
+    return at.run()
+
+
+def test_session_authentifiee_restauree(application):
+    at = _restaurer(application, creer_session("a@test.fr", "Admin"))
+    assert not at.exception
+    assert at.session_state["authenticated"] and at.session_state["user_email"] == "a@test.fr"
+
+
+def test_session_2fa_incomplete_refusee(application):
+    jeton = creer_session("a@test.fr", "Admin", authentifie=False)
+    at = _restaurer(application, jeton)
+    assert not at.session_state["authenticated"]
+    assert lire_session(jeton) is None
+
+
+def test_jeton_jamais_dans_l_url(application):
+    at = AppTest.from_file(application, default_timeout=120)
+    at.query_params["session"] = creer_session("a@test.fr", "Admin")
+    at.run()
+    assert "session" not in at.query_params
+    assert not at.session_state["authenticated"]
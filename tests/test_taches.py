@@ -0,0 +1,71 @@
+import time
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import boulangerie_taches
+from boulangerie_donnees import ajouter_historique
+from boulangerie_taches import etat_tache, resultat_tache, soumettre_tache
+from conftest import ligne
+
+
+def _attendre(id_tache, fichier, delai=60):
+    fin = time.time() + delai
+    while time.time() < fin:
+        tache = etat_tache(id_tache, fichier)
+        if tache["statut"] not in boulangerie_taches.STATUTS_ACTIFS:
+            return tache
+        time.sleep(0.05)
+    pytest.fail("tâche toujours active")
+
+
+def test_export_excel_en_tache_de_fond(fichier, dossier):
+    ajouter_historique(pd.DataFrame([ligne(), ligne(produit="Croissant")]), fichier)
+    file_taches = str(dossier / "taches.db")
+
+    id_tache = soumettre_tache("export_excel", "a@test.fr", "v1", fichier=file_taches, fichier_histo=fichier)
+
+    assert _attendre(id_tache, file_taches)["statut"] == "terminee"
+    assert resultat_tache(id_tache, file_taches)[:2] == b"PK"
+    # Même type, compte, version et paramètres : la tâche terminée est réutilisée
+    assert soumettre_tache("export_excel", "a@test.fr", "v1", fichier=file_taches, fichier_histo=fichier) == id_tache
+    assert soumettre_tache("export_excel", "a@test.fr", "v2", fichier=file_taches, fichier_histo=fichier) != id_tache
+
+
+def test_echec_rapporte_puis_relance_a_la_demande(dossier, monkeypatch):
+    def tache_en_echec(progression):
+        progression(0.5, "À mi-chemin")
+        raise RuntimeError("panne")
+
+    monkeypatch.setitem(boulangerie_taches.TYPES_TACHES, "test_echec", tache_en_echec)
+    file_taches = str(dossier / "taches.db")
+
+    id_tache = soumettre_tache("test_echec", "a@test.fr", fichier=file_taches)
+    tache = _attendre(id_tache, file_taches)
+
+    assert tache["statut"] == "echec" and tache["erreur"] == "RuntimeError: panne"
+    assert resultat_tache(id_tache, file_taches) is None
+    assert soumettre_tache("test_echec", "a@test.fr", fichier=file_taches) != id_tache
+
+
+def test_anciens_qr_2fa_purges(dossier):
+    file_taches = str(dossier / "taches.db")
+    boulangerie_taches._connexion_taches(file_taches).close()
+    with sqlite3.connect(file_taches) as con:
+        con.execute("INSERT INTO taches (id, type, compte, cle, statut, resultat, creee_le, maj_le) "
+                    "VALUES ('x', 'qr_2fa', 'a@test.fr', 'c', 'terminee', x'89504e47', ?, ?)", (time.time(), time.time()))
+
+    assert boulangerie_taches.purger_taches(fichier=file_taches) == 1
+    assert "qr_2fa" not in boulangerie_taches.TYPES_TACHES
+
+
+def test_backtest_en_tache_de_fond(fichier, dossier):
+    ajouter_historique(pd.DataFrame([ligne(date=f"2026-10-{j:02d}") for j in range(1, 11)]), fichier)
+    file_taches = str(dossier / "taches.db")
+
+    id_tache = soumettre_tache("backtest", "a@test.fr", "v1", fichier=file_taches, fichier_histo=fichier, cle="a@test.fr")
+
+    assert _attendre(id_tache, file_taches)["statut"] == "terminee"
+    resume, details = resultat_tache(id_tache, file_taches)
+    assert resume.empty and details.empty